@@ -0,0 +1,287 @@
+"""
+Sound effects
+
+Every effect is decoded once, when the game starts, and played on a fixed
+pool of voices. Each effect has a cap on how many of its voices may play at
+once. Past the cap a new play either takes over the oldest voice of that
+effect or is dropped, so holding fire or sweeping a row of rubies costs a
+few voices instead of dozens.
+
+The backend does the playing. SoloudBackend uses the SoLoud engine that
+arcade.Sound plays through; NullBackend plays nothing but times voices
+the same way, so the mixer can run and be measured without a sound card:
+
+    python audio.py
+"""
+import argparse
+import random
+import time
+import wave
+
+import pyglet
+
+# The benchmark from the command line never opens a window
+if __name__ == "__main__":
+    pyglet.options["shadow_window"] = False
+
+from arcade import sound as arcade_sound
+
+# What to do with a play past an effect's cap
+STEAL_OLDEST = "steal_oldest"
+DROP = "drop"
+
+# Voices shared by every effect
+VOICE_COUNT = 16
+
+# name -> (file, most voices at once, policy past that)
+EFFECTS = {
+    "laser": ("sounds/laser.wav", 4, STEAL_OLDEST),
+    "coin": ("sounds/coin.wav", 3, STEAL_OLDEST),
+    "jump": ("sounds/jump.wav", 1, STEAL_OLDEST),
+    "level": ("sounds/level.wav", 1, DROP),
+}
+
+
+class SoloudBackend:
+    """
+    Plays sounds through the SoLoud engine arcade starts on import.
+    """
+
+    def __init__(self):
+        # arcade keeps its engine to itself, and leaves it None if SoLoud
+        # could not start
+        self.engine = arcade_sound._audiolib
+        if self.engine is None:
+            raise RuntimeError("SoLoud is not available")
+
+    def load(self, filename):
+        """
+        Decode a sound file into memory, and return it with its length in
+        seconds.
+        """
+        buffer = arcade_sound.soloud.Wav()
+        buffer.load(filename)
+        return buffer, buffer.get_length()
+
+    def play(self, buffer, volume):
+        return self.engine.play(buffer, aVolume=volume, aPan=0.0, aPaused=0, aBus=0)
+
+    def stop(self, handle):
+        self.engine.stop(handle)
+
+    def is_playing(self, handle):
+        return bool(self.engine.is_valid_voice_handle(handle))
+
+
+class NullBackend:
+    """
+    Plays nothing. Sounds are still read in full, and a voice counts as
+    playing until its sound's length has passed on the clock.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        # handle -> time the voice ends
+        self._ends = {}
+        self._next_handle = 1
+
+    def load(self, filename):
+        with wave.open(filename, "rb") as f:
+            frames = f.readframes(f.getnframes())
+            length = f.getnframes() / f.getframerate()
+        return (frames, length), length
+
+    def play(self, buffer, volume):
+        handle = self._next_handle
+        self._next_handle += 1
+        self._ends[handle] = self.clock() + buffer[1]
+        return handle
+
+    def stop(self, handle):
+        self._ends.pop(handle, None)
+
+    def is_playing(self, handle):
+        end = self._ends.get(handle)
+        if end is None:
+            return False
+        if self.clock() >= end:
+            del self._ends[handle]
+            return False
+        return True
+
+
+def default_backend():
+    """
+    Return a SoloudBackend if arcade could start SoLoud, or a NullBackend.
+    """
+    try:
+        return SoloudBackend()
+    except RuntimeError:
+        return NullBackend()
+
+
+class Effect:
+    def __init__(self, name, buffer, length, cap, policy):
+        self.name = name
+        self.buffer = buffer
+        self.length = length
+        self.cap = cap
+        self.policy = policy
+
+
+class Voice:
+    """
+    One slot of the pool: the effect it is playing, if any, the backend's
+    handle for it, and when it started.
+    """
+
+    __slots__ = ("effect", "handle", "started")
+
+    def __init__(self):
+        self.effect = None
+        self.handle = None
+        self.started = 0
+
+
+class SoundManager:
+    """
+    Plays effects by name on a fixed pool of voices, and counts what it
+    played, what it had to stop early and what it dropped.
+    """
+
+    def __init__(self, backend=None, voices=VOICE_COUNT):
+        self.backend = backend
+        self.voices = [Voice() for _ in range(voices)]
+        self.effects = {}
+        # Plays so far, for picking the oldest voice
+        self._plays = 0
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.played = 0
+        self.stolen = 0
+        self.dropped = 0
+
+    def load(self, name, filename, cap, policy=STEAL_OLDEST):
+        buffer, length = self.backend.load(filename)
+        self.effects[name] = Effect(name, buffer, length, cap, policy)
+
+    def preload(self, backend=None, names=None):
+        """
+        Decode the effects in names, or every effect in EFFECTS, that aren't
+        loaded yet. The backend is picked the first time: the one given, or
+        default_backend().
+        """
+        if self.backend is None:
+            self.backend = backend if backend is not None else default_backend()
+        for name in EFFECTS if names is None else names:
+            if name not in self.effects:
+                self.load(name, *EFFECTS[name])
+
+    def playing(self, name=None):
+        """
+        Return how many voices are playing, or playing one effect.
+        """
+        self._reap()
+        return sum(
+            voice.effect is not None and (name is None or voice.effect.name == name)
+            for voice in self.voices
+        )
+
+    def stop(self, name):
+        """
+        Stop every voice playing an effect.
+        """
+        for voice in self.voices:
+            if voice.effect is not None and voice.effect.name == name:
+                self.backend.stop(voice.handle)
+                voice.effect = None
+
+    def _reap(self):
+        for voice in self.voices:
+            if voice.effect is not None and not self.backend.is_playing(voice.handle):
+                voice.effect = None
+
+    def play(self, name, volume=1.0):
+        """
+        Play an effect. Returns the voice it is playing on, or None if it
+        was dropped.
+        """
+        effect = self.effects[name]
+        self._reap()
+
+        free = None
+        oldest = None
+        oldest_same = None
+        same = 0
+        for voice in self.voices:
+            if voice.effect is None:
+                if free is None:
+                    free = voice
+                continue
+            if oldest is None or voice.started < oldest.started:
+                oldest = voice
+            if voice.effect is effect:
+                same += 1
+                if oldest_same is None or voice.started < oldest_same.started:
+                    oldest_same = voice
+
+        if same >= effect.cap:
+            if effect.policy == DROP:
+                self.dropped += 1
+                return None
+            voice = oldest_same
+        elif free is not None:
+            voice = free
+        else:
+            # Every voice is busy, so the oldest sound gives way
+            voice = oldest
+
+        if voice.effect is not None:
+            self.backend.stop(voice.handle)
+            self.stolen += 1
+        voice.effect = effect
+        voice.handle = self.backend.play(effect.buffer, volume)
+        voice.started = self._plays
+        self._plays += 1
+        self.played += 1
+        return voice
+
+
+sounds = SoundManager()
+
+
+def _benchmark(plays=100000, burst=20, seed=1):
+    """
+    Play bursts of random effects on the null backend as fast as possible,
+    and report the time per play and how the caps held.
+    """
+    rng = random.Random(seed)
+    manager = SoundManager()
+    manager.preload(NullBackend())
+    names = list(EFFECTS)
+
+    most_voices = 0
+    start = time.perf_counter()
+    for i in range(plays):
+        manager.play(rng.choice(names))
+        if i % burst == burst - 1:
+            most_voices = max(most_voices, manager.playing())
+    elapsed = time.perf_counter() - start
+
+    print(f"{plays} plays, {elapsed / plays * 1e6:.2f} us per play")
+    print(
+        f"{manager.stolen} cut short, {manager.dropped} dropped, "
+        f"at most {most_voices} of {len(manager.voices)} voices playing"
+    )
+    for name in names:
+        effect = manager.effects[name]
+        print(f"  {name:<8}cap {effect.cap} ({effect.policy}), {effect.length:.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the sound mixer")
+    parser.add_argument("--plays", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    _benchmark(args.plays, seed=args.seed)
@@ -0,0 +1,412 @@
+#!/usr/bin/env python
+
+"""
+Batch runner
+
+Plays many headless games at once, one per process, for balancing levels
+and catching regressions without playing by hand. Every combination of
+map, player and seed is one run. A map is a level number or a .tmx file,
+and a player is either an input script or one of the simple bots in BOTS:
+
+    python batch.py --maps 1 2 3 --bots turret hunter --runs 20 --seed 1
+    python batch.py --maps maps/map_level_4.tmx --scripts inputs.txt
+
+Each run reports how it went (the frame the level was cleared on, score,
+deaths, spiders killed, bullets fired) and how fast it went (mean and
+slowest step). The runs are summed up by map and player in one report,
+which can also be saved as JSON along with every run.
+
+Runs share nothing, so with one process per core the throughput grows
+almost in step with the number of cores.
+"""
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import platform
+import time
+
+import pyglet
+
+# There is no display to create the GL shadow window on
+pyglet.options["shadow_window"] = False
+
+import arcade
+import numpy as np
+
+import headless
+import run_game
+import textures
+
+DEFAULT_FRAMES = 3600
+DEFAULT_LIVES = 1
+DEFAULT_SEED = 1
+# Steps between a bot's shots
+FIRE_EVERY = 15
+# Steps a hunter pushes against something before it jumps
+STUCK_STEPS = 10
+
+
+class Bot:
+    """
+    A player that acts on what it can see of the game, through the same
+    key and mouse handlers as a person would. The base bot stands still.
+    """
+
+    name = "idle"
+
+    def __init__(self):
+        self.steps = 0
+
+    def act(self, game):
+        self.steps += 1
+
+    def nearest_spider(self, game):
+        """
+        Return the (x, y) of the moving spider nearest the player, or None.
+        """
+        spiders = game.spider_swarm
+        active = spiders.active()
+        if not len(active):
+            return None
+        x = spiders.x[active] - game.player_sprite.center_x
+        y = spiders.y[active] - game.player_sprite.center_y
+        nearest = active[np.argmin(x * x + y * y)]
+        return spiders.x[nearest], spiders.y[nearest]
+
+    def shoot(self, game, x, y):
+        """
+        Click on a point in the world.
+        """
+        camera = game.camera
+        game.on_mouse_press(x - camera.left, y - camera.bottom, arcade.MOUSE_BUTTON_LEFT, 0)
+
+
+class TurretBot(Bot):
+    """
+    Stands still and shoots at the nearest spider.
+    """
+
+    name = "turret"
+
+    def act(self, game):
+        super().act(game)
+        if self.steps % FIRE_EVERY:
+            return
+        target = self.nearest_spider(game)
+        if target is not None:
+            self.shoot(game, *target)
+
+
+class HunterBot(TurretBot):
+    """
+    Shoots like a turret, and walks toward the nearest ruby (or spider,
+    once the rubies are gone), jumping when it stops moving.
+    """
+
+    name = "hunter"
+
+    def __init__(self):
+        super().__init__()
+        self.key = None
+        self.jumping = False
+        self.last_x = None
+        self.stuck = 0
+
+    def press(self, game, key):
+        if key == self.key:
+            return
+        if self.key is not None:
+            game.on_key_release(self.key, 0)
+        if key is not None:
+            game.on_key_press(key, 0)
+        self.key = key
+
+    def target(self, game):
+        player = game.player_sprite
+        coins = game.coin_list
+        if len(coins):
+            coin = min(
+                coins,
+                key=lambda coin: (coin.center_x - player.center_x) ** 2
+                + (coin.center_y - player.center_y) ** 2,
+            )
+            return coin.center_x, coin.center_y
+        return self.nearest_spider(game)
+
+    def act(self, game):
+        super().act(game)
+        if self.jumping:
+            game.on_key_release(arcade.key.UP, 0)
+            self.jumping = False
+
+        player = game.player_sprite
+        target = self.target(game)
+        if target is None or abs(target[0] - player.center_x) < player.width / 2:
+            self.press(game, None)
+        elif target[0] > player.center_x:
+            self.press(game, arcade.key.RIGHT)
+        else:
+            self.press(game, arcade.key.LEFT)
+
+        if self.key is not None and player.center_x == self.last_x:
+            self.stuck += 1
+        else:
+            self.stuck = 0
+        self.last_x = player.center_x
+        if self.stuck >= STUCK_STEPS:
+            game.on_key_press(arcade.key.UP, 0)
+            self.jumping = True
+            self.stuck = 0
+
+
+BOTS = {bot.name: bot for bot in (Bot, TurretBot, HunterBot)}
+
+
+class BatchSpiderIsland(headless.HeadlessSpiderIsland):
+    """
+    The headless game, counting the spiders killed and bullets fired.
+    """
+
+    def __init__(self, seed=None):
+        super().__init__(seed=seed)
+        self.spiders_killed = 0
+        self.bullets_fired = 0
+
+    def step(self):
+        level = self.level
+        spiders = len(self.spider_swarm)
+        super().step()
+        # Finishing a level means its last spiders died this step
+        if self.level != level:
+            self.spiders_killed += spiders
+        else:
+            self.spiders_killed += spiders - len(self.spider_swarm)
+
+    def on_mouse_press(self, x, y, button, modifiers):
+        self.bullets_fired += 1
+        super().on_mouse_press(x, y, button, modifiers)
+
+
+class Job:
+    """
+    One run: a map (level number or map file), a player (a bot name or an
+    input script) and a seed.
+    """
+
+    def __init__(self, map_name, seed, bot=None, script=None):
+        self.map_name = map_name
+        self.seed = seed
+        self.bot = bot
+        self.script = script
+
+    @property
+    def player(self):
+        return self.bot if self.bot is not None else self.script
+
+
+def _level_loader(map_name):
+    """
+    Return the level number to play and the loader for it: the game's own
+    for a level number, or one that loads the map file as level 1.
+    """
+    if map_name.isdigit():
+        return int(map_name), run_game.level_loader
+    pattern = map_name.replace("{", "{{").replace("}", "}}")
+    return 1, run_game.make_level_loader(pattern)
+
+
+def run_job(job, max_frames=DEFAULT_FRAMES, lives=DEFAULT_LIVES):
+    """
+    Play one run and return its results as a dict. A death costs a life
+    and restarts the level as it began; the run ends when the level is cleared,
+    the lives run out, or after max_frames steps.
+    """
+    level, loader = _level_loader(job.map_name)
+    window = headless.HeadlessWindow()
+    arcade.set_window(window)
+
+    game_loader = run_game.level_loader
+    run_game.level_loader = loader
+    try:
+        game = BatchSpiderIsland(seed=job.seed)
+        game.level = level
+        window.show_view(game)
+        game.setup(level)
+        events = headless.load_script(job.script) if job.script is not None else None
+        if events is not None:
+            game.replay = headless.script_from(events, game.frame)
+        bot = BOTS[job.bot]() if job.bot is not None else None
+
+        deaths = 0
+        cleared_at = None
+        times = []
+        while game.frame < max_frames:
+            if bot is not None:
+                bot.act(game)
+            start = time.perf_counter()
+            game.on_update(headless.DELTA_TIME)
+            times.append(time.perf_counter() - start)
+
+            if game.level != level or isinstance(window.current_view, run_game.WinScreen):
+                cleared_at = game.frame
+                break
+            if isinstance(window.current_view, run_game.GameOverScreen):
+                deaths += 1
+                if deaths >= lives:
+                    break
+                # Every life starts with no key held and the script or bot
+                # from the top
+                window.show_view(game)
+                game.restart()
+                if events is not None:
+                    game.replay = headless.script_from(events, game.frame)
+                if bot is not None:
+                    bot = BOTS[job.bot]()
+    finally:
+        run_game.level_loader = game_loader
+
+    times = np.array(times or [0.0]) * 1000
+    return {
+        "map": job.map_name,
+        "player": job.player,
+        "seed": job.seed,
+        "outcome": "cleared" if cleared_at is not None else "died" if deaths >= lives else "timeout",
+        "frames": game.frame,
+        "cleared_at": cleared_at,
+        "score": game.score,
+        "deaths": deaths,
+        "spiders_killed": game.spiders_killed,
+        "bullets_fired": game.bullets_fired,
+        "mean_step_ms": float(times.mean()),
+        "max_step_ms": float(times.max()),
+    }
+
+
+def _start_worker():
+    textures.registry.preload()
+
+
+def run_batch(jobs, max_frames=DEFAULT_FRAMES, lives=DEFAULT_LIVES, workers=None):
+    """
+    Play every job, over a pool of `workers` processes (one per core if
+    not given), and return the results in the order of the jobs along with
+    the seconds it all took. One worker plays the jobs in this process.
+    """
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    if workers == 1:
+        _start_worker()
+        results = [run_job(job, max_frames, lives) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=_start_worker
+        ) as executor:
+            futures = [executor.submit(run_job, job, max_frames, lives) for job in jobs]
+            results = [future.result() for future in futures]
+    return results, time.perf_counter() - start
+
+
+def summarize(results):
+    """
+    Group run results by map and player, and return one summary dict per
+    group, in the order the groups first appear.
+    """
+    groups = {}
+    for result in results:
+        groups.setdefault((result["map"], result["player"]), []).append(result)
+
+    summaries = []
+    for (map_name, player), runs in groups.items():
+        cleared = [run["cleared_at"] for run in runs if run["cleared_at"] is not None]
+        summaries.append(
+            {
+                "map": map_name,
+                "player": player,
+                "runs": len(runs),
+                "clear_rate": len(cleared) / len(runs),
+                "mean_cleared_at": float(np.mean(cleared)) if cleared else None,
+                "mean_score": float(np.mean([run["score"] for run in runs])),
+                "deaths": sum(run["deaths"] for run in runs),
+                "spiders_killed": sum(run["spiders_killed"] for run in runs),
+                "bullets_fired": sum(run["bullets_fired"] for run in runs),
+                "mean_step_ms": float(np.mean([run["mean_step_ms"] for run in runs])),
+                "max_step_ms": max(run["max_step_ms"] for run in runs),
+            }
+        )
+    return summaries
+
+
+def report_lines(summaries, steps, elapsed, workers):
+    lines = [
+        f"{'map':<24}{'player':<12}{'runs':>5}{'cleared':>9}{'at frame':>10}"
+        f"{'score':>7}{'deaths':>8}{'kills':>7}{'shots':>7}{'mean ms':>9}{'max ms':>8}"
+    ]
+    for summary in summaries:
+        cleared_at = summary["mean_cleared_at"]
+        lines.append(
+            f"{summary['map'][-24:]:<24}{os.path.basename(summary['player'])[:11]:<12}"
+            f"{summary['runs']:>5}{summary['clear_rate']:>9.0%}"
+            f"{'-' if cleared_at is None else f'{cleared_at:.0f}':>10}"
+            f"{summary['mean_score']:>7.1f}{summary['deaths']:>8}"
+            f"{summary['spiders_killed']:>7}{summary['bullets_fired']:>7}"
+            f"{summary['mean_step_ms']:>9.3f}{summary['max_step_ms']:>8.2f}"
+        )
+    rate = steps / elapsed if elapsed else math.inf
+    lines.append(
+        f"{steps} steps in {elapsed:.1f} s on {workers} worker(s): {rate:.0f} steps/s"
+    )
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play many headless games in parallel")
+    parser.add_argument(
+        "--maps", nargs="+", default=["1"], metavar="MAP", help="level numbers or .tmx files"
+    )
+    parser.add_argument(
+        "--bots", nargs="*", choices=sorted(BOTS), metavar="BOT", help=f"any of {sorted(BOTS)}"
+    )
+    parser.add_argument("--scripts", nargs="*", default=[], help="input scripts to play")
+    parser.add_argument("--runs", type=int, default=1, help="seeds per map and player")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="first seed")
+    parser.add_argument("--frames", type=int, default=DEFAULT_FRAMES, help="frame limit per run")
+    parser.add_argument("--lives", type=int, default=DEFAULT_LIVES, help="deaths that end a run")
+    parser.add_argument("--workers", type=int, help="processes to use (default: one per core)")
+    parser.add_argument("--save", metavar="JSON", help="write the report and every run to a file")
+    args = parser.parse_args()
+
+    bots = args.bots if args.bots is not None else ([] if args.scripts else ["turret"])
+    jobs = [
+        Job(map_name, args.seed + run, bot=bot, script=script)
+        for map_name in args.maps
+        for bot, script in [(bot, None) for bot in bots] + [(None, s) for s in args.scripts]
+        for run in range(args.runs)
+    ]
+
+    workers = args.workers or os.cpu_count() or 1
+    results, elapsed = run_batch(jobs, args.frames, args.lives, workers)
+    summaries = summarize(results)
+    steps = sum(result["frames"] for result in results)
+    print("\n".join(report_lines(summaries, steps, elapsed, workers)))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "workers": workers,
+                    "frames": args.frames,
+                    "lives": args.lives,
+                    "elapsed": elapsed,
+                    "summaries": summaries,
+                    "runs": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
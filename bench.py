@@ -0,0 +1,661 @@
+#!/usr/bin/env python
+
+"""
+Benchmark suite
+
+Generates stress maps with set numbers of spiders, rubies, walls and water
+tiles, plays each one through the game's update loop with volleys of
+bullets fired on a schedule, and reports milliseconds per frame and
+how much each frame allocates, against entity count. Most scenarios are
+seen through a window as big as the map, so everything on it is simulated;
+the scrolling ones use the game's own window, and only what is near the
+player is.
+
+Results can be saved as JSON. Given a saved baseline, any scenario that
+got slower by more than the tolerance is flagged, and the run exits with
+an error:
+
+    python bench.py --save baseline.json
+    python bench.py --baseline baseline.json
+
+With --memory it instead measures what spiders cost to hold, as sprites
+the way the game once kept them and as the swarm's array records, in
+bytes per spider and the peak resident size of a process holding them:
+
+    python bench.py --memory --entities 10000
+
+With --net it instead plays each scenario as a host would for a guest,
+sending states over a loopback socket, and reports the bytes of each
+state sent naively, whole and as a delta, with the time to encode and
+decode one:
+
+    python bench.py --net
+"""
+import argparse
+import concurrent.futures
+import gc
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ElementTree
+
+import pyglet
+
+# There is no display to create the GL shadow window on
+pyglet.options["shadow_window"] = False
+
+import arcade
+import numpy as np
+
+import audio
+import headless
+import netsync
+import replay
+import run_game
+import swarm
+import textures
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows, where there is no peak resident size to report
+    resource = None
+
+BENCH_MAP_DIR = ".bench_maps"
+TILE_SIZE = 128
+DEFAULT_FRAMES = 300
+WARMUP_FRAMES = 30
+ALLOCATION_FRAMES = 30
+DEFAULT_SEED = 1
+DEFAULT_TOLERANCE = 0.15
+DEFAULT_ENTITIES = 10000
+# Spiders given sprites in the memory benchmark's on-screen case, about
+# as many as fit in the window
+SCREEN_SPIDERS = 200
+
+# Tiles of the generated maps, by gid
+GRASS = 1
+BOX = 2
+RUBY = 3
+SPIDER = 4
+WATER = 5
+TILE_IMAGES = {
+    GRASS: "assets/grass.png",
+    BOX: "assets/box.png",
+    RUBY: "assets/ruby.png",
+    SPIDER: "assets/spider.png",
+    WATER: "assets/water.png",
+}
+
+# Cells around the player's start that are left empty, so the run doesn't
+# end on the first frame
+START_COLUMNS = 6
+START_ROWS = 6
+
+
+class Scenario:
+    """
+    One stress map: how many of each thing to put on it, and a volley of
+    volley_size bullets fired in a ring every volley_every frames. With
+    scrolling set it is played in a window of the game's size instead of
+    one as big as the map.
+    """
+
+    def __init__(
+        self,
+        name,
+        spiders,
+        coins=0,
+        walls=0,
+        water=0,
+        volley_size=0,
+        volley_every=30,
+        scrolling=False,
+    ):
+        self.name = name
+        self.spiders = spiders
+        self.coins = coins
+        self.walls = walls
+        self.water = water
+        self.volley_size = volley_size
+        self.volley_every = volley_every
+        self.scrolling = scrolling
+
+    def map_size(self):
+        """
+        Return the (columns, rows) of a square map with room to spare.
+        """
+        entities = self.spiders + self.coins + self.walls + self.water
+        side = max(25, math.ceil(math.sqrt(entities * 4)))
+        return side, side
+
+    def volleys(self, frames):
+        """
+        Return the click events that fire this scenario's volleys.
+        """
+        events = []
+        if not self.volley_size:
+            return events
+        for frame in range(0, frames, self.volley_every):
+            for i in range(self.volley_size):
+                angle = 2 * math.pi * i / self.volley_size
+                x = 64 + math.cos(angle) * 100
+                y = 128 + math.sin(angle) * 100
+                events.append(replay.InputEvent(frame, "click", (x, y)))
+        return events
+
+    def to_dict(self):
+        return {
+            "spiders": self.spiders,
+            "coins": self.coins,
+            "walls": self.walls,
+            "water": self.water,
+            "volley_size": self.volley_size,
+            "volley_every": self.volley_every,
+            "scrolling": self.scrolling,
+        }
+
+
+def _scaling(spiders, scrolling=False):
+    return Scenario(
+        f"{'scrolling' if scrolling else 'spiders'}_{spiders}",
+        spiders,
+        coins=spiders // 2,
+        walls=spiders // 2,
+        water=spiders // 10,
+        volley_size=8,
+        scrolling=scrolling,
+    )
+
+
+SCENARIOS = (
+    [_scaling(spiders) for spiders in (10, 50, 100, 200, 400, 800)]
+    + [Scenario("volleys", 100, coins=50, walls=50, water=10, volley_size=64, volley_every=10)]
+    + [_scaling(spiders, scrolling=True) for spiders in (800, 3200, 12800)]
+)
+
+
+def generate_map(scenario, filename, seed):
+    """
+    Write a Tiled map for a scenario: grass along the bottom, and the walls,
+    water, rubies and spiders on random free cells.
+    """
+    rng = random.Random(seed)
+    columns, rows = scenario.map_size()
+
+    # Tiled rows run from the top
+    layers = {
+        name: [[0] * columns for _ in range(rows)]
+        for name in ("Platforms", "Water", "Coins", "Spiders")
+    }
+    layers["Platforms"][rows - 1] = [GRASS] * columns
+
+    free = [
+        (row, column)
+        for row in range(rows - 1)
+        for column in range(columns)
+        if column >= START_COLUMNS or row < rows - START_ROWS
+    ]
+    rng.shuffle(free)
+    for name, gid, count in (
+        ("Platforms", BOX, scenario.walls),
+        ("Water", WATER, scenario.water),
+        ("Coins", RUBY, scenario.coins),
+        ("Spiders", SPIDER, scenario.spiders),
+    ):
+        for row, column in free[:count]:
+            layers[name][row][column] = gid
+        free = free[count:]
+
+    root = ElementTree.Element(
+        "map",
+        version="1.4",
+        orientation="orthogonal",
+        renderorder="right-down",
+        width=str(columns),
+        height=str(rows),
+        tilewidth=str(TILE_SIZE),
+        tileheight=str(TILE_SIZE),
+        infinite="0",
+    )
+    tileset = ElementTree.SubElement(
+        root,
+        "tileset",
+        firstgid="1",
+        name="tiles",
+        tilewidth=str(TILE_SIZE),
+        tileheight=str(TILE_SIZE),
+        tilecount=str(len(TILE_IMAGES)),
+        columns="0",
+    )
+    map_directory = os.path.dirname(filename)
+    for gid, image in TILE_IMAGES.items():
+        tile = ElementTree.SubElement(tileset, "tile", id=str(gid - 1))
+        ElementTree.SubElement(
+            tile,
+            "image",
+            width=str(TILE_SIZE),
+            height=str(TILE_SIZE),
+            source=os.path.relpath(image, map_directory).replace(os.sep, "/"),
+        )
+    for layer_id, (name, grid) in enumerate(layers.items(), start=1):
+        layer = ElementTree.SubElement(
+            root, "layer", id=str(layer_id), name=name, width=str(columns), height=str(rows)
+        )
+        data = ElementTree.SubElement(layer, "data", encoding="csv")
+        data.text = "\n" + ",\n".join(",".join(map(str, row)) for row in grid) + "\n"
+
+    os.makedirs(map_directory, exist_ok=True)
+    ElementTree.ElementTree(root).write(filename, encoding="UTF-8", xml_declaration=True)
+
+
+class BenchSpiderIsland(headless.HeadlessSpiderIsland):
+    """
+    The headless game, except that finishing the stress map ends the run
+    instead of loading the next level.
+    """
+
+    cleared = False
+
+    def setup(self, level, score=None):
+        if self.spider_swarm is not None:
+            self.cleared = True
+            return
+        super().setup(level, score)
+
+
+def start_scenario(scenario, seed=DEFAULT_SEED):
+    """
+    Generate a scenario's map and return a game set up on it, in a window
+    of the scenario's size.
+    """
+    pattern = os.path.join(BENCH_MAP_DIR, f"{scenario.name}_{{}}.tmx")
+    generate_map(scenario, pattern.format(1), seed)
+
+    if scenario.scrolling:
+        window = headless.HeadlessWindow()
+    else:
+        columns, rows = scenario.map_size()
+        size = TILE_SIZE * run_game.TILE_SCALING * max(columns, rows)
+        window = headless.HeadlessWindow(width=size, height=size)
+    arcade.set_window(window)
+
+    game_loader = run_game.level_loader
+    run_game.level_loader = run_game.make_level_loader(pattern)
+    try:
+        game = BenchSpiderIsland(seed=seed)
+        window.show_view(game)
+        game.setup(1)
+    finally:
+        run_game.level_loader = game_loader
+    return game
+
+
+def run_scenario(scenario, frames=DEFAULT_FRAMES, seed=DEFAULT_SEED):
+    """
+    Play a scenario and return its results as a dict. The game goes on
+    after the player dies, so every scenario runs the same frames.
+    """
+    game = start_scenario(scenario, seed)
+    game.replay = replay.Replay(scenario.volleys(WARMUP_FRAMES + frames))
+
+    profiler = run_game.frame_profiler
+    was_enabled = profiler.enabled
+    gc.collect()
+
+    times = []
+    for frame in range(WARMUP_FRAMES + frames):
+        if frame == WARMUP_FRAMES:
+            profiler.reset()
+            profiler.enable()
+            audio.sounds.reset_counters()
+            game.spider_swarm.scheduler.reset()
+
+        start = time.perf_counter()
+        game.on_update(headless.DELTA_TIME)
+        if frame >= WARMUP_FRAMES:
+            times.append(time.perf_counter() - start)
+        if game.cleared:
+            break
+
+    phases = profiler.percentiles()
+    profiler.enable(was_enabled)
+    ai = game.spider_swarm.scheduler.report()
+    sounds = {
+        "played": audio.sounds.played,
+        "stolen": audio.sounds.stolen,
+        "dropped": audio.sounds.dropped,
+    }
+
+    # Tracing every allocation is slow, so it gets a few frames of its own
+    # after the timed ones. Clearing the traces before each frame makes the
+    # peak what that frame allocated at most, and what is left what it kept.
+    peaks = []
+    kept = []
+    tracemalloc.start()
+    for _ in range(ALLOCATION_FRAMES):
+        if game.cleared:
+            break
+        tracemalloc.clear_traces()
+        game.on_update(headless.DELTA_TIME)
+        current, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak)
+        kept.append(current)
+    tracemalloc.stop()
+
+    times = np.array(times or [0.0]) * 1000
+    return {
+        "name": scenario.name,
+        **scenario.to_dict(),
+        "frames": len(times),
+        "cleared": game.cleared,
+        "spiders_left": len(game.spider_swarm),
+        # The median, which shrugs off the odd slow frame from elsewhere
+        "ms_per_frame": float(np.median(times)),
+        "mean_ms": float(times.mean()),
+        "p95_ms": float(np.percentile(times, 95)),
+        "max_ms": float(times.max()),
+        "alloc_kib_per_frame": float(np.mean(peaks or [0])) / 1024,
+        "kept_bytes_per_frame": float(np.mean(kept or [0])),
+        "phase_p50_ms": {name: values[0] for name, values in phases.items()},
+        "ai": ai,
+        "sounds": sounds,
+    }
+
+
+def run_suite(scenarios=SCENARIOS, frames=DEFAULT_FRAMES, seed=DEFAULT_SEED):
+    results = []
+    for scenario in scenarios:
+        result = run_scenario(scenario, frames, seed)
+        print(
+            f"{result['name']:<14}{result['spiders']:>8}{result['coins']:>7}"
+            f"{result['walls']:>7}{result['water']:>7}"
+            f"{result['ms_per_frame']:>10.3f}{result['p95_ms']:>9.3f}"
+            f"{result['alloc_kib_per_frame']:>11.1f}{result['kept_bytes_per_frame']:>10.0f}"
+            f"{result['ai']['worst_ms']:>8.2f}{result['ai']['deferred']:>9}"
+            f"{result['ai']['worst_latency_frames']:>6}"
+        )
+        results.append(result)
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "frames": frames,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Return (name, baseline ms, ms) for each scenario at least `tolerance`
+    slower per frame than in the baseline.
+    """
+    before = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        old = before.get(result["name"])
+        if old is None:
+            continue
+        if result["ms_per_frame"] > old["ms_per_frame"] * (1 + tolerance):
+            regressions.append((result["name"], old["ms_per_frame"], result["ms_per_frame"]))
+    return regressions
+
+
+def _peak_rss():
+    """
+    The most memory this process has had resident, in bytes, or None.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _spider_sprites(positions):
+    pair = textures.registry.load_pair(textures.SPIDER_TEXTURE)
+    sprite_list = arcade.SpriteList()
+    for x, y in positions.tolist():
+        sprite = arcade.Sprite(scale=run_game.TILE_SCALING)
+        sprite.texture = pair[0]
+        sprite.position = x, y
+        # Collisions read the hit box, which the sprite keeps once worked out
+        sprite.get_adjusted_hit_box()
+        sprite_list.append(sprite)
+    return sprite_list
+
+
+def _spider_records(positions, shown=0):
+    spiders = swarm.SpiderSwarm(
+        positions, run_game.TILE_SCALING, None, None, run_game.SPIDER_SPEED, seed=1
+    )
+    index = np.arange(min(shown, len(spiders)))
+    pair = spiders.textures
+    spiders.view.show(index, spiders.x[index], spiders.y[index], [pair[0]] * len(index))
+    return spiders
+
+
+MEMORY_CASES = {
+    "spider_sprites": _spider_sprites,
+    "spider_records": _spider_records,
+    "spider_records_shown": lambda positions: _spider_records(positions, SCREEN_SPIDERS),
+}
+
+
+def measure_memory(case, entities=DEFAULT_ENTITIES, seed=DEFAULT_SEED):
+    """
+    Hold `entities` spiders the way a memory case does and return its
+    results as a dict. Run each case in a fresh process, so the peak
+    resident size is its own.
+    """
+    textures.registry.preload()
+    positions = np.random.default_rng(seed).random((entities, 2)) * 100000
+    gc.collect()
+    rss_before = _peak_rss()
+    tracemalloc.start()
+    held = MEMORY_CASES[case](positions)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = _peak_rss()
+    del held
+    return {
+        "name": case,
+        "entities": entities,
+        "bytes_per_entity": current / entities,
+        "peak_bytes_per_entity": peak / entities,
+        "peak_rss": rss_after,
+        "rss_growth": None if rss_after is None else rss_after - rss_before,
+    }
+
+
+def run_memory(entities=DEFAULT_ENTITIES, seed=DEFAULT_SEED):
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for case in MEMORY_CASES:
+        with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+            result = pool.submit(measure_memory, case, entities, seed).result()
+        rss = "-" if result["peak_rss"] is None else f"{result['peak_rss'] / 2**20:.1f}"
+        growth = "-" if result["rss_growth"] is None else f"{result['rss_growth'] / 2**20:.1f}"
+        print(
+            f"{result['name']:<22}{result['entities']:>9}"
+            f"{result['bytes_per_entity']:>10.0f}{result['peak_bytes_per_entity']:>10.0f}"
+            f"{rss:>11}{growth:>11}"
+        )
+        results.append(result)
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "entities": entities,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def measure_net(scenario, frames=DEFAULT_FRAMES, seed=DEFAULT_SEED):
+    """
+    Play a scenario as a host would, sending its states over a loopback
+    socket to a guest in this process, and return what they cost as a
+    dict. Every state the guest decodes is checked against the host's.
+    """
+    game = start_scenario(scenario, seed)
+    game.replay = replay.Replay(scenario.volleys(frames))
+    host = netsync.Host(port=0)
+    guest = netsync.Guest(port=host.link.address[1])
+    # The host sends to whoever last sent to it
+    guest.poll()
+    host.poll()
+
+    naive = 0
+    full = 0
+    full_seconds = 0.0
+    mismatches = 0
+    for _ in range(frames):
+        game.on_update(headless.DELTA_TIME)
+        if not host.due(game.frame):
+            continue
+        state = game.world_state()
+        naive += state.naive_size()
+        start = time.perf_counter()
+        full += len(netsync.encode(state))
+        full_seconds += time.perf_counter() - start
+
+        host.send(state)
+        guest.poll()
+        host.poll()
+        if guest.latest is None or not guest.latest.same_as(state):
+            mismatches += 1
+    host.close()
+    guest.close()
+
+    states = host.states
+    return {
+        "name": scenario.name,
+        "spiders": scenario.spiders,
+        "states": states,
+        "spiders_left": len(game.spider_swarm),
+        "naive_bytes": naive / states,
+        "full_bytes": full / states,
+        "sent_bytes": host.link.bytes_sent / states,
+        "full_states": host.full_states,
+        "full_encode_us": full_seconds / states * 1e6,
+        "encode_us": host.encode_seconds / states * 1e6,
+        "decode_us": guest.decode_seconds / max(guest.received, 1) * 1e6,
+        "mismatches": mismatches,
+    }
+
+
+def run_net(scenarios=SCENARIOS, frames=DEFAULT_FRAMES, seed=DEFAULT_SEED):
+    results = []
+    for scenario in scenarios:
+        result = measure_net(scenario, frames, seed)
+        print(
+            f"{result['name']:<16}{result['spiders']:>8}{result['naive_bytes']:>10.0f}"
+            f"{result['full_bytes']:>9.0f}{result['sent_bytes']:>9.0f}"
+            f"{result['full_encode_us']:>10.0f}{result['encode_us']:>10.0f}"
+            f"{result['decode_us']:>10.0f}{result['mismatches']:>10}"
+        )
+        results.append(result)
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "frames": frames,
+        "seed": seed,
+        "send_interval": netsync.SEND_INTERVAL,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Spider Island on stress maps")
+    parser.add_argument("--frames", type=int, default=DEFAULT_FRAMES)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument(
+        "--only", nargs="+", metavar="NAME", help="run only these scenarios"
+    )
+    parser.add_argument("--save", metavar="JSON", help="write the results to a file")
+    parser.add_argument("--baseline", metavar="JSON", help="compare with saved results")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="how much slower than the baseline counts as a regression",
+    )
+    parser.add_argument(
+        "--memory", action="store_true", help="measure memory per spider instead"
+    )
+    parser.add_argument(
+        "--entities",
+        type=int,
+        default=DEFAULT_ENTITIES,
+        help="how many spiders to hold with --memory",
+    )
+    parser.add_argument(
+        "--net",
+        action="store_true",
+        help="measure the states a host sends a guest instead",
+    )
+    args = parser.parse_args()
+
+    if args.memory:
+        print(
+            f"{'case':<22}{'entities':>9}{'B each':>10}{'peak B':>10}"
+            f"{'RSS MiB':>11}{'grew MiB':>11}"
+        )
+        report = run_memory(args.entities, args.seed)
+        if args.save:
+            with open(args.save, "w") as f:
+                json.dump(report, f, indent=2)
+        return
+
+    scenarios = SCENARIOS
+    if args.only:
+        scenarios = [scenario for scenario in SCENARIOS if scenario.name in args.only]
+
+    textures.registry.preload()
+    if args.net:
+        print(
+            f"{'scenario':<16}{'spiders':>8}{'naive B':>10}{'full B':>9}{'sent B':>9}"
+            f"{'full us':>10}{'enc us':>10}{'dec us':>10}{'mismatch':>10}"
+        )
+        report = run_net(scenarios, args.frames, args.seed)
+        if args.save:
+            with open(args.save, "w") as f:
+                json.dump(report, f, indent=2)
+        if any(result["mismatches"] for result in report["results"]):
+            sys.exit(1)
+        return
+
+    print(
+        f"{'scenario':<14}{'spiders':>8}{'coins':>7}{'walls':>7}{'water':>7}"
+        f"{'ms/frame':>10}{'p95 ms':>9}{'alloc KiB':>11}{'kept B':>10}"
+        f"{'AI max':>8}{'deferred':>9}{'late':>6}"
+    )
+    report = run_suite(scenarios, args.frames, args.seed)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before:.3f} -> {after:.3f} ms/frame")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} of {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Bullet pool
+
+Bullets come from a fixed set of sprites made when the game starts, and go
+back to it when they hit something or leave the live part of
+the world. Their positions
+and velocities are arrays, so moving every bullet and testing every bullet
+against spiders, walls and rubies is one collision stage per frame.
+"""
+import numpy as np
+
+import physics
+
+DEFAULT_CAPACITY = 256
+
+
+class BulletHits:
+    """
+    What the bullets hit this frame. spiders and coins are the indices of
+    the targets hit, each counted once, for the first bullet that hit it.
+    """
+
+    def __init__(self, spiders, coins, spent):
+        self.spiders = spiders
+        self.coins = coins
+        self.spent = spent
+
+
+class BulletPool:
+    def __init__(self, bullet_list, make_bullet, capacity=DEFAULT_CAPACITY):
+        self.bullet_list = bullet_list
+        self.sprites = [make_bullet() for _ in range(capacity)]
+
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.change_x = np.zeros(capacity)
+        self.change_y = np.zeros(capacity)
+        self.live = np.zeros(capacity, dtype=bool)
+        # When each bullet was fired, to find the oldest and keep hit order
+        self.fired_at = np.zeros(capacity, dtype=np.int64)
+        self.shots = 0
+
+        first = self.sprites[0]
+        self.hit_box = np.array(
+            [(x * first.scale, y * first.scale) for x, y in first.get_hit_box()]
+        )
+
+    def __len__(self):
+        return int(self.live.sum())
+
+    @property
+    def capacity(self):
+        return len(self.sprites)
+
+    def clear(self):
+        self.release(np.flatnonzero(self.live))
+
+    def fire(self, x, y, change_x, change_y):
+        """
+        Launch a bullet, reusing the oldest one in flight if the pool is
+        used up. Returns its sprite.
+        """
+        free = np.flatnonzero(~self.live)
+        if len(free):
+            slot = int(free[0])
+        else:
+            slot = int(np.argmin(self.fired_at))
+            self.release([slot])
+
+        self.x[slot] = x
+        self.y[slot] = y
+        self.change_x[slot] = change_x
+        self.change_y[slot] = change_y
+        self.live[slot] = True
+        self.fired_at[slot] = self.shots
+        self.shots += 1
+
+        sprite = self.sprites[slot]
+        sprite.position = x, y
+        sprite.change_x = change_x
+        sprite.change_y = change_y
+        self.bullet_list.append(sprite)
+        return sprite
+
+    def release(self, slots):
+        for slot in slots:
+            if self.live[slot]:
+                self.live[slot] = False
+                self.sprites[slot].remove_from_sprite_lists()
+
+    def state(self):
+        """
+        Return copies of the arrays of every bullet, for set_state().
+        """
+        return {
+            "x": self.x.copy(),
+            "y": self.y.copy(),
+            "change_x": self.change_x.copy(),
+            "change_y": self.change_y.copy(),
+            "live": self.live.copy(),
+            "fired_at": self.fired_at.copy(),
+            "shots": np.array(self.shots),
+        }
+
+    def set_state(self, state):
+        """
+        Put the bullets back as state() found them, in the same slots.
+        """
+        self.clear()
+        for name in ("x", "y", "change_x", "change_y", "fired_at"):
+            getattr(self, name)[:] = state[name]
+        self.shots = int(state["shots"])
+        for slot in np.flatnonzero(state["live"]).tolist():
+            self.live[slot] = True
+            sprite = self.sprites[slot]
+            sprite.position = self.x[slot], self.y[slot]
+            sprite.change_x = self.change_x[slot]
+            sprite.change_y = self.change_y[slot]
+            self.bullet_list.append(sprite)
+
+    def update(self):
+        """
+        Move every bullet in flight.
+        """
+        live = np.flatnonzero(self.live)
+        self.x[live] += self.change_x[live]
+        self.y[live] += self.change_y[live]
+        for slot, x, y in zip(live.tolist(), self.x[live].tolist(), self.y[live].tolist()):
+            self.sprites[slot].position = x, y
+
+    def collide(self, spider_points, walls, coins, bounds):
+        """
+        Test every bullet in flight against every target at once. Bullets
+        that hit something or left bounds go back to the pool.
+
+        spider_points is an (n, k, 2) array of spider hit boxes; walls and
+        coins are physics.Shapes; bounds is (left, right, bottom, top).
+        """
+        # In firing order, so a target hit by two bullets goes to the first
+        live = np.flatnonzero(self.live)
+        live = live[np.argsort(self.fired_at[live], kind="stable")]
+        empty = np.zeros(0, dtype=int)
+        if not len(live):
+            return BulletHits(empty, empty, empty)
+
+        points = physics.place(self.hit_box, self.x[live], self.y[live])
+        spent = np.zeros(len(live), dtype=bool)
+
+        def first_hits(bullet, target):
+            # A target taken by an earlier bullet is gone for later ones
+            targets, first = np.unique(target, return_index=True)
+            spent[bullet[first]] = True
+            return targets
+
+        spiders = empty
+        if len(spider_points):
+            i, j = physics.near_pairs(
+                points.min(axis=1),
+                points.max(axis=1),
+                spider_points.min(axis=1),
+                spider_points.max(axis=1),
+            )
+            hit = physics.intersecting(points[i], spider_points[j])
+            spiders = first_hits(i[hit], j[hit])
+
+        wall_bullets, _ = walls.hits(points)
+        spent[wall_bullets] = True
+
+        coin_bullets, coin_targets = coins.hits(points)
+        coins_hit = first_hits(coin_bullets, coin_targets)
+
+        # Out of bounds
+        bounds_left, bounds_right, bounds_bottom, bounds_top = bounds
+        left = points[:, :, 0].min(axis=1)
+        right = points[:, :, 0].max(axis=1)
+        bottom = points[:, :, 1].min(axis=1)
+        top = points[:, :, 1].max(axis=1)
+        spent |= (
+            (bottom > bounds_top)
+            | (top < bounds_bottom)
+            | (right < bounds_left)
+            | (left > bounds_right)
+        )
+
+        self.release(live[spent].tolist())
+        return BulletHits(spiders, coins_hit, live[spent])
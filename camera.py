@@ -0,0 +1,62 @@
+"""
+Camera
+
+Follows the player around maps bigger than the window, without showing
+anything past the edges of the world. It also decides what counts as near
+the player: the view, plus a margin around it, is the part of the world
+that is simulated every frame.
+"""
+import arcade
+
+
+class Camera:
+    def __init__(self, view_width, view_height, world_width, world_height):
+        self.view_width = view_width
+        self.view_height = view_height
+        self.world_width = world_width
+        self.world_height = world_height
+        # Bottom left corner of the view, in world coordinates
+        self.left = 0
+        self.bottom = 0
+
+    def follow(self, x, y):
+        """
+        Center the view on a point, as far as the edges of the world allow.
+        Whole pixels only, so the tiles don't shimmer as the view moves.
+        """
+        left = min(x - self.view_width / 2, self.world_width - self.view_width)
+        bottom = min(y - self.view_height / 2, self.world_height - self.view_height)
+        self.left = round(max(left, 0))
+        self.bottom = round(max(bottom, 0))
+
+    @property
+    def view(self):
+        """
+        The (left, right, bottom, top) of the view in world coordinates.
+        """
+        return (
+            self.left,
+            self.left + self.view_width,
+            self.bottom,
+            self.bottom + self.view_height,
+        )
+
+    def region(self, margin):
+        """
+        The view grown by a margin on every side.
+        """
+        left, right, bottom, top = self.view
+        return left - margin, right + margin, bottom - margin, top + margin
+
+    def to_world(self, x, y):
+        """
+        Turn a point on the screen into world coordinates.
+        """
+        return x + self.left, y + self.bottom
+
+    def use(self):
+        """
+        Draw in world coordinates from now on.
+        """
+        left, right, bottom, top = self.view
+        arcade.set_viewport(left, right, bottom, top)
@@ -0,0 +1,77 @@
+"""
+Chunked sprite layers
+
+Maps can be far bigger than the window, so sprites that never move are
+split into square chunks of the world, each with its own static sprite
+list. Drawing only visits the chunks that overlap the view, so the cost of
+a frame depends on what is on the screen rather than on the size of the
+map.
+"""
+import math
+
+import arcade
+
+# Pixels along each side of a chunk
+CHUNK_SIZE = 1024
+
+
+class ChunkedLayer:
+    """
+    Sprites that never move, split by the chunk their centers are in. They
+    keep the order they were given in within a chunk, so layers given
+    bottom first are still drawn bottom first.
+
+    Removing a sprite from its sprite lists only rebuilds its own chunk.
+    """
+
+    def __init__(self, sprites=(), chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        # (column, row) of a chunk -> its sprite list
+        self.chunks = {}
+        # How far any sprite reaches past the edge of its chunk
+        self.overhang = 0
+        self.extend(sprites)
+
+    def __len__(self):
+        return sum(len(sprite_list) for sprite_list in self.chunks.values())
+
+    def extend(self, sprites):
+        for sprite in sprites:
+            key = (
+                math.floor(sprite.center_x / self.chunk_size),
+                math.floor(sprite.center_y / self.chunk_size),
+            )
+            sprite_list = self.chunks.get(key)
+            if sprite_list is None:
+                sprite_list = self.chunks[key] = arcade.SpriteList(is_static=True)
+            sprite_list.append(sprite)
+            self.overhang = max(self.overhang, sprite.width / 2, sprite.height / 2)
+
+    def visible(self, left, right, bottom, top):
+        """
+        Return the sprite lists of the chunks whose sprites may overlap the
+        rectangle, nearest the bottom left first.
+        """
+        size = self.chunk_size
+        columns = range(
+            math.floor((left - self.overhang) / size),
+            math.floor((right + self.overhang) / size) + 1,
+        )
+        rows = range(
+            math.floor((bottom - self.overhang) / size),
+            math.floor((top + self.overhang) / size) + 1,
+        )
+        lists = []
+        for row in rows:
+            for column in columns:
+                sprite_list = self.chunks.get((column, row))
+                if sprite_list:
+                    lists.append(sprite_list)
+        return lists
+
+    def draw(self, left, right, bottom, top):
+        """
+        Draw the chunks in view of the rectangle.
+        """
+        for sprite_list in self.visible(left, right, bottom, top):
+            sprite_list.draw()
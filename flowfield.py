@@ -0,0 +1,172 @@
+"""
+Flow field
+
+One map of which way to go, from every cell near a target, to reach the
+target by the shortest path. Any number of spiders can then look up their
+next move in constant time instead of each searching on its own.
+
+Spiders walk on walls, fall, and climb the sides of walls, so the moves
+are: one cell sideways from a cell with a wall under it, one cell down, or
+one cell up beside a wall, onto its top once past it. Walls and water can't
+be entered. The field only reaches FIELD_RADIUS cells from the target,
+which covers every spider near enough to the player to be moving.
+
+The field is built again only when the target moves to another cell, and
+the fields of the last few target cells are kept, so going back and forth
+over the same tiles costs nothing.
+"""
+import collections
+
+import numpy as np
+
+import tilegrid
+
+# Cells from the target, on each axis, the field reaches
+FIELD_RADIUS = 20
+# Fields of recent target cells kept for reuse
+CACHE_SIZE = 32
+
+UNREACHABLE = -1
+
+
+class Field:
+    """
+    A built field over a block of cells. For each cell, move_x and move_y
+    give the next step (-1, 0 or 1 on each axis) and distance the steps to
+    the target, or UNREACHABLE. A step up has move_x set to the side of the
+    wall being climbed.
+    """
+
+    def __init__(self, first_row, first_column, move_x, move_y, distance):
+        self.first_row = first_row
+        self.first_column = first_column
+        self.move_x = move_x
+        self.move_y = move_y
+        self.distance = distance
+
+
+class FlowField:
+    def __init__(self, walls, water, radius=FIELD_RADIUS, cache_size=CACHE_SIZE):
+        """
+        walls and water are the tilegrid.TileGrid of those layers.
+        """
+        self.grid = walls
+        self.radius = radius
+        self.cache_size = cache_size
+        self.blocked = (walls.cells != tilegrid.EMPTY) | (water.cells != tilegrid.EMPTY)
+
+        # Walls with a border of open cells, so looking one cell past the
+        # edge of the map finds nothing
+        self.walls = np.pad(walls.cells != tilegrid.EMPTY, 1)
+
+        # Target cell -> Field, most recently used last
+        self._fields = collections.OrderedDict()
+        self.field = None
+        self.builds = 0
+
+    def update(self, x, y):
+        """
+        Point the field at a target position.
+        """
+        cell = self.grid.cell_at(x, y)
+        field = self._fields.get(cell)
+        if field is None:
+            field = self._build(*cell)
+            self.builds += 1
+            self._fields[cell] = field
+            if len(self._fields) > self.cache_size:
+                self._fields.popitem(last=False)
+        else:
+            self._fields.move_to_end(cell)
+        self.field = field
+
+    def _build(self, target_row, target_column):
+        rows, columns = self.blocked.shape
+        first_row = max(target_row - self.radius, 0)
+        last_row = min(target_row + self.radius, rows - 1)
+        first_column = max(target_column - self.radius, 0)
+        last_column = min(target_column + self.radius, columns - 1)
+        height = last_row - first_row + 1
+        width = last_column - first_column + 1
+
+        if not (0 <= target_row < rows and 0 <= target_column < columns):
+            move_x = np.zeros((max(height, 0), max(width, 0)), dtype=np.int8)
+            distance = np.full(move_x.shape, UNREACHABLE, dtype=np.int32)
+            return Field(first_row, first_column, move_x, move_x.copy(), distance)
+
+        # The search reads single cells, which plain lists do far faster
+        # than arrays
+        blocked = self.blocked[first_row : last_row + 1, first_column : last_column + 1].tolist()
+        # wall[row + 1][column + 1] is the wall at (row, column), and the
+        # border reaches one cell past the block
+        wall = self.walls[first_row : last_row + 3, first_column : last_column + 3].tolist()
+        move_x = [[0] * width for _ in range(height)]
+        move_y = [[0] * width for _ in range(height)]
+        distance = [[UNREACHABLE] * width for _ in range(height)]
+
+        # Search out from the target over the moves reversed: a cell is
+        # reached from the cells that could move into it
+        row = target_row - first_row
+        column = target_column - first_column
+        distance[row][column] = 0
+        queue = collections.deque([(row, column)])
+        while queue:
+            row, column = queue.popleft()
+            steps = distance[row][column] + 1
+            sources = []
+            # Walking in from either side, off a wall below
+            if wall[row][column]:
+                sources.append((row, column - 1, 1, 0))
+            if wall[row][column + 2]:
+                sources.append((row, column + 1, -1, 0))
+            # Falling in from above
+            sources.append((row + 1, column, 0, -1))
+            for side in (1, -1):
+                # Climbing up beside a wall that goes on up past this cell
+                if wall[row][column + 1 + side] and wall[row + 1][column + 1 + side]:
+                    sources.append((row - 1, column, side, 1))
+                # Climbing over the top of the wall under this cell
+                if wall[row][column + 1]:
+                    sources.append((row - 1, column - side, side, 1))
+
+            for from_row, from_column, step_x, step_y in sources:
+                if not (0 <= from_row < height and 0 <= from_column < width):
+                    continue
+                if distance[from_row][from_column] != UNREACHABLE:
+                    continue
+                if blocked[from_row][from_column]:
+                    continue
+                distance[from_row][from_column] = steps
+                move_x[from_row][from_column] = step_x
+                move_y[from_row][from_column] = step_y
+                queue.append((from_row, from_column))
+
+        return Field(
+            first_row,
+            first_column,
+            np.array(move_x, dtype=np.int8),
+            np.array(move_y, dtype=np.int8),
+            np.array(distance, dtype=np.int32),
+        )
+
+    def moves(self, x, y):
+        """
+        Return (move_x, move_y, distance) arrays for bodies at positions x
+        and y. Bodies outside the field are UNREACHABLE.
+        """
+        field = self.field
+        rows = np.floor(np.asarray(y) / self.grid.cell_height).astype(int) - field.first_row
+        columns = np.floor(np.asarray(x) / self.grid.cell_width).astype(int) - field.first_column
+        height, width = field.distance.shape
+        inside = (rows >= 0) & (rows < height) & (columns >= 0) & (columns < width)
+        rows = np.where(inside, rows, 0)
+        columns = np.where(inside, columns, 0)
+
+        distance = np.full(len(rows), UNREACHABLE, dtype=np.int32)
+        move_x = np.zeros(len(rows), dtype=np.int8)
+        move_y = np.zeros(len(rows), dtype=np.int8)
+        if height and width:
+            distance = np.where(inside, field.distance[rows, columns], UNREACHABLE)
+            move_x = np.where(inside, field.move_x[rows, columns], 0)
+            move_y = np.where(inside, field.move_y[rows, columns], 0)
+        return move_x, move_y, distance
@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+
+"""
+Headless simulation of Spider Island.
+
+Steps the normal game logic without a window, rendering or sound, so levels
+can be soak-tested on machines without a GPU.
+
+Input scripts are plain text, one event per line:
+
+    # frame action args
+    0 press RIGHT
+    40 press UP
+    42 release UP
+    90 click 800 200
+
+Actions are ``press``/``release`` (any name from ``arcade.key``) and
+``click`` (mouse x and y). Frames are simulation steps, however fast the
+run is drawn.
+"""
+import argparse
+import os
+import time
+
+import pyglet
+
+# There is no display to create the GL shadow window on
+pyglet.options["shadow_window"] = False
+
+import arcade
+
+import audio
+import memwatch
+import replay
+import run_game
+import textures
+import timestep
+
+DELTA_TIME = 1 / timestep.SIMULATION_RATE
+
+
+class HeadlessWindow:
+    """
+    Stands in for arcade.Window. Holds the bits of state the views touch
+    and remembers which view was shown last.
+    """
+
+    def __init__(self, width=run_game.SCREEN_WIDTH, height=run_game.SCREEN_HEIGHT):
+        self.width = width
+        self.height = height
+        self.background_color = None
+        self.current_view = None
+
+    def show_view(self, view):
+        self.current_view = view
+
+
+class HeadlessSpiderIsland(run_game.SpiderIsland):
+    """
+    The game view with sounds going through the mixer as usual, but never
+    played.
+    """
+
+    def load_sounds(self):
+        audio.sounds.preload(audio.NullBackend())
+
+
+def parse_script(lines):
+    """
+    Turn the lines of an input script into a list of InputEvents sorted by
+    frame.
+    """
+    events = []
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        frame, action, *args = line.split()
+        events.append(replay.InputEvent(int(frame), action, args))
+    events.sort(key=lambda event: event.frame)
+    return events
+
+
+def load_script(filename):
+    with open(filename) as f:
+        return parse_script(f)
+
+
+def script_from(events, first_frame):
+    """
+    Return a replay.Replay of script events counted from first_frame rather
+    than from the start of the game, to play a script again after a restart.
+    """
+    return replay.Replay(
+        [replay.InputEvent(event.frame + first_frame, event.action, event.args) for event in events]
+    )
+
+
+class RunResult:
+    def __init__(self, level, outcome, frames, score, elapsed):
+        self.level = level
+        self.outcome = outcome
+        self.frames = frames
+        self.score = score
+        self.elapsed = elapsed
+
+    @property
+    def fps(self):
+        if self.elapsed == 0:
+            return float("inf")
+        return self.frames / self.elapsed
+
+    def __repr__(self):
+        return (
+            f"RunResult(level={self.level}, outcome={self.outcome!r}, "
+            f"frames={self.frames}, score={self.score}, fps={self.fps:.0f})"
+        )
+
+
+def simulate(
+    level=1,
+    events=(),
+    max_frames=3600,
+    seed=None,
+    single_level=True,
+    checksums=None,
+    record=None,
+    render_fps=timestep.SIMULATION_RATE,
+):
+    """
+    Play a level without a window and return a RunResult.
+
+    The outcome is "died", "cleared" (the level was finished and
+    single_level is set), "won" (the last level was finished), "timeout",
+    or "diverged" if checksums are given and the state after a frame does
+    not match. If record is a file name, the run's session is saved there.
+
+    render_fps is how often the game is given a frame, and so how many
+    simulation steps each one runs. It should not change the outcome.
+    """
+    window = HeadlessWindow()
+    arcade.set_window(window)
+
+    game = HeadlessSpiderIsland(seed=seed)
+    game.level = level
+    game.replay = replay.Replay(list(events), checksums)
+    window.show_view(game)
+    game.setup(level)
+    if record:
+        game.record_session(record)
+
+    outcome = "timeout"
+
+    start = time.perf_counter()
+    while game.frame < max_frames:
+        game.on_update(1 / render_fps)
+
+        if game.replay.diverged_at is not None:
+            outcome = "diverged"
+            break
+        if isinstance(window.current_view, run_game.GameOverScreen):
+            outcome = "died"
+            break
+        if isinstance(window.current_view, run_game.WinScreen):
+            outcome = "won"
+            break
+        if single_level and game.level != level:
+            outcome = "cleared"
+            break
+    elapsed = time.perf_counter() - start
+
+    game.save_session()
+    return RunResult(level, outcome, game.frame, game.score, elapsed)
+
+
+def soak(
+    level=1,
+    restarts=50,
+    events=(),
+    max_frames=600,
+    seed=None,
+    max_growth_mib=memwatch.MAX_GROWTH_MIB,
+):
+    """
+    Play one game without a window through many level transitions, and
+    return whether its memory stayed within max_growth_mib.
+
+    Each round plays until the player dies or max_frames go by, replaying
+    events from the round's start, then the level is restarted; every
+    other round moves on to the next level instead, wrapping around after
+    the last. The memory watchdog takes a reading at each transition.
+    Growth is counted from the reading after the first trip through every
+    level, so caches filling up the first time don't count as a leak.
+    """
+    window = HeadlessWindow()
+    arcade.set_window(window)
+    watchdog = run_game.memory_watchdog
+    watchdog.enable()
+    watchdog.reset()
+
+    num_maps = len(os.listdir("maps"))
+    game = HeadlessSpiderIsland(seed=seed)
+    game.level = level
+    window.show_view(game)
+    game.setup(level)
+
+    start = time.perf_counter()
+    for number in range(restarts):
+        first_frame = game.frame
+        game.replay = script_from(events, first_frame)
+        while game.frame - first_frame < max_frames:
+            game.on_update(DELTA_TIME)
+            if window.current_view is not game or game.level != level:
+                break
+
+        window.show_view(game)
+        if game.level != level:
+            # Cleared it, and the next level was set up on the way
+            level = game.level
+            if level > num_maps:
+                level = game.level = 1
+                game.setup(level, game.score)
+        elif number % 2:
+            level = level % num_maps + 1
+            game.level = level
+            game.setup(level, game.score)
+        else:
+            game.restart()
+    elapsed = time.perf_counter() - start
+    watchdog.enable(False)
+
+    for reading in watchdog.readings:
+        print(reading.describe()[0])
+    warm = min(num_maps * 2, len(watchdog.readings) - 2)
+    growth = watchdog.growth(max(warm, 0))
+    if growth is None:
+        print("Too few transitions to tell whether memory grew")
+        return True
+    caches = ", ".join(f"{name} {count:+d}" for name, count in growth["texture_cache"].items())
+    print(
+        f"{len(watchdog.readings)} transitions in {elapsed:.1f} s; from transition "
+        f"{warm + 1} on, {growth['sprites']:+d} sprites, {growth['sprite_lists']:+d} "
+        f"sprite lists, textures {caches}, traced {growth['traced'] / memwatch.MIB:+.2f} MiB"
+    )
+    if growth["rss"] is None:
+        print("Resident size unknown here, so it can't be checked")
+        return True
+    grown = growth["rss"] / memwatch.MIB
+    within = grown <= max_growth_mib
+    print(
+        f"RSS grew {grown:+.2f} MiB, allowed {max_growth_mib:.2f} MiB: "
+        f"{'ok' if within else 'LEAKING'}"
+    )
+    if not within:
+        # Where the memory went, transition by transition
+        for reading in watchdog.readings[warm:]:
+            print("\n".join(reading.describe()))
+    return within
+
+
+def replay_session(session):
+    """
+    Play a recorded session back without a window and return a RunResult.
+    """
+    return simulate(
+        session.level,
+        session.events,
+        session.frames,
+        session.seed,
+        single_level=False,
+        checksums=session.checksums,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Spider Island without a window")
+    parser.add_argument("--level", type=int, default=1)
+    parser.add_argument("--script", help="input script to play back")
+    parser.add_argument("--frames", type=int, default=3600, help="frame limit per run")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument(
+        "--render-fps",
+        type=float,
+        default=timestep.SIMULATION_RATE,
+        help="frames drawn per second of game time, to test the fixed timestep",
+    )
+    parser.add_argument(
+        "--all-levels",
+        action="store_true",
+        help="keep playing into the next level instead of stopping",
+    )
+    parser.add_argument(
+        "--profile", metavar="CSV", help="time every frame and write it to a CSV file"
+    )
+    parser.add_argument(
+        "--record", metavar="FILE", help="save the session of the last run"
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="FILE",
+        help="play a recorded session back instead, checking every frame",
+    )
+    parser.add_argument(
+        "--telemetry", metavar="DIR", help="write gameplay events to files in a directory"
+    )
+    parser.add_argument(
+        "--soak",
+        type=int,
+        metavar="ROUNDS",
+        help="restart and change levels this many times in one game, "
+        "failing if memory grows too much",
+    )
+    parser.add_argument(
+        "--max-growth",
+        type=float,
+        default=memwatch.MAX_GROWTH_MIB,
+        metavar="MIB",
+        help="resident memory a soak test may grow by",
+    )
+    args = parser.parse_args()
+
+    if args.profile:
+        run_game.frame_profiler.open_csv(args.profile)
+        run_game.frame_profiler.enable()
+    if args.telemetry:
+        run_game.gameplay_telemetry.start(args.telemetry)
+
+    textures.registry.preload()
+    events = load_script(args.script) if args.script else []
+
+    if args.soak:
+        if not soak(args.level, args.soak, events, args.frames, args.seed, args.max_growth):
+            raise SystemExit(1)
+        return
+
+    total_frames = 0
+    total_elapsed = 0
+    session = replay.Session.load(args.replay) if args.replay else None
+    for run in range(args.runs):
+        if session is not None:
+            result = replay_session(session)
+        else:
+            seed = None if args.seed is None else args.seed + run
+            record = args.record if run == args.runs - 1 else None
+            result = simulate(
+                args.level,
+                events,
+                args.frames,
+                seed,
+                single_level=not args.all_levels,
+                record=record,
+                render_fps=args.render_fps,
+            )
+        total_frames += result.frames
+        total_elapsed += result.elapsed
+        print(result)
+
+    if args.runs > 1 and total_elapsed:
+        print(f"{total_frames} frames, {total_frames / total_elapsed:.0f} FPS overall")
+    if args.profile:
+        run_game.frame_profiler.close_csv()
+        print("\n".join(run_game.frame_profiler.report()))
+    if args.telemetry:
+        run_game.gameplay_telemetry.close()
+        telemetry_log = run_game.gameplay_telemetry
+        print(
+            f"Telemetry: {telemetry_log.written} events written to "
+            f"{len(telemetry_log.files)} file(s), {telemetry_log.ring.dropped} dropped"
+        )
+    print(
+        f"Texture registry: {textures.registry.hits} hits, "
+        f"{textures.registry.misses} misses"
+    )
+    print(
+        f"Sounds: {audio.sounds.played} played, {audio.sounds.stolen} cut short, "
+        f"{audio.sounds.dropped} dropped"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Map hot reload
+
+In dev mode the game watches the map of the level being played. When the
+file changes (saved from Tiled, say), its layers are compared with the
+ones being played, and just those that differ are built again on a
+background thread, like a prefetched level. The game then swaps them in
+between two frames, keeping the player where they are and the score as
+it is, and rebuilding only the collision shapes and engines that use
+those layers.
+
+Reloads report how long they took, from the change being seen to the new
+layers being in the game.
+"""
+import concurrent.futures
+import os
+import time
+import xml.etree.ElementTree as ElementTree
+
+import levels
+
+# Seconds between looks at the map's modification time
+POLL_INTERVAL = 0.5
+
+
+def changed_layers(old, new, names):
+    """
+    Return which of the named layers differ between two levels.LevelData.
+    Every layer has changed if the grid's size or the tiles have.
+    """
+    if (
+        (old.width, old.height, old.tile_width, old.tile_height)
+        != (new.width, new.height, new.tile_width, new.tile_height)
+        or old.tiles != new.tiles
+    ):
+        return list(names)
+    return [name for name in names if old.layers.get(name) != new.layers.get(name)]
+
+
+class Reload:
+    """
+    A reload built in the background, ready to swap in. changed names the
+    layers that differ, and level is a levels.Level of just those layers.
+    error is set instead if the map couldn't be read.
+    """
+
+    def __init__(self, number, data=None, changed=(), level=None, error=None):
+        self.number = number
+        self.data = data
+        self.changed = list(changed)
+        self.level = level
+        self.error = error
+        self.seen_at = None
+        self.built_at = None
+
+
+class MapWatcher:
+    def __init__(self, loader, poll_interval=POLL_INTERVAL):
+        """
+        loader is the levels.LevelLoader whose layers the game plays.
+        """
+        self.loader = loader
+        self.poll_interval = poll_interval
+        self.number = None
+        self.filename = None
+        self.data = None
+        self.mtime_ns = None
+        self._last_poll = 0.0
+        self._pending = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        # How long the last reload took, in milliseconds, from the change
+        # being seen until it was in the game
+        self.last_latency_ms = None
+
+    @property
+    def layer_names(self):
+        return list(self.loader.layers) + list(self.loader.entity_layers)
+
+    def watch(self, number, data):
+        """
+        Watch the map of a level, as data, just loaded from it.
+        """
+        self.number = number
+        self.filename = self.loader.map_pattern.format(number)
+        self.data = data
+        # A level built ahead of time may be older than its map, so the
+        # first look always checks
+        self.mtime_ns = None
+        self._pending = None
+
+    def _mtime(self):
+        try:
+            return os.stat(self.filename).st_mtime_ns
+        except OSError:
+            return None
+
+    def poll(self):
+        """
+        Look for a change to the map now and then, and return a Reload
+        once one has been built, or None.
+        """
+        if self.filename is None:
+            return None
+        if self._pending is not None:
+            if not self._pending.done():
+                return None
+            reload = self._pending.result()
+            self._pending = None
+            if reload.number != self.number:
+                return None
+            if reload.data is not None:
+                self.data = reload.data
+            return reload
+
+        now = time.perf_counter()
+        if now - self._last_poll < self.poll_interval:
+            return None
+        self._last_poll = now
+        mtime_ns = self._mtime()
+        if mtime_ns is None or mtime_ns == self.mtime_ns:
+            return None
+        self.mtime_ns = mtime_ns
+        self._pending = self._executor.submit(
+            self._build, self.number, self.filename, self.data, now
+        )
+        return None
+
+    def _build(self, number, filename, old_data, seen_at):
+        try:
+            data = levels.load_level_data(filename)
+        except (OSError, ValueError, ElementTree.ParseError) as error:
+            reload = Reload(number, error=error)
+        else:
+            changed = changed_layers(old_data, data, self.layer_names)
+            level = None
+            if changed:
+                level = self.loader.build(number, data, only=changed)
+            reload = Reload(number, data, changed, level)
+        reload.seen_at = seen_at
+        reload.built_at = time.perf_counter()
+        return reload
+
+    def report(self, reload, swap_started):
+        """
+        Note that a reload is in the game, having started to swap in at
+        swap_started, and return a line saying how it went, or None if
+        nothing in it changed.
+        """
+        done = time.perf_counter()
+        if reload.error is not None:
+            return f"Couldn't reload {self.filename}: {reload.error}"
+        if not reload.changed:
+            return None
+        self.last_latency_ms = (done - reload.seen_at) * 1000
+        return (
+            f"Reloaded {', '.join(reload.changed)} from {self.filename} in "
+            f"{self.last_latency_ms:.1f} ms (built in "
+            f"{(reload.built_at - reload.seen_at) * 1000:.1f} ms, swapped in "
+            f"{(done - swap_started) * 1000:.1f} ms)"
+        )
@@ -0,0 +1,481 @@
+#!/usr/bin/env python
+
+"""
+Compiled level cache
+
+Tiled maps are parsed once and stored as small binary files in
+LEVEL_CACHE_DIR. A compiled file records the modification time, size and
+SHA-1 of the map it came from; it is only rebuilt when the map's contents
+actually change.
+
+Run this file to compile every map up front:
+
+    python levels.py
+"""
+import array
+import base64
+import concurrent.futures
+import glob
+import gzip
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+import xml.etree.ElementTree as ElementTree
+import zlib
+
+import pyglet
+
+# Compiling maps from the command line never opens a window
+if __name__ == "__main__":
+    pyglet.options["shadow_window"] = False
+
+import arcade
+import numpy as np
+
+import chunks
+import physics
+import textures
+import tilegrid
+
+LEVEL_CACHE_DIR = ".level_cache"
+MAP_PATTERN = "maps/map_level_{}.tmx"
+
+_MAGIC = b"SILV"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHQQ20sIIII")
+_COUNT = struct.Struct("<I")
+_TILE = struct.Struct("<IHHH")
+_LAYER = struct.Struct("<Hf")
+
+# Tiled stores flip flags in the top bits of each gid
+FLIPPED_HORIZONTALLY = 0x80000000
+FLIPPED_VERTICALLY = 0x40000000
+FLIPPED_DIAGONALLY = 0x20000000
+GID_MASK = 0x1FFFFFFF
+
+
+class LevelData:
+    """
+    The parts of a Tiled map the game uses: the grid size, an image for
+    every gid, and the raw gid grid of every tile layer, top row first.
+    """
+
+    def __init__(self, width, height, tile_width, tile_height):
+        self.width = width
+        self.height = height
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        # gid -> (image file, image width, image height)
+        self.tiles = {}
+        # layer name -> (array of gids, opacity)
+        self.layers = {}
+
+    def layer(self, name):
+        """
+        Return the gid grid of a layer as a flat array, or None if the map
+        has no layer with that name.
+        """
+        entry = self.layers.get(name)
+        return entry[0] if entry else None
+
+    def placed_tiles(self, name):
+        """
+        Yield (row, column, tile, flipped) for every tile of a layer that
+        has an image, top row first. tile is the (image, width, height)
+        entry from self.tiles.
+        """
+        gids = self.layer(name)
+        if gids is None:
+            return
+        for index, item in enumerate(gids):
+            gid = item & GID_MASK
+            if gid == 0:
+                continue
+            tile = self.tiles.get(gid)
+            if tile is None:
+                print(f"Warning, couldn't find tile for item {gid} in layer '{name}'.")
+                continue
+            row, column = divmod(index, self.width)
+            yield row, column, tile, bool(item & FLIPPED_HORIZONTALLY)
+
+
+def read_tmx(filename):
+    """
+    Parse a Tiled map into LevelData.
+    """
+    root = ElementTree.parse(filename).getroot()
+    map_directory = os.path.dirname(filename)
+
+    data = LevelData(
+        int(root.get("width")),
+        int(root.get("height")),
+        int(root.get("tilewidth")),
+        int(root.get("tileheight")),
+    )
+
+    for tileset in root.iter("tileset"):
+        first_gid = int(tileset.get("firstgid"))
+        for tile in tileset.iter("tile"):
+            image = tile.find("image")
+            if image is None:
+                continue
+            source = os.path.normpath(os.path.join(map_directory, image.get("source")))
+            data.tiles[first_gid + int(tile.get("id"))] = (
+                source.replace(os.sep, "/"),
+                int(image.get("width")),
+                int(image.get("height")),
+            )
+
+    for layer in root.iter("layer"):
+        gids = _decode_layer_data(layer.find("data"))
+        if len(gids) != data.width * data.height:
+            raise ValueError(
+                f"Layer '{layer.get('name')}' in '{filename}' has {len(gids)} "
+                f"tiles, expected {data.width * data.height}"
+            )
+        opacity = float(layer.get("opacity", 1))
+        data.layers[layer.get("name")] = (gids, opacity)
+
+    return data
+
+
+def _decode_layer_data(element):
+    encoding = element.get("encoding")
+    if encoding == "csv":
+        return array.array("I", (int(gid) for gid in element.text.split(",")))
+    if encoding != "base64":
+        raise ValueError(f"Unsupported layer encoding: {encoding}")
+
+    raw = base64.b64decode(element.text.strip())
+    compression = element.get("compression")
+    if compression == "zlib":
+        raw = zlib.decompress(raw)
+    elif compression == "gzip":
+        raw = gzip.decompress(raw)
+    elif compression is not None:
+        raise ValueError(f"Unsupported layer compression: {compression}")
+
+    gids = array.array("I")
+    gids.frombytes(raw)
+    if sys.byteorder != "little":
+        gids.byteswap()
+    return gids
+
+
+def compiled_path(filename):
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(LEVEL_CACHE_DIR, f"{name}.bin")
+
+
+def _file_digest(filename):
+    with open(filename, "rb") as f:
+        return hashlib.sha1(f.read()).digest()
+
+
+def write_compiled(data, filename, source):
+    stat = os.stat(source)
+    parts = [
+        _HEADER.pack(
+            _MAGIC,
+            _VERSION,
+            stat.st_mtime_ns,
+            stat.st_size,
+            _file_digest(source),
+            data.width,
+            data.height,
+            data.tile_width,
+            data.tile_height,
+        ),
+        _COUNT.pack(len(data.tiles)),
+    ]
+    for gid, (image, width, height) in data.tiles.items():
+        encoded = image.encode()
+        parts.append(_TILE.pack(gid, width, height, len(encoded)))
+        parts.append(encoded)
+
+    parts.append(_COUNT.pack(len(data.layers)))
+    for name, (gids, opacity) in data.layers.items():
+        encoded = name.encode()
+        parts.append(_LAYER.pack(len(encoded), opacity))
+        parts.append(encoded)
+        if sys.byteorder != "little":
+            gids = array.array("I", gids)
+            gids.byteswap()
+        parts.append(gids.tobytes())
+
+    directory = os.path.dirname(filename) or "."
+    os.makedirs(directory, exist_ok=True)
+    # Write to the side and swap in so a prefetch never sees half a file.
+    # Each writer has a file of its own, since the preloader, a prefetch and
+    # a hot reload may all compile the same map at once.
+    f = tempfile.NamedTemporaryFile(
+        dir=directory, prefix=f"{os.path.basename(filename)}.", suffix=".tmp", delete=False
+    )
+    try:
+        with f:
+            f.write(b"".join(parts))
+        os.replace(f.name, filename)
+    except BaseException:
+        os.remove(f.name)
+        raise
+
+
+def read_compiled(filename):
+    """
+    Read a compiled level. Returns (LevelData, mtime_ns, size, digest) of
+    the source map it was built from.
+    """
+    with open(filename, "rb") as f:
+        raw = f.read()
+
+    (
+        magic,
+        version,
+        mtime_ns,
+        size,
+        digest,
+        width,
+        height,
+        tile_width,
+        tile_height,
+    ) = _HEADER.unpack_from(raw, 0)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError(f"'{filename}' is not a compiled level")
+    offset = _HEADER.size
+
+    data = LevelData(width, height, tile_width, tile_height)
+
+    (count,) = _COUNT.unpack_from(raw, offset)
+    offset += _COUNT.size
+    for _ in range(count):
+        gid, image_width, image_height, length = _TILE.unpack_from(raw, offset)
+        offset += _TILE.size
+        image = raw[offset : offset + length].decode()
+        offset += length
+        data.tiles[gid] = (image, image_width, image_height)
+
+    (count,) = _COUNT.unpack_from(raw, offset)
+    offset += _COUNT.size
+    layer_bytes = width * height * 4
+    for _ in range(count):
+        length, opacity = _LAYER.unpack_from(raw, offset)
+        offset += _LAYER.size
+        name = raw[offset : offset + length].decode()
+        offset += length
+        gids = array.array("I")
+        gids.frombytes(raw[offset : offset + layer_bytes])
+        if sys.byteorder != "little":
+            gids.byteswap()
+        offset += layer_bytes
+        data.layers[name] = (gids, opacity)
+
+    return data, mtime_ns, size, digest
+
+
+def load_level_data(filename):
+    """
+    Return LevelData for a map, from the compiled cache when it is still
+    current and by compiling the map otherwise.
+    """
+    cache_name = compiled_path(filename)
+    stat = os.stat(filename)
+    try:
+        data, mtime_ns, size, digest = read_compiled(cache_name)
+    except (OSError, ValueError, struct.error):
+        data = None
+
+    if data is not None:
+        if mtime_ns == stat.st_mtime_ns and size == stat.st_size:
+            return data
+        # Touched but maybe not changed, so compare the contents
+        if digest == _file_digest(filename):
+            write_compiled(data, cache_name, filename)
+            return data
+
+    data = read_tmx(filename)
+    write_compiled(data, cache_name, filename)
+    return data
+
+
+def build_layer(data, layer_name, scaling, use_spatial_hash=None):
+    """
+    Create the sprites for one layer. Matches arcade.tilemap.process_layer,
+    but takes textures from the registry instead of reading image files.
+    """
+    sprite_list = arcade.SpriteList(use_spatial_hash=use_spatial_hash)
+    entry = data.layers.get(layer_name)
+    if entry is None:
+        return sprite_list
+    opacity = entry[1]
+
+    cell_width = data.tile_width * scaling
+    cell_height = data.tile_height * scaling
+    for row, column, tile, flipped in data.placed_tiles(layer_name):
+        image, image_width, image_height = tile
+        sprite = arcade.Sprite(scale=scaling)
+        sprite.texture = textures.registry.get(image, flipped=flipped)
+        sprite.center_x = column * cell_width + image_width * scaling / 2
+        sprite.center_y = (data.height - row - 1) * cell_height + image_height * scaling / 2
+        if opacity != 1:
+            sprite.alpha = int(opacity * 255)
+        sprite_list.append(sprite)
+
+    return sprite_list
+
+
+def layer_positions(data, layer_name, scaling):
+    """
+    Return an (n, 2) array of where build_layer would put the centers of a
+    layer's sprites, without making them.
+    """
+    cell_width = data.tile_width * scaling
+    cell_height = data.tile_height * scaling
+    positions = [
+        (
+            column * cell_width + image_width * scaling / 2,
+            (data.height - row - 1) * cell_height + image_height * scaling / 2,
+        )
+        for row, column, (_, image_width, image_height), _ in data.placed_tiles(layer_name)
+    ]
+    return np.array(positions, dtype=float).reshape(-1, 2)
+
+
+class Level:
+    """
+    A built level: its map data, and a sprite list and tile grid for each
+    layer. static_chunks holds the sprites of every static layer, drawn a
+    chunk of the world at a time, solids the physics.MergedShapes of every
+    solid layer, and positions where the things of each entity layer start.
+    """
+
+    def __init__(
+        self, number, data, sprite_lists, grids, static_chunks, solids=None, positions=None
+    ):
+        self.number = number
+        self.data = data
+        self.sprite_lists = sprite_lists
+        self.grids = grids
+        self.static_chunks = static_chunks
+        self.solids = solids if solids is not None else {}
+        self.positions = positions if positions is not None else {}
+
+
+class LevelLoader:
+    """
+    Builds the sprites and grids for a level, and can do it ahead of time on a
+    background thread so that switching levels does not stall a frame.
+
+    layers maps each layer name to the use_spatial_hash setting of its
+    SpriteList. The sprites of static_layers, which must never move, are
+    also put together in a chunks.ChunkedLayer, bottom layer first.
+    map_pattern gives the map file of each level number. The tiles of
+    solid_layers, which must not move either, are merged into rectangles
+    to collide with. entity_layers get no sprites at all, only the
+    positions of their tiles.
+    """
+
+    def __init__(
+        self,
+        layers,
+        scaling,
+        static_layers=(),
+        map_pattern=MAP_PATTERN,
+        solid_layers=(),
+        entity_layers=(),
+    ):
+        self.layers = layers
+        self.scaling = scaling
+        self.static_layers = list(static_layers)
+        self.map_pattern = map_pattern
+        self.solid_layers = list(solid_layers)
+        self.entity_layers = list(entity_layers)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._pending = {}
+
+    def exists(self, level):
+        return os.path.exists(self.map_pattern.format(level))
+
+    def build(self, level, data=None, only=None):
+        """
+        Build a level from its map, or from its map data if already read.
+        With only set to some layer names, just those layers are built,
+        and the Level has no static chunks.
+        """
+        if data is None:
+            data = load_level_data(self.map_pattern.format(level))
+        layers = self.layers
+        entity_layers = self.entity_layers
+        if only is not None:
+            layers = {name: value for name, value in layers.items() if name in only}
+            entity_layers = [name for name in entity_layers if name in only]
+
+        sprite_lists = {
+            name: build_layer(data, name, self.scaling, use_spatial_hash)
+            for name, use_spatial_hash in layers.items()
+        }
+        grids = {name: tilegrid.TileGrid(data, name, self.scaling) for name in layers}
+        static_chunks = self.chunk(sprite_lists) if only is None else None
+        solids = {
+            name: physics.MergedShapes(physics.Shapes(sprite_lists[name], grids[name]))
+            for name in self.solid_layers
+            if name in layers
+        }
+        positions = {
+            name: layer_positions(data, name, self.scaling) for name in entity_layers
+        }
+        return Level(level, data, sprite_lists, grids, static_chunks, solids, positions)
+
+    def chunk(self, sprite_lists):
+        """
+        Put the sprites of the static layers in sprite_lists together in a
+        chunks.ChunkedLayer, bottom layer first.
+        """
+        static_chunks = chunks.ChunkedLayer()
+        for name in self.static_layers:
+            static_chunks.extend(sprite_lists[name])
+        return static_chunks
+
+    def prefetch(self, level):
+        """
+        Start building a level in the background. Does nothing if the level
+        does not exist or is already on its way.
+        """
+        if level not in self._pending and self.exists(level):
+            self._pending[level] = self._executor.submit(self.build, level)
+
+    def wait(self, level):
+        """
+        Block until a prefetched level is built.
+        """
+        future = self._pending.get(level)
+        if future is not None:
+            future.result()
+
+    def ready(self, level):
+        """
+        Whether a prefetched level is built, so load() won't block on it.
+        """
+        future = self._pending.get(level)
+        return future is not None and future.done()
+
+    def load(self, level):
+        """
+        Return a built Level. A prefetched level is handed over
+        once and then forgotten, since the game goes on to change its lists.
+        """
+        future = self._pending.pop(level, None)
+        if future is not None:
+            return future.result()
+        return self.build(level)
+
+
+def compile_all():
+    for filename in sorted(glob.glob(MAP_PATTERN.format("*"))):
+        load_level_data(filename)
+        print(f"{filename} -> {compiled_path(filename)}")
+
+
+if __name__ == "__main__":
+    compile_all()
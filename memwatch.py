@@ -0,0 +1,237 @@
+"""
+Memory watchdog
+
+Takes a reading of the game's memory at every level transition: a level
+set up or restarted. A reading holds the resident set size, the sprites
+in each of the game's sprite lists, every sprite and sprite list still
+alive anywhere (so lists a level left behind show up), the size of the
+texture caches, and the lines that have allocated the most since the
+reading before, from tracemalloc.
+
+Memory that keeps growing across transitions is a leak; the soak test
+restarts and changes levels over and over and fails if the resident size
+grew by more than it is allowed to. A disabled watchdog only pays for the
+method call, as the frame profiler does, and tracemalloc is only started
+when it is enabled, since it slows every allocation down.
+"""
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+import arcade
+
+import textures
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Lines of the biggest allocators kept in each reading
+TOP_ALLOCATORS = 5
+# Frames of stack tracemalloc keeps per allocation
+TRACEBACK_FRAMES = 1
+# Most the resident size may grow over a soak test, in MiB
+MAX_GROWTH_MIB = 8.0
+
+MIB = 2 ** 20
+
+
+def resident_size():
+    """
+    The memory this process has resident now, in bytes. Where there is no
+    /proc, the most it has ever had is the best there is; None if even
+    that isn't known.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def live_sprites():
+    """
+    Count the arcade.Sprite and arcade.SpriteList objects alive anywhere.
+    """
+    gc.collect()
+    sprites = 0
+    sprite_lists = 0
+    for obj in gc.get_objects():
+        if isinstance(obj, arcade.Sprite):
+            sprites += 1
+        elif isinstance(obj, arcade.SpriteList):
+            sprite_lists += 1
+    return sprites, sprite_lists
+
+
+def texture_cache_size():
+    """
+    Textures held by arcade's load_texture() cache and by the game's
+    texture registry.
+    """
+    return {
+        "arcade": len(getattr(arcade.load_texture, "texture_cache", ())),
+        "registry": len(textures.registry),
+    }
+
+
+class Reading:
+    def __init__(
+        self,
+        reason,
+        level,
+        frame,
+        rss,
+        lists,
+        sprites,
+        sprite_lists,
+        texture_cache,
+        traced,
+        allocators,
+    ):
+        """
+        lists gives the sprites in each of the game's sprite lists by name,
+        and sprites and sprite_lists how many of each are alive at all.
+        traced is the bytes tracemalloc had traced, and allocators the
+        (line, bytes grown, blocks grown) of the biggest allocators since
+        the last reading.
+        """
+        self.reason = reason
+        self.level = level
+        self.frame = frame
+        self.time = time.time()
+        self.rss = rss
+        self.lists = lists
+        self.sprites = sprites
+        self.sprite_lists = sprite_lists
+        self.texture_cache = texture_cache
+        self.traced = traced
+        self.allocators = allocators
+
+    def summary(self):
+        return {
+            "reason": self.reason,
+            "level": self.level,
+            "frame": self.frame,
+            "rss": self.rss,
+            "lists": self.lists,
+            "sprites": self.sprites,
+            "sprite_lists": self.sprite_lists,
+            "texture_cache": self.texture_cache,
+            "traced": self.traced,
+            "allocators": [
+                {"line": line, "bytes": size, "blocks": count}
+                for line, size, count in self.allocators
+            ],
+        }
+
+    def describe(self):
+        rss = "-" if self.rss is None else f"{self.rss / MIB:.1f} MiB"
+        lists = ", ".join(f"{name} {count}" for name, count in self.lists.items())
+        caches = ", ".join(f"{name} {count}" for name, count in self.texture_cache.items())
+        lines = [
+            f"{self.reason} level {self.level} at frame {self.frame}: RSS {rss}, "
+            f"traced {self.traced / MIB:.1f} MiB, {self.sprites} sprites and "
+            f"{self.sprite_lists} sprite lists alive",
+            f"  lists: {lists}",
+            f"  texture caches: {caches}",
+        ]
+        for line, size, count in self.allocators:
+            lines.append(f"  {size / 1024:+.1f} KiB in {count:+d} blocks: {line}")
+        return lines
+
+
+class MemoryWatchdog:
+    def __init__(self, top=TOP_ALLOCATORS):
+        self.top = top
+        self.enabled = False
+        self.readings = []
+        self._snapshot = None
+        self._started_tracing = False
+
+    def enable(self, enabled=True):
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEBACK_FRAMES)
+            self._started_tracing = True
+        elif not enabled and self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self._snapshot = None
+        self.enabled = enabled
+
+    def reset(self):
+        """
+        Forget every reading so far.
+        """
+        self.readings = []
+        self._snapshot = None
+
+    def record(self, reason, level, frame, lists):
+        """
+        Take a reading at a level transition, given the game's sprite lists
+        by name, and return it, or None if disabled.
+        """
+        if not self.enabled:
+            return None
+        sprites, sprite_lists = live_sprites()
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+        allocators = []
+        if self._snapshot is not None:
+            for stat in snapshot.compare_to(self._snapshot, "lineno")[: self.top]:
+                frame_info = stat.traceback[0]
+                allocators.append(
+                    (
+                        f"{frame_info.filename}:{frame_info.lineno}",
+                        stat.size_diff,
+                        stat.count_diff,
+                    )
+                )
+        self._snapshot = snapshot
+
+        reading = Reading(
+            reason,
+            level,
+            frame,
+            resident_size(),
+            {name: len(sprite_list) for name, sprite_list in lists.items()},
+            sprites,
+            sprite_lists,
+            texture_cache_size(),
+            tracemalloc.get_traced_memory()[0],
+            allocators,
+        )
+        self.readings.append(reading)
+        return reading
+
+    def growth(self, since=0):
+        """
+        How much the resident size, traced memory, live sprites and
+        texture caches grew from the reading numbered since to the last
+        one, or None with fewer than two.
+        """
+        if len(self.readings) - since < 2:
+            return None
+        first = self.readings[since]
+        last = self.readings[-1]
+        return {
+            "rss": None if first.rss is None else last.rss - first.rss,
+            "traced": last.traced - first.traced,
+            "sprites": last.sprites - first.sprites,
+            "sprite_lists": last.sprite_lists - first.sprite_lists,
+            "texture_cache": {
+                name: count - first.texture_cache.get(name, 0)
+                for name, count in last.texture_cache.items()
+            },
+        }
@@ -0,0 +1,610 @@
+"""
+Network state sync
+
+Lets a second copy of the game play along with one that hosts it, over a
+UDP socket on the same machine. The host is authoritative: it runs the
+only simulation, and every SEND_INTERVAL steps sends the guest the state
+of the world. The guest sends back its keys and clicks, which move a
+second player on the host, and the tick of the latest state it has.
+
+States go out as deltas against the latest one the guest has
+acknowledged, which both sides still hold. Positions are sent as whole
+numbers of 1/QUANTUM pixels. For each group of entities (players,
+spiders, bullets and rubies) a state holds:
+
+- a bit for each entity of the base saying whether it is still there
+- a bit for each one still there saying whether it changed, and for
+  those that did, how each field changed, in the narrowest integers that
+  hold every change
+- the entities that are new, in full
+
+and all of it is compressed. A spider frozen off screen or a ruby costs
+a bit or two a state, however big the map is. Without an acknowledged
+base, the host sends the whole state, the same way against nothing.
+
+Messages bigger than a datagram go as fragments, put back together on
+the other side; a state missing a fragment is dropped once a newer one
+is complete, and the guest blends over the gap. The guest draws the world
+INTERPOLATION_DELAY steps behind the latest state it has, between the
+states either side, so it moves smoothly though states come less often
+than frames.
+
+To see what states cost, in bytes per tick and encode and decode time,
+as the number of entities grows, run:
+
+    python bench.py --net
+"""
+import socket
+import struct
+import time
+import zlib
+
+import numpy as np
+
+import timestep
+
+DEFAULT_PORT = 7777
+# Steps between states sent to the guest
+SEND_INTERVAL = 2
+# Steps behind the latest state the guest draws, enough to have a state
+# either side after losing one
+INTERPOLATION_DELAY = 3 * SEND_INTERVAL
+# How far the guest's clock may drift from the latest state before it
+# jumps rather than catches up, in steps, and how much of the drift it
+# takes up each frame
+RESYNC_STEPS = 30
+CATCH_UP = 0.05
+# States each side keeps to decode against. The host only uses a base
+# less than half as old, so the guest still has it.
+HISTORY = 64
+# Positions are sent in units of 1/QUANTUM pixels
+QUANTUM = 8
+# Most message bytes in one datagram, small enough not to be split on
+# the way
+FRAGMENT_SIZE = 1200
+RECEIVE_BUFFER = 1 << 21
+COMPRESS_LEVEL = 1
+
+# Groups of entities in a state, and their fields past the id, in order.
+# x and y are positions; the rest are small whole numbers.
+GROUPS = (
+    ("players", ("x", "y", "face")),
+    ("spiders", ("x", "y", "flipped")),
+    ("bullets", ("x", "y")),
+    ("coins", ()),
+)
+
+# Keys the guest holds down, as bits
+LEFT = 1
+RIGHT = 2
+UP = 4
+DOWN = 8
+
+# Kinds of message
+STATE = 1
+INPUT = 2
+
+MAGIC = b"SI"
+VERSION = 2
+NO_TICK = 0xFFFFFFFF
+
+# magic, version, kind, tick, fragment, fragments
+_DATAGRAM = struct.Struct("<2sBBIHH")
+# tick, base tick, level, epoch, score
+_STATE = struct.Struct("<IIHII")
+# entities added, bytes per field change
+_GROUP = struct.Struct("<IB")
+_WIDTHS = {1: np.dtype("<i1"), 2: np.dtype("<i2"), 4: np.dtype("<i4")}
+_LIMITS = [(width, np.iinfo(_WIDTHS[width])) for width in (1, 2)]
+
+
+def entities(ids, x=None, y=None, *flags):
+    """
+    Return the (ids, values) of a group of a WorldState, from ids in
+    ascending order and each field as a sequence with one per id.
+    """
+    ids = np.asarray(ids, dtype=np.uint32)
+    columns = []
+    if x is not None:
+        columns += [np.round(np.asarray(x, dtype=float) * QUANTUM)]
+        columns += [np.round(np.asarray(y, dtype=float) * QUANTUM)]
+    columns += [np.asarray(values) for values in flags]
+    values = np.zeros((len(ids), len(columns)), dtype=np.int32)
+    for i, column in enumerate(columns):
+        values[:, i] = column
+    return ids, values
+
+
+class WorldState:
+    def __init__(self, tick, level, epoch, score, groups):
+        """
+        groups maps each name in GROUPS to the (ids, values) of its
+        entities: ids a uint32 array in ascending order, and values an
+        int32 array with a row for each id and a column for each field.
+        epoch changes whenever the world is rebuilt or put back, so the
+        guest knows not to blend across it.
+        """
+        self.tick = tick
+        self.level = level
+        self.epoch = epoch
+        self.score = score
+        self.groups = groups
+
+    def same_as(self, other):
+        return (self.tick, self.level, self.epoch, self.score) == (
+            other.tick,
+            other.level,
+            other.epoch,
+            other.score,
+        ) and all(
+            np.array_equal(ids, other.groups[name][0])
+            and np.array_equal(values, other.groups[name][1])
+            for name, (ids, values) in self.groups.items()
+        )
+
+    def naive_size(self):
+        """
+        Bytes the state would take as every entity's position in doubles.
+        """
+        return sum(len(ids) * 16 for ids, _ in self.groups.values())
+
+
+def _empty(fields):
+    return np.zeros(0, dtype=np.uint32), np.zeros((0, fields), dtype=np.int32)
+
+
+def _width(delta):
+    if not delta.size:
+        return 1
+    low, high = delta.min(), delta.max()
+    for width, limits in _LIMITS:
+        if limits.min <= low and high <= limits.max:
+            return width
+    return 4
+
+
+def _members(ids, of):
+    """
+    Which of the ascending ids are also in the ascending array of.
+    """
+    if not len(of):
+        return np.zeros(len(ids), dtype=bool)
+    found = np.minimum(np.searchsorted(of, ids), len(of) - 1)
+    return of[found] == ids
+
+
+def _encode_group(ids, values, base_ids, base_values):
+    if np.array_equal(ids, base_ids):
+        kept = in_base = np.ones(len(ids), dtype=bool)
+    else:
+        kept = _members(base_ids, ids)
+        in_base = _members(ids, base_ids)
+    parts = [np.packbits(kept).tobytes()]
+    width = 1
+    if values.shape[1]:
+        delta = values[in_base].astype(np.int64) - base_values[kept]
+        changed = delta.any(axis=1)
+        delta = delta[changed]
+        width = _width(delta)
+        # A column at a time, so the changes in each field sit together
+        parts += [np.packbits(changed).tobytes(), delta.T.astype(_WIDTHS[width]).tobytes()]
+    added = ~in_base
+    parts += [
+        ids[added].astype("<u4").tobytes(),
+        values[added].T.astype("<i4").tobytes(),
+    ]
+    return _GROUP.pack(int(added.sum()), width) + b"".join(parts)
+
+
+def encode(state, base=None):
+    """
+    Return a WorldState as a message, as changes from the WorldState base
+    or whole if there is none.
+    """
+    body = []
+    for name, fields in GROUPS:
+        ids, values = state.groups[name]
+        base_ids, base_values = _empty(len(fields)) if base is None else base.groups[name]
+        body.append(_encode_group(ids, values, base_ids, base_values))
+    header = _STATE.pack(
+        state.tick,
+        NO_TICK if base is None else base.tick,
+        state.level,
+        state.epoch,
+        state.score,
+    )
+    return header + zlib.compress(b"".join(body), COMPRESS_LEVEL)
+
+
+def _take(body, offset, count, dtype):
+    dtype = np.dtype(dtype)
+    values = np.frombuffer(body, dtype, count, offset)
+    return values, offset + count * dtype.itemsize
+
+
+def _take_bits(body, offset, count):
+    packed, offset = _take(body, offset, (count + 7) // 8, np.uint8)
+    return np.unpackbits(packed, count=count).astype(bool), offset
+
+
+def _decode_group(body, offset, fields, base_ids, base_values):
+    added, width = _GROUP.unpack_from(body, offset)
+    offset += _GROUP.size
+    kept, offset = _take_bits(body, offset, len(base_ids))
+    ids = base_ids[kept]
+    values = base_values[kept].copy()
+    if fields:
+        changed, offset = _take_bits(body, offset, len(ids))
+        count = int(changed.sum())
+        delta, offset = _take(body, offset, count * fields, _WIDTHS[width])
+        values[changed] += delta.reshape(fields, count).T.astype(np.int32)
+    new_ids, offset = _take(body, offset, added, "<u4")
+    new_values, offset = _take(body, offset, added * fields, "<i4")
+    ids = np.concatenate((ids, new_ids.astype(np.uint32)))
+    values = np.concatenate((values, new_values.reshape(fields, added).T.astype(np.int32)))
+    order = np.argsort(ids, kind="stable")
+    return (ids[order], values[order]), offset
+
+
+def decode(message, bases):
+    """
+    Return the WorldState in a message, given the states it may be
+    changes from, by tick. Returns None if its base isn't among them.
+    """
+    tick, base_tick, level, epoch, score = _STATE.unpack_from(message)
+    base = None
+    if base_tick != NO_TICK:
+        base = bases.get(base_tick)
+        if base is None:
+            return None
+    body = zlib.decompress(message[_STATE.size :])
+    groups = {}
+    offset = 0
+    for name, fields in GROUPS:
+        base_ids, base_values = _empty(len(fields)) if base is None else base.groups[name]
+        groups[name], offset = _decode_group(
+            body, offset, len(fields), base_ids, base_values
+        )
+    return WorldState(tick, level, epoch, score, groups)
+
+
+def fragments(kind, tick, message, size=FRAGMENT_SIZE):
+    """
+    Split a message into datagrams of at most size bytes past the header.
+    """
+    count = max(1, -(-len(message) // size))
+    return [
+        _DATAGRAM.pack(MAGIC, VERSION, kind, tick, part, count)
+        + message[part * size : (part + 1) * size]
+        for part in range(count)
+    ]
+
+
+class Reassembler:
+    """
+    Puts messages back together from their fragments, in whatever order
+    they come. A message still missing fragments when a newer one of its
+    kind is complete is dropped, and counted.
+    """
+
+    def __init__(self):
+        self.partial = {}
+        self.dropped = 0
+
+    def add(self, datagram):
+        """
+        Take in a datagram, and return the (kind, tick, message) it
+        completes, or None.
+        """
+        if len(datagram) < _DATAGRAM.size:
+            return None
+        magic, version, kind, tick, part, count = _DATAGRAM.unpack_from(datagram)
+        if magic != MAGIC or version != VERSION or part >= count:
+            return None
+        piece = datagram[_DATAGRAM.size :]
+        if count == 1:
+            return kind, tick, piece
+
+        pieces = self.partial.setdefault((kind, tick), [None] * count)
+        if len(pieces) != count:
+            return None
+        pieces[part] = piece
+        if None in pieces:
+            return None
+        del self.partial[kind, tick]
+        for key in [key for key in self.partial if key[0] == kind and key[1] < tick]:
+            del self.partial[key]
+            self.dropped += 1
+        return kind, tick, b"".join(pieces)
+
+
+class Link:
+    """
+    A non-blocking UDP socket sending messages to one peer. A link with no
+    peer takes the last one to send it anything.
+    """
+
+    def __init__(self, address=("127.0.0.1", 0), peer=None):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            # Room for a whole state of a big map arriving at once
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+        except OSError:
+            pass
+        self.socket.bind(address)
+        self.socket.setblocking(False)
+        self.peer = peer
+        self._learns_peer = peer is None
+        self.reassembler = Reassembler()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.send_failures = 0
+
+    @property
+    def address(self):
+        return self.socket.getsockname()
+
+    def send(self, kind, tick, message):
+        """
+        Send a message, and return the bytes that went.
+        """
+        if self.peer is None:
+            return 0
+        sent = 0
+        for datagram in fragments(kind, tick, message):
+            try:
+                sent += self.socket.sendto(datagram, self.peer)
+            except OSError:
+                # Nobody listening yet, or the buffer is full; the next
+                # state will do
+                self.send_failures += 1
+        self.bytes_sent += sent
+        return sent
+
+    def receive(self):
+        """
+        Return the (kind, tick, message) of every message completed since
+        the last call.
+        """
+        messages = []
+        while True:
+            try:
+                datagram, sender = self.socket.recvfrom(65536)
+            except BlockingIOError:
+                return messages
+            except OSError:
+                # A send of ours bounced; there may be more to read
+                continue
+            self.bytes_received += len(datagram)
+            if self._learns_peer:
+                self.peer = sender
+            elif sender != self.peer:
+                continue
+            message = self.reassembler.add(datagram)
+            if message is not None:
+                messages.append(message)
+
+    def close(self):
+        self.socket.close()
+
+
+class GuestInput:
+    """
+    What the guest sends each frame: the tick of the latest state it has,
+    the keys it holds down, and how many times it has clicked, with where
+    in the world it last did.
+    """
+
+    _FORMAT = struct.Struct("<IBHff")
+
+    def __init__(self, ack=NO_TICK, keys=0, clicks=0, x=0.0, y=0.0):
+        self.ack = ack
+        self.keys = keys
+        self.clicks = clicks
+        self.x = x
+        self.y = y
+
+    def pack(self):
+        return self._FORMAT.pack(self.ack, self.keys, self.clicks, self.x, self.y)
+
+    @classmethod
+    def unpack(cls, message):
+        return cls(*cls._FORMAT.unpack_from(message))
+
+
+class Host:
+    def __init__(self, port=DEFAULT_PORT, address="127.0.0.1", send_interval=SEND_INTERVAL):
+        self.link = Link((address, port))
+        self.send_interval = send_interval
+        # States sent, by tick, and the latest the guest has
+        self.history = {}
+        self.acked = None
+        self.input = GuestInput()
+        self._input_sequence = -1
+
+        self.states = 0
+        self.full_states = 0
+        self.encode_seconds = 0.0
+
+    def due(self, tick):
+        """
+        Whether a state is to be sent on this tick.
+        """
+        return tick % self.send_interval == 0
+
+    def poll(self):
+        """
+        Read what the guest has sent, and return the latest GuestInput.
+        """
+        for kind, sequence, message in self.link.receive():
+            if kind != INPUT or sequence <= self._input_sequence:
+                continue
+            self._input_sequence = sequence
+            self.input = GuestInput.unpack(message)
+            acked = self.history.get(self.input.ack)
+            if acked is not None and (self.acked is None or acked.tick > self.acked.tick):
+                self.acked = acked
+        return self.input
+
+    def base_for(self, state):
+        """
+        The state to send a WorldState as changes from, or None to send it
+        whole.
+        """
+        base = self.acked
+        if (
+            base is None
+            or (base.level, base.epoch) != (state.level, state.epoch)
+            or state.tick - base.tick > HISTORY // 2 * self.send_interval
+        ):
+            return None
+        return base
+
+    def send(self, state):
+        """
+        Send a WorldState to the guest, if there is one yet, and return the
+        bytes that went.
+        """
+        start = time.perf_counter()
+        base = self.base_for(state)
+        message = encode(state, base)
+        self.encode_seconds += time.perf_counter() - start
+
+        self.history[state.tick] = state
+        while len(self.history) > HISTORY:
+            del self.history[next(iter(self.history))]
+        self.states += 1
+        self.full_states += base is None
+        return self.link.send(STATE, state.tick, message)
+
+    def close(self):
+        self.link.close()
+
+
+class Sample:
+    """
+    The world as the guest draws it: for each group, ids and the x and y
+    of each entity in pixels, blended between two states, and the rest of
+    their fields as the later state has them.
+    """
+
+    def __init__(self, level, epoch, score, groups):
+        self.level = level
+        self.epoch = epoch
+        self.score = score
+        self.groups = groups
+
+
+def blend(before, after, alpha):
+    """
+    Return a Sample alpha of the way from one WorldState to the next.
+    Entities only in the later one are where it has them.
+    """
+    groups = {}
+    for name, fields in GROUPS:
+        ids, values = after.groups[name]
+        if not fields:
+            groups[name] = (ids, None, None, values)
+            continue
+        x = values[:, 0] / QUANTUM
+        y = values[:, 1] / QUANTUM
+        old_ids, old_values = before.groups[name]
+        _, old, new = np.intersect1d(old_ids, ids, assume_unique=True, return_indices=True)
+        x[new] = timestep.blend(old_values[old, 0] / QUANTUM, x[new], alpha)
+        y[new] = timestep.blend(old_values[old, 1] / QUANTUM, y[new], alpha)
+        groups[name] = (ids, x, y, values[:, 2:])
+    return Sample(after.level, after.epoch, after.score, groups)
+
+
+class Guest:
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, delay=INTERPOLATION_DELAY):
+        self.link = Link(("", 0), peer=(host, port))
+        self.delay = delay
+        # States decoded, by tick, and the latest of them
+        self.states = {}
+        self.latest = None
+        # The tick being drawn, which runs at the simulation's rate and is
+        # kept delay steps behind the latest state
+        self.render_tick = None
+
+        self.keys = 0
+        self.clicks = 0
+        self.click_x = 0.0
+        self.click_y = 0.0
+        self._sequence = 0
+
+        self.received = 0
+        self.unusable = 0
+        self.decode_seconds = 0.0
+
+    def click(self, x, y):
+        """
+        Fire at a point in the world.
+        """
+        self.clicks = (self.clicks + 1) & 0xFFFF
+        self.click_x = x
+        self.click_y = y
+
+    def poll(self):
+        """
+        Take in the states that have come, then send the host the keys,
+        clicks and latest tick.
+        """
+        for kind, tick, message in self.link.receive():
+            if kind != STATE or (self.latest is not None and tick <= self.latest.tick):
+                continue
+            start = time.perf_counter()
+            state = decode(message, self.states)
+            self.decode_seconds += time.perf_counter() - start
+            if state is None:
+                self.unusable += 1
+                continue
+            self.received += 1
+            self.states[tick] = state
+            while len(self.states) > HISTORY:
+                del self.states[min(self.states)]
+            self.latest = state
+
+        self._sequence += 1
+        ack = NO_TICK if self.latest is None else self.latest.tick
+        guest_input = GuestInput(ack, self.keys, self.clicks, self.click_x, self.click_y)
+        self.link.send(INPUT, self._sequence, guest_input.pack())
+
+    def sample(self, delta_time):
+        """
+        Move the guest's clock on by delta_time seconds and return the
+        Sample to draw, or None before the first state has come.
+        """
+        latest = self.latest
+        if latest is None:
+            return None
+        target = latest.tick - self.delay
+        if self.render_tick is None or abs(target - self.render_tick) > RESYNC_STEPS:
+            self.render_tick = target
+        else:
+            self.render_tick += delta_time * timestep.SIMULATION_RATE
+            self.render_tick += (target - self.render_tick) * CATCH_UP
+        tick = min(self.render_tick, latest.tick)
+
+        # The states either side, of the same world as the latest
+        before = after = None
+        for state_tick in sorted(self.states):
+            state = self.states[state_tick]
+            if (state.level, state.epoch) != (latest.level, latest.epoch):
+                continue
+            if state_tick <= tick:
+                before = state
+            else:
+                after = state
+                break
+        if before is None:
+            before = after
+        if after is None:
+            after = before
+        span = after.tick - before.tick
+        sample = blend(before, after, (tick - before.tick) / span if span else 1.0)
+        sample.score = latest.score
+        return sample
+
+    def close(self):
+        self.link.close()
@@ -0,0 +1,798 @@
+#!/usr/bin/env python
+
+"""
+Batched platformer physics
+
+arcade.PhysicsEnginePlatformer moves one sprite per engine, so a level with
+N spiders runs N engines, each walking the wall list on its own. Here every
+enemy lives in one set of arrays and a single engine moves them all.
+
+The engine follows arcade's _move_sprite step for step (gravity, the
+vertical move and push-out, rounding, then the horizontal move with its
+ramp-up search), and runs each of its loops over every body that still
+needs it at once. Collisions use the same separating-axis test as
+arcade.check_for_collision on the same hit box points, so the result
+matches a per-sprite engine, even against walls merged into rectangles.
+
+Run this file to check that against arcade's engine on every map, and
+time both; tests/test_physics.py checks the same:
+
+    python physics.py
+"""
+import glob
+import random
+import time
+
+import numpy as np
+import pyglet
+
+# The side-by-side check from the command line never opens a window
+if __name__ == "__main__":
+    pyglet.options["shadow_window"] = False
+
+import arcade
+from arcade import physics_engines
+
+import levels
+import textures
+import tilegrid
+
+# Box and shape pairs below which testing every pair beats a grid lookup
+GRID_MIN_PAIRS = 10000
+
+
+def scaled_hit_box(points, scale):
+    """
+    Return hit box points relative to the center as an array, scaled the
+    way arcade scales them in get_adjusted_hit_box.
+    """
+    if not len(points):
+        points = [(0.0, 0.0)]
+    if scale != 1:
+        points = [(x * scale, y * scale) for x, y in points]
+    return np.array(points, dtype=float)
+
+
+class Bodies:
+    """
+    Positions and velocities of bodies that share one hit box, held as
+    arrays. Bodies have no sprites of their own; see SpriteBodies for ones
+    that do.
+
+    If region is set to (left, right, bottom, top), only the bodies whose
+    centers are inside it are moved; the rest stay frozen where they are.
+    """
+
+    def __init__(self, x, y, hit_box):
+        self.region = None
+        self.x = np.array(x, dtype=float)
+        self.y = np.array(y, dtype=float)
+        self.change_x = np.zeros(len(self.x))
+        self.change_y = np.zeros(len(self.x))
+
+        self.hit_box = np.array(hit_box, dtype=float).reshape(-1, 2)
+        self.hit_box_min = self.hit_box.min(axis=0)
+        self.hit_box_max = self.hit_box.max(axis=0)
+
+    def __len__(self):
+        return len(self.x)
+
+    def active(self):
+        """
+        Return the indices of the bodies inside the region, in order.
+        """
+        if self.region is None:
+            return np.arange(len(self.x))
+        left, right, bottom, top = self.region
+        inside = (self.x >= left) & (self.x <= right) & (self.y >= bottom) & (self.y <= top)
+        return np.flatnonzero(inside)
+
+    def bounds(self, index=None):
+        """
+        Return the left, right, bottom and top arrays of every hit box, or
+        of the bodies in index.
+        """
+        x = self.x if index is None else self.x[index]
+        y = self.y if index is None else self.y[index]
+        return (
+            x + self.hit_box_min[0],
+            x + self.hit_box_max[0],
+            y + self.hit_box_min[1],
+            y + self.hit_box_max[1],
+        )
+
+    def points(self, index=None):
+        """
+        Return the (n, k, 2) hit box points of every body, or of the bodies
+        in index.
+        """
+        if index is None:
+            return place(self.hit_box, self.x, self.y)
+        return place(self.hit_box, self.x[index], self.y[index])
+
+    def touching(self, sprite):
+        """
+        Return the indices of the bodies in the region that one sprite
+        collides with, like arcade.check_for_collision_with_list.
+        """
+        self.drop_removed()
+        index = self.active()
+        if not len(index):
+            return index
+        points = np.array([sprite.get_adjusted_hit_box()], dtype=float)
+        body_points = self.points(index)
+        i, j = near_pairs(
+            points.min(axis=1),
+            points.max(axis=1),
+            body_points.min(axis=1),
+            body_points.max(axis=1),
+        )
+        hit = intersecting(points[i], body_points[j])
+        return index[j[hit]]
+
+    def drop_removed(self):
+        """
+        Forget bodies that were removed elsewhere. Plain bodies only go
+        through compact(), so there are none.
+        """
+
+    def compact(self, keep):
+        """
+        Keep only the bodies where keep is set. Subclasses with more arrays
+        extend this.
+        """
+        self.x = self.x[keep]
+        self.y = self.y[keep]
+        self.change_x = self.change_x[keep]
+        self.change_y = self.change_y[keep]
+
+
+class SpriteBodies(Bodies):
+    """
+    Bodies read from the sprites of a list, which stay a view of them:
+    scatter() writes the arrays out to the sprites, and bodies whose
+    sprites are taken out of the list elsewhere are dropped.
+    """
+
+    def __init__(self, sprite_list):
+        self.sprite_list = sprite_list
+        self.sprites = list(sprite_list)
+        if self.sprites:
+            first = self.sprites[0]
+            hit_box = scaled_hit_box(first.get_hit_box(), first.scale)
+        else:
+            hit_box = scaled_hit_box([], 1)
+        count = len(self.sprites)
+        super().__init__(np.zeros(count), np.zeros(count), hit_box)
+        self.gather()
+
+    def touching(self, sprite):
+        """
+        Return the sprites of bodies in the region that one sprite collides
+        with.
+        """
+        return [self.sprites[k] for k in super().touching(sprite).tolist()]
+
+    def gather(self):
+        """
+        Read positions and velocities from the sprites.
+        """
+        for i, sprite in enumerate(self.sprites):
+            self.x[i], self.y[i] = sprite.position
+            self.change_x[i] = sprite.change_x
+            self.change_y[i] = sprite.change_y
+
+    def scatter(self, index=None):
+        """
+        Write positions and velocities out to the sprites, or to the
+        sprites in index.
+        """
+        if index is None:
+            sprites = self.sprites
+            values = self.x, self.y, self.change_x, self.change_y
+        else:
+            sprites = [self.sprites[i] for i in index.tolist()]
+            values = self.x[index], self.y[index], self.change_x[index], self.change_y[index]
+        for sprite, x, y, change_x, change_y in zip(
+            sprites, *(array.tolist() for array in values)
+        ):
+            sprite.position = x, y
+            sprite.change_x = change_x
+            sprite.change_y = change_y
+
+    def drop_removed(self):
+        if len(self.sprite_list) == len(self.sprites):
+            return
+        keep = np.fromiter(
+            (bool(sprite.sprite_lists) for sprite in self.sprites),
+            dtype=bool,
+            count=len(self.sprites),
+        )
+        self.compact(keep)
+
+    def compact(self, keep):
+        super().compact(keep)
+        self.sprites = [sprite for sprite, kept in zip(self.sprites, keep) if kept]
+
+
+class Subset:
+    """
+    Some of the bodies of a Bodies, copied out so an engine can move just
+    them. write_back() copies them in again.
+    """
+
+    def __init__(self, bodies, index):
+        self.bodies = bodies
+        self.index = index
+        self.hit_box = bodies.hit_box
+        self.hit_box_min = bodies.hit_box_min
+        self.hit_box_max = bodies.hit_box_max
+        self.x = bodies.x[index]
+        self.y = bodies.y[index]
+        self.change_x = bodies.change_x[index]
+        self.change_y = bodies.change_y[index]
+
+    def __len__(self):
+        return len(self.index)
+
+    def write_back(self):
+        self.bodies.x[self.index] = self.x
+        self.bodies.y[self.index] = self.y
+        self.bodies.change_x[self.index] = self.change_x
+        self.bodies.change_y[self.index] = self.change_y
+
+
+# The order arcade tries directions in when a sprite starts inside a wall
+_CIRCULAR_STEPS = ((0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1))
+
+
+def _round2(values):
+    """
+    round(value, 2) for every value. NumPy rounds by scaling, which can land
+    on the other side of a half from Python's correctly rounded round(), so
+    values that close to a half are redone in Python.
+    """
+    scaled = values * 100
+    rounded = np.round(values, 2)
+    close = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(close).tolist():
+        rounded[i] = round(float(values[i]), 2)
+    return rounded
+
+
+def edge_normals(points):
+    """
+    Normals of the edges of (..., k, 2) polygons, unnormalised, the way
+    arcade computes them.
+    """
+    following = np.roll(points, -1, axis=-2)
+    return np.stack(
+        (
+            following[..., 1] - points[..., 1],
+            points[..., 0] - following[..., 0],
+        ),
+        axis=-1,
+    )
+
+
+def place(hit_box, x, y):
+    """
+    Return (n, k, 2) points of a shared hit box placed at every (x, y).
+    """
+    points = np.empty((len(x), len(hit_box), 2))
+    points[..., 0] = hit_box[None, :, 0] + x[:, None]
+    points[..., 1] = hit_box[None, :, 1] + y[:, None]
+    return points
+
+
+def intersecting(points_a, points_b, normals_b=None):
+    """
+    The separating-axis test of arcade's are_polygons_intersecting, for
+    pairs of polygons: points_a[i] against points_b[i]. Polygons touching
+    along an edge do not intersect.
+    """
+    if normals_b is None:
+        normals_b = edge_normals(points_b)
+    axes = np.concatenate((edge_normals(points_a), normals_b), axis=1)
+    projected_a = (
+        axes[:, :, None, 0] * points_a[:, None, :, 0]
+        + axes[:, :, None, 1] * points_a[:, None, :, 1]
+    )
+    projected_b = (
+        axes[:, :, None, 0] * points_b[:, None, :, 0]
+        + axes[:, :, None, 1] * points_b[:, None, :, 1]
+    )
+    separated = (projected_a.max(axis=2) <= projected_b.min(axis=2)) | (
+        projected_b.max(axis=2) <= projected_a.min(axis=2)
+    )
+    # Padded points give zero-length edges, which separate nothing
+    separated &= (axes != 0).any(axis=2)
+    return ~separated.any(axis=1)
+
+
+def near_pairs(a_min, a_max, b_min, b_max):
+    """
+    Broadphase: (i, j) index arrays of the boxes in a and b whose bounds
+    overlap or touch.
+    """
+    near = (
+        (a_min[:, None, 0] <= b_max[None, :, 0])
+        & (a_max[:, None, 0] >= b_min[None, :, 0])
+        & (a_min[:, None, 1] <= b_max[None, :, 1])
+        & (a_max[:, None, 1] >= b_min[None, :, 1])
+    )
+    return np.nonzero(near)
+
+
+class Shapes:
+    """
+    The adjusted hit boxes of every sprite in a list whose sprites do not
+    move, as one (n, k, 2) array. Sprites may be removed from the list,
+    which the next query picks up. Indices into the arrays stay the same for
+    the life of the Shapes.
+
+    With a tilegrid.TileGrid for the same layer, the broadphase is a grid
+    lookup instead of a test against every shape, once there are enough
+    boxes and shapes for it to pay.
+    """
+
+    def __init__(self, sprite_list, grid=None):
+        self.sprite_list = sprite_list
+        self.grid = grid
+        self.sprites = list(sprite_list)
+        if grid is not None and len(grid) != len(self.sprites):
+            raise ValueError(
+                f"Grid has {len(grid)} tiles but the layer has {len(self.sprites)} sprites"
+            )
+
+        hit_boxes = [list(sprite.get_adjusted_hit_box()) for sprite in self.sprites]
+        # Hit boxes with fewer points are padded by repeating the last one
+        sides = max((len(points) for points in hit_boxes), default=4)
+        self.points = np.zeros((len(hit_boxes), sides, 2))
+        for i, points in enumerate(hit_boxes):
+            self.points[i] = points + [points[-1]] * (sides - len(points))
+        self.min = self.points.min(axis=1)
+        self.max = self.points.max(axis=1)
+        self.normals = edge_normals(self.points)
+
+        self.present = np.ones(len(self.sprites), dtype=bool)
+        self.count = len(self.sprites)
+
+    def __len__(self):
+        return self.count
+
+    def refresh(self):
+        """
+        Drop shapes whose sprites have been taken out of the sprite list.
+        """
+        if len(self.sprite_list) == self.count:
+            return
+        present = np.fromiter(
+            (bool(sprite.sprite_lists) for sprite in self.sprites),
+            dtype=bool,
+            count=len(self.sprites),
+        )
+        gone = np.flatnonzero(self.present & ~present)
+        self.present = present
+        self.count = int(present.sum())
+        if self.grid is not None:
+            self.grid.remove(gone)
+
+    def restore(self, present):
+        """
+        Bring back the sprites of the shapes where present is set, and take
+        out the rest, as refresh() found them at the time. Returns the
+        sprites put back into the sprite list, for any other lists that
+        show them.
+        """
+        self.refresh()
+        for i in np.flatnonzero(self.present & ~present).tolist():
+            self.sprites[i].remove_from_sprite_lists()
+        self.refresh()
+
+        back = np.flatnonzero(present & ~self.present)
+        sprites = [self.sprites[i] for i in back.tolist()]
+        self.sprite_list.extend(sprites)
+        self.present[back] = True
+        self.count = int(self.present.sum())
+        if self.grid is not None:
+            self.grid.restore(back)
+        return sprites
+
+    def candidates(self, mins, maxs):
+        """
+        Broadphase: (i, j) index arrays of boxes whose bounds touch shape j.
+        """
+        if self.grid is not None and len(mins) * len(self.min) > GRID_MIN_PAIRS:
+            return self.grid.pairs(mins, maxs)
+        i, j = near_pairs(mins, maxs, self.min, self.max)
+        keep = self.present[j]
+        return i[keep], j[keep]
+
+    def hits(self, points):
+        """
+        Return (i, j) index arrays of which of the (n, k, 2) polygons in
+        points intersect which of these shapes.
+        """
+        self.refresh()
+        if not len(points) or not self.count:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        i, j = self.candidates(points.min(axis=1), points.max(axis=1))
+        hit = intersecting(points[i], self.points[j], self.normals[j])
+        return i[hit], j[hit]
+
+    def touching(self, sprite):
+        """
+        Return the sprites one sprite collides with, like
+        arcade.check_for_collision_with_list.
+        """
+        points = np.array([sprite.get_adjusted_hit_box()], dtype=float)
+        _, hit = self.hits(points)
+        return [self.sprites[j] for j in hit.tolist()]
+
+
+def rect_sprite(left, bottom, width, height):
+    """
+    Return an invisible sprite that is only a rectangular hit box, for
+    colliding with. Without a texture, arcade makes the hit box from the
+    width and height.
+    """
+    sprite = arcade.Sprite()
+    sprite.width = width
+    sprite.height = height
+    sprite.position = left + width / 2, bottom + height / 2
+    return sprite
+
+
+class MergedShapes(Shapes):
+    """
+    The Shapes of a static layer with its tiles merged into a few big
+    rectangles, for collisions only; the layer's own sprites are still the
+    ones drawn. A long floor becomes one shape instead of dozens, so there
+    are fewer broadphase candidates and polygon tests.
+
+    Tiles whose hit box is exactly their cell are merged, and cover the
+    same ground either way, so nothing collides differently. Any other
+    tile is kept as it is. The sprites are the invisible rectangles, and
+    sprite_list holds them for arcade's engine.
+    """
+
+    def __init__(self, shapes):
+        grid = shapes.grid
+        left = grid.locations[:, 1] * grid.cell_width
+        bottom = grid.locations[:, 0] * grid.cell_height
+        whole = np.zeros(len(grid), dtype=bool)
+        if shapes.points.shape[1] == 4:
+            x = shapes.points[..., 0]
+            y = shapes.points[..., 1]
+            right = x == (left + grid.cell_width)[:, None]
+            top = y == (bottom + grid.cell_height)[:, None]
+            on_corner = (right | (x == left[:, None])) & (top | (y == bottom[:, None]))
+            # All four corners, once each
+            corners = np.sort(right * 1 + top * 2, axis=1)
+            whole = on_corner.all(axis=1) & (corners == np.arange(4)).all(axis=1)
+
+        merged = tilegrid.MergedGrid(grid, whole)
+        sprite_list = arcade.SpriteList(use_spatial_hash=True)
+        for (row, column, rows, columns), tile in zip(
+            merged.rects.tolist(), merged.tiles.tolist()
+        ):
+            if tile != tilegrid.EMPTY:
+                sprite_list.append(shapes.sprites[tile])
+            else:
+                sprite_list.append(
+                    rect_sprite(
+                        column * grid.cell_width,
+                        row * grid.cell_height,
+                        columns * grid.cell_width,
+                        rows * grid.cell_height,
+                    )
+                )
+        super().__init__(sprite_list, merged)
+
+
+class LadderPlatformerEngine(arcade.PhysicsEnginePlatformer):
+    """
+    arcade's platformer engine with its ladder check answered from the
+    ladder layer's Shapes. Platforms are static tiles, so update() skips
+    arcade's pass over every platform looking for moving ones, which would
+    cost more the bigger the map.
+    """
+
+    def __init__(self, player_sprite, platforms, gravity_constant, ladders):
+        super().__init__(
+            player_sprite, platforms, gravity_constant, ladders=ladders.sprite_list
+        )
+        self.ladder_shapes = ladders
+
+    def is_on_ladder(self):
+        return bool(self.ladder_shapes.touching(self.player_sprite))
+
+    def update(self):
+        if not self.is_on_ladder():
+            self.player_sprite.change_y -= self.gravity_constant
+        return physics_engines._move_sprite(self.player_sprite, self.platforms, ramp_up=True)
+
+
+class BatchPlatformerEngine:
+    """
+    One platformer engine for every body in a Bodies, against the Shapes
+    of a wall layer. Walls are treated as static, as they are by the
+    player's engine.
+
+    Bodies outside the region of the Bodies are left where they are.
+    """
+
+    def __init__(self, bodies, walls, gravity_constant=0.5):
+        self.bodies = bodies
+        self.walls = walls
+        self.gravity_constant = gravity_constant
+
+    def _candidates(self, x, y):
+        """
+        Broadphase: pairs of (body position in x/y, wall) whose bounds
+        touch.
+        """
+        bodies = self.bodies
+        body_min = np.stack((x + bodies.hit_box_min[0], y + bodies.hit_box_min[1]), axis=1)
+        body_max = np.stack((x + bodies.hit_box_max[0], y + bodies.hit_box_max[1]), axis=1)
+        return self.walls.candidates(body_min, body_max)
+
+    def _intersecting(self, x, y, walls):
+        """
+        Narrowphase: bodies at (x, y) against the matching walls.
+        """
+        return intersecting(
+            place(self.bodies.hit_box, x, y),
+            self.walls.points[walls],
+            self.walls.normals[walls],
+        )
+
+    def colliding(self, x, y):
+        """
+        Return which of the bodies placed at (x, y) would touch a wall.
+        """
+        result = np.zeros(len(x), dtype=bool)
+        if not len(x) or not len(self.walls):
+            return result
+        pair_body, pair_wall = self._candidates(x, y)
+        if len(pair_body):
+            hits = self._intersecting(x[pair_body], y[pair_body], pair_wall)
+            result[pair_body[hits]] = True
+        return result
+
+    def _hit_pairs(self, x, y):
+        if not len(self.walls):
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        pair_body, pair_wall = self._candidates(x, y)
+        hits = self._intersecting(x[pair_body], y[pair_body], pair_wall)
+        return pair_body[hits], pair_wall[hits]
+
+    def _circular_check(self, stuck):
+        """
+        arcade's way out of starting a move inside a wall: try ever further
+        steps in eight directions until one is clear.
+        """
+        bodies = self.bodies
+        original_x = bodies.x[stuck]
+        original_y = bodies.y[stuck]
+        remaining = np.arange(len(stuck))
+        vary = 1
+        while len(remaining):
+            for step_x, step_y in _CIRCULAR_STEPS:
+                x = original_x[remaining] + step_x * vary
+                y = original_y[remaining] + step_y * vary
+                clear = ~self.colliding(x, y)
+                bodies.x[stuck[remaining[clear]]] = x[clear]
+                bodies.y[stuck[remaining[clear]]] = y[clear]
+                remaining = remaining[~clear]
+                if not len(remaining):
+                    break
+            vary *= 2
+
+    def update(self):
+        self.bodies.drop_removed()
+        if self.bodies.region is None:
+            self._step()
+            return
+
+        # Only bodies in the region move
+        subset = Subset(self.bodies, self.bodies.active())
+        BatchPlatformerEngine(subset, self.walls, self.gravity_constant)._step()
+        subset.write_back()
+
+    def _step(self):
+        bodies = self.bodies
+        count = len(bodies)
+        if not count:
+            return
+
+        # Gravity; enemies never hold on to ladders
+        bodies.change_y -= self.gravity_constant
+
+        # Anything that starts inside a wall is nudged out first
+        stuck = np.flatnonzero(self.colliding(bodies.x, bodies.y))
+        if len(stuck):
+            self._circular_check(stuck)
+
+        original_x = bodies.x.copy()
+        original_y = bodies.y.copy()
+
+        # --- Move in the y direction
+        bodies.y += bodies.change_y
+        hit_body, hit_wall = self._hit_pairs(bodies.x, bodies.y)
+        hit = np.zeros(count, dtype=bool)
+        hit[hit_body] = True
+
+        # Hitting a ceiling: back down a pixel at a time
+        rising = np.flatnonzero(hit & (bodies.change_y > 0))
+        while len(rising):
+            still = self.colliding(bodies.x[rising], bodies.y[rising])
+            rising = rising[still]
+            bodies.y[rising] -= 1
+
+        # Landing: climb out of the floor tiles we sank into
+        falling = hit & (bodies.change_y < 0)
+        keep = falling[hit_body]
+        hit_body, hit_wall = hit_body[keep], hit_wall[keep]
+        while len(hit_body):
+            still = self._intersecting(bodies.x[hit_body], bodies.y[hit_body], hit_wall)
+            hit_body, hit_wall = hit_body[still], hit_wall[still]
+            bodies.y[np.unique(hit_body)] += 0.25
+
+        # Walls never move, so a hit always stops vertical motion
+        bodies.change_y[hit] = 0.0
+        bodies.y = _round2(bodies.y)
+
+        # --- Move in the x direction
+        moving = np.flatnonzero(bodies.change_x != 0)
+        if len(moving):
+            self._move_x(moving, original_x[moving], original_y[moving])
+
+    def _move_x(self, index, original_x, original_y):
+        """
+        arcade's horizontal move: a search for the furthest step that does
+        not hit a wall, trying to ramp up over anything in the way.
+        """
+        bodies = self.bodies
+        almost_original_y = bodies.y[index].copy()
+        direction = np.copysign(1, bodies.change_x[index])
+        cur_x_change = np.abs(bodies.change_x[index])
+        upper_bound = cur_x_change.copy()
+        lower_bound = np.zeros(len(index))
+        cur_y_change = np.zeros(len(index))
+        y = almost_original_y.copy()
+
+        active = np.arange(len(index))
+        while len(active):
+            x = original_x[active] + cur_x_change[active] * direction[active]
+            collided = self.colliding(x, y[active])
+
+            # Clear: keep the step and narrow the search upward
+            clear = active[~collided]
+            lower_bound[clear] = cur_x_change[clear]
+            done = upper_bound[clear] - lower_bound[clear] <= 1
+            cur_x_change[clear[~done]] = (upper_bound[clear[~done]] + lower_bound[clear[~done]]) / 2
+            finished = [clear[done]]
+
+            # Blocked: see if stepping up as far as we went across gets
+            # us over it
+            blocked = active[collided]
+            cur_y_change[blocked] = cur_x_change[blocked]
+            y[blocked] = original_y[blocked] + cur_y_change[blocked]
+            x_blocked = original_x[blocked] + cur_x_change[blocked] * direction[blocked]
+            ramp_hit = self.colliding(x_blocked, y[blocked])
+            cur_y_change[blocked[ramp_hit]] -= cur_x_change[blocked[ramp_hit]]
+
+            # It does, so come back down until just before touching
+            ramping = blocked[~ramp_hit]
+            ramp_x = x_blocked[~ramp_hit]
+            lowering = np.arange(len(ramping))
+            while len(lowering):
+                lowering = lowering[cur_y_change[ramping[lowering]] > 0]
+                if not len(lowering):
+                    break
+                cur_y_change[ramping[lowering]] -= 1
+                y[ramping[lowering]] = (
+                    almost_original_y[ramping[lowering]] + cur_y_change[ramping[lowering]]
+                )
+                touching = self.colliding(ramp_x[lowering], y[ramping[lowering]])
+                lowering = lowering[~touching]
+            cur_y_change[ramping] += 1
+            finished.append(ramping)
+
+            # Still blocked: narrow the search downward
+            stuck = blocked[ramp_hit]
+            upper_bound[stuck] = cur_x_change[stuck] - 1
+            done = upper_bound[stuck] - lower_bound[stuck] <= 1
+            cur_x_change[stuck[done]] = lower_bound[stuck[done]]
+            cur_x_change[stuck[~done]] = (upper_bound[stuck[~done]] + lower_bound[stuck[~done]]) / 2
+            finished.append(stuck[done])
+
+            finished = np.concatenate(finished)
+            keep = np.ones(len(index), dtype=bool)
+            keep[finished] = False
+            active = active[keep[active]]
+
+        bodies.x[index] = original_x + cur_x_change * direction
+        bodies.y[index] = almost_original_y + cur_y_change
+
+
+def side_by_side(filename, walls_layer, make_spiders, scaling, speed, gravity, frames=300, seed=1):
+    """
+    Run the batched engine and one arcade engine per spider side by side on
+    a map, from the same random starting velocities. walls_layer names the
+    map's wall layer, and make_spiders(data) returns new sprites where the
+    map's spiders start, given its levels.LevelData. scaling is the tile
+    scaling, speed how fast spiders walk and gravity the engines' gravity.
+
+    Returns the spider, wall and merged rectangle counts, the largest
+    difference in position seen, and the seconds per frame each engine
+    took.
+    """
+    data = levels.load_level_data(filename)
+    walls = levels.build_layer(data, walls_layer, scaling, True)
+    grid = tilegrid.TileGrid(data, walls_layer, scaling)
+    spiders = [make_spiders(data) for _ in range(2)]
+    rng = random.Random(seed)
+    for a, b in zip(*spiders):
+        a.change_x = b.change_x = rng.choice((-1, 1)) * speed
+        a.change_y = b.change_y = rng.uniform(-2, 4)
+
+    engines = [arcade.PhysicsEnginePlatformer(spider, walls, gravity) for spider in spiders[0]]
+    bodies = SpriteBodies(spiders[1])
+    rects = MergedShapes(Shapes(walls, grid))
+    batch = BatchPlatformerEngine(bodies, rects, gravity)
+
+    single_time = batch_time = 0.0
+    worst = 0.0
+    for _ in range(frames):
+        start = time.perf_counter()
+        for engine in engines:
+            engine.update()
+        single_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch.update()
+        batch_time += time.perf_counter() - start
+
+        for spider, x, y in zip(spiders[0], bodies.x, bodies.y):
+            worst = max(worst, abs(spider.center_x - x), abs(spider.center_y - y))
+
+    return {
+        "spiders": len(engines),
+        "walls": len(walls),
+        "rectangles": len(rects),
+        "difference": worst,
+        "single_time": single_time / frames,
+        "batch_time": batch_time / frames,
+    }
+
+
+def _compare(*settings, frames=300, seed=1):
+    """
+    Run both engines side by side on every map, given the settings
+    side_by_side() takes after the map, and report how far apart they end
+    up and how long each took.
+    """
+    textures.registry.preload()
+    worst = 0.0
+    for filename in sorted(glob.glob(levels.MAP_PATTERN.format("*"))):
+        result = side_by_side(filename, *settings, frames=frames, seed=seed)
+        worst = max(worst, result["difference"])
+        print(
+            f"{filename}: {result['spiders']} spiders, {result['walls']} walls in "
+            f"{result['rectangles']} rectangles, max difference {result['difference']:.6f}, "
+            f"{result['single_time'] * 1000:.3f} ms per-spider engines, "
+            f"{result['batch_time'] * 1000:.3f} ms batched"
+        )
+    return worst
+
+
+if __name__ == "__main__":
+    # The game's own layers and numbers, from the game, which is only
+    # imported to run the check
+    import run_game
+
+    worst = _compare(*run_game.physics_check_settings())
+    raise SystemExit(0 if worst < 1e-6 else 1)
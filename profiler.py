@@ -0,0 +1,182 @@
+"""
+Frame profiler
+
+Times each phase of a frame with a lap timer: the game calls lap() after
+each phase, and the time since the previous lap is charged to that phase.
+A rolling window of frames gives p50/p95/p99 per phase for the overlay,
+and every frame can also be written to a CSV file, tagged with the level
+and entity counts.
+
+A disabled profiler only pays for the method calls, so the laps stay in
+the game loop for good.
+"""
+import csv
+import time
+
+import arcade
+import numpy as np
+
+# Frames of history the percentiles are taken over
+DEFAULT_WINDOW = 300
+PERCENTILES = (50, 95, 99)
+# Frames between refreshes of the overlay text
+OVERLAY_REFRESH = 30
+
+
+class FrameProfiler:
+    def __init__(self, phases, window=DEFAULT_WINDOW):
+        self.phases = list(phases)
+        self._phase_index = {name: i for i, name in enumerate(self.phases)}
+        self.enabled = False
+
+        # Seconds per phase of the last `window` frames, as a ring buffer
+        self.history = np.zeros((window, len(self.phases)))
+        self.frames = 0
+
+        self._current = [0.0] * len(self.phases)
+        self._tags = None
+        self._last = 0.0
+
+        self._csv_file = None
+        self._csv = None
+
+    def reset(self):
+        """
+        Forget every frame recorded so far.
+        """
+        self.history[:] = 0
+        self.frames = 0
+        self._tags = None
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+        # Don't count a frame that was only partly timed
+        self._tags = None
+
+    def begin_frame(self, **tags):
+        """
+        Start timing a new frame, and record the one before it. tags (such
+        as the level and entity counts) are written with the frame's row.
+        """
+        if not self.enabled:
+            return
+        if self._tags is not None:
+            self._record()
+        self._current = [0.0] * len(self.phases)
+        self._tags = tags
+        self._last = time.perf_counter()
+
+    def start(self):
+        """
+        Restart the lap timer, so time since the last lap is not counted.
+        """
+        if self.enabled:
+            self._last = time.perf_counter()
+
+    def lap(self, phase):
+        """
+        Charge the time since the last lap to a phase.
+        """
+        if self.enabled:
+            now = time.perf_counter()
+            self._current[self._phase_index[phase]] += now - self._last
+            self._last = now
+
+    def _record(self):
+        self.history[self.frames % len(self.history)] = self._current
+        if self._csv is not None:
+            if self._csv_file.tell() == 0:
+                self._csv.writerow(
+                    [
+                        "frame",
+                        *self._tags,
+                        *(f"{name}_ms" for name in self.phases),
+                        "total_ms",
+                    ]
+                )
+            self._csv.writerow(
+                [
+                    self.frames,
+                    *self._tags.values(),
+                    *(f"{seconds * 1000:.4f}" for seconds in self._current),
+                    f"{sum(self._current) * 1000:.4f}",
+                ]
+            )
+        self.frames += 1
+
+    def percentiles(self):
+        """
+        Return {phase: [p50, p95, p99]} in milliseconds over the frames in
+        the window, with the whole frame as "total".
+        """
+        count = min(self.frames, len(self.history))
+        if not count:
+            return {}
+        window = self.history[:count]
+        frames = np.column_stack((window, window.sum(axis=1)))
+        values = np.percentile(frames, PERCENTILES, axis=0) * 1000
+        return {
+            name: values[:, i].tolist()
+            for i, name in enumerate(self.phases + ["total"])
+        }
+
+    def report(self):
+        """
+        Return the percentiles as lines of text.
+        """
+        lines = ["phase           " + "".join(f"   p{p:<3}" for p in PERCENTILES)]
+        for name, values in self.percentiles().items():
+            lines.append(f"{name:<16}" + "".join(f"{v:7.2f}" for v in values))
+        return lines
+
+    def open_csv(self, filename):
+        """
+        Write every frame recorded from now on to a CSV file, in
+        milliseconds.
+        """
+        self.close_csv()
+        self._csv_file = open(filename, "w", newline="")
+        self._csv = csv.writer(self._csv_file)
+
+    def close_csv(self):
+        if self._csv_file is not None:
+            if self._tags is not None:
+                self._record()
+                self._tags = None
+            self._csv_file.close()
+            self._csv_file = None
+            self._csv = None
+
+
+class ProfilerOverlay:
+    """
+    Draws a profiler's report in the top left corner of the screen. The
+    text image is only made again every OVERLAY_REFRESH frames.
+    """
+
+    def __init__(self, profiler, x, top, font_size=12):
+        self.profiler = profiler
+        self.x = x
+        self.top = top
+        self.font_size = font_size
+        self.sprite_list = None
+        self._refreshed_at = None
+
+    def draw(self):
+        frames = self.profiler.frames
+        if self._refreshed_at is None or frames - self._refreshed_at >= OVERLAY_REFRESH:
+            self._refreshed_at = frames
+            image = arcade.get_text_image(
+                "\n".join(self.profiler.report()),
+                arcade.color.WHITE,
+                self.font_size,
+                font_name=("courier new", "courier", "dejavu sans mono", "mono"),
+                background_color=(0, 0, 0, 160),
+            )
+            sprite = arcade.Sprite()
+            sprite.texture = arcade.Texture(f"profiler:{frames}", image)
+            sprite.center_x = self.x + image.width / 2
+            sprite.center_y = self.top - image.height / 2
+            self.sprite_list = arcade.SpriteList()
+            self.sprite_list.append(sprite)
+        self.sprite_list.draw()
@@ -0,0 +1,162 @@
+"""
+Session recording and replay
+
+A session is everything needed to play a game again exactly: the seed of
+the game's random number generator, the level it started on, every input
+event with the frame it came in before, and a checksum of the game state
+after every frame. Replaying feeds the same events in on the same frames
+and compares the checksums, so the first frame that comes out different
+is caught as it happens.
+
+Sessions are saved as small binary files.
+"""
+import array
+import struct
+import sys
+
+import arcade
+
+_MAGIC = b"SIRP"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHQHII")
+_KEY_EVENT = struct.Struct("<IBi")
+_CLICK_EVENT = struct.Struct("<IBdd")
+_ACTIONS = ["press", "release", "click"]
+
+
+class InputEvent:
+    """
+    One input event. press and release take a key, either an arcade.key
+    name or its code; click takes the mouse x and y.
+    """
+
+    def __init__(self, frame, action, args):
+        self.frame = frame
+        self.action = action
+        self.args = args
+
+    def apply(self, game):
+        if self.action in ("press", "release"):
+            key = self.args[0]
+            if isinstance(key, str):
+                key = getattr(arcade.key, key)
+            if self.action == "press":
+                game.on_key_press(key, 0)
+            else:
+                game.on_key_release(key, 0)
+        elif self.action == "click":
+            x, y = self.args
+            game.on_mouse_press(float(x), float(y), arcade.MOUSE_BUTTON_LEFT, 0)
+        else:
+            raise ValueError(f"Unknown input action: {self.action}")
+
+
+class Session:
+    def __init__(self, seed, level, events=None, checksums=None):
+        self.seed = seed
+        self.level = level
+        self.events = events if events is not None else []
+        # One per frame played
+        self.checksums = checksums if checksums is not None else array.array("I")
+
+    @property
+    def frames(self):
+        return len(self.checksums)
+
+    def record(self, frame, action, *args):
+        self.events.append(InputEvent(frame, action, args))
+
+    def record_checksum(self, checksum):
+        self.checksums.append(checksum)
+
+    def save(self, filename):
+        parts = [
+            _HEADER.pack(
+                _MAGIC, _VERSION, self.seed, self.level, len(self.events), self.frames
+            )
+        ]
+        for event in self.events:
+            code = _ACTIONS.index(event.action)
+            if event.action == "click":
+                x, y = event.args
+                parts.append(_CLICK_EVENT.pack(event.frame, code, float(x), float(y)))
+            else:
+                key = event.args[0]
+                if isinstance(key, str):
+                    key = getattr(arcade.key, key)
+                parts.append(_KEY_EVENT.pack(event.frame, code, key))
+
+        checksums = self.checksums
+        if sys.byteorder != "little":
+            checksums = array.array("I", checksums)
+            checksums.byteswap()
+        parts.append(checksums.tobytes())
+
+        with open(filename, "wb") as f:
+            f.write(b"".join(parts))
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "rb") as f:
+            raw = f.read()
+
+        magic, version, seed, level, event_count, frames = _HEADER.unpack_from(raw, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"'{filename}' is not a recorded session")
+        offset = _HEADER.size
+
+        events = []
+        for _ in range(event_count):
+            action = _ACTIONS[raw[offset + 4]]
+            layout = _CLICK_EVENT if action == "click" else _KEY_EVENT
+            frame, _, *args = layout.unpack_from(raw, offset)
+            offset += layout.size
+            events.append(InputEvent(frame, action, args))
+
+        checksums = array.array("I")
+        checksums.frombytes(raw[offset : offset + frames * checksums.itemsize])
+        if sys.byteorder != "little":
+            checksums.byteswap()
+
+        return cls(seed, level, events, checksums)
+
+
+class Replay:
+    """
+    Feeds a list of events sorted by frame back into a game, and checks the
+    game's state against recorded checksums if there are any.
+    """
+
+    def __init__(self, events, checksums=None):
+        self.events = events
+        self.checksums = checksums
+        self.diverged_at = None
+        self._next_event = 0
+
+    @classmethod
+    def of_session(cls, session):
+        return cls(session.events, session.checksums)
+
+    def apply_due(self, game, frame):
+        """
+        Apply every event that came in before the given frame.
+        """
+        while (
+            self._next_event < len(self.events)
+            and self.events[self._next_event].frame <= frame
+        ):
+            self.events[self._next_event].apply(game)
+            self._next_event += 1
+
+    def check(self, frame, checksum):
+        """
+        Compare the state after a frame with the recording. Returns False
+        if they differ, and remembers the first frame that did.
+        """
+        if self.checksums is None or frame >= len(self.checksums):
+            return True
+        if self.checksums[frame] == checksum:
+            return True
+        if self.diverged_at is None:
+            self.diverged_at = frame
+        return False
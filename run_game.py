@@ -3,11 +3,39 @@
 """
 Spider Island
 """
+import argparse
 import random
 import os
+import struct
+import time
+import zlib
 
 import arcade
 import math
+import numpy as np
+
+import audio
+import bullets
+import camera
+import flowfield
+import hotreload
+import levels
+import memwatch
+import netsync
+import physics
+import profiler
+import replay
+import scheduler
+import snapshot
+import spriteview
+import startup
+import swarm
+import telemetry
+import textures
+import timestep
+
+# Played on the start screen, if it is there
+OPENING_SONG = "sounds/opening.wav"
 
 # Window constants
 SCREEN_WIDTH = 1000
@@ -21,7 +49,7 @@ COIN_SCALING = 0.0594
 TILE_SCALING = 0.5
 BULLET_SCALING = 0.5
 
-# Speed
+# Speed, in pixels per simulation step
 NORMAL_SPEED = 2
 WATER_SPEED = 1
 
@@ -40,17 +68,159 @@ BULLET_SPEED = NORMAL_BULLET_SPEED
 SPIDER_SPEED = 2
 SPIDER_CLIMB_SPEED = 1
 
+# Most bullets in flight at once; firing more recycles the oldest
+BULLET_POOL_SIZE = 256
+
+# Map layers with sprites, and whether their sprite lists use a spatial
+# hash. None need one, since collisions go through physics.Shapes.
+PLATFORMS_LAYER = "Platforms"
+COINS_LAYER = "Coins"
+SPIDERS_LAYER = "Spiders"
+LADDERS_LAYER = "Ladders"
+WATER_LAYER = "Water"
+MAP_LAYERS = {
+    PLATFORMS_LAYER: False,
+    COINS_LAYER: False,
+    LADDERS_LAYER: False,
+    WATER_LAYER: False,
+}
+# Layers whose sprites never move, drawn together in this order. Rubies
+# can be taken, which only rebuilds the chunk they were in.
+STATIC_LAYERS = [WATER_LAYER, PLATFORMS_LAYER, LADDERS_LAYER, COINS_LAYER]
+# Layers collided with as their tiles merged into rectangles
+SOLID_LAYERS = [PLATFORMS_LAYER, LADDERS_LAYER, WATER_LAYER]
+# Layers read as starting positions only; their sprites are made as they
+# come on screen
+ENTITY_LAYERS = [SPIDERS_LAYER]
+
+# How far past the edges of the screen spiders and bullets are still
+# simulated. Spiders further away are frozen until the player comes near.
+ACTIVE_MARGIN = 512
+# How far past the edges of the screen spiders are given sprites and think
+# every frame, enough for one centered just off screen to show
+SPRITE_MARGIN = 64
+
+# Parts of a frame the profiler times separately
+PROFILED_PHASES = [
+    "player",
+    "spider_physics",
+    "water",
+    "spider_ai",
+    "coins",
+    "bullets",
+    "rules",
+    "draw",
+]
+PROFILER_KEY = arcade.key.F3
+
+# Quick save and load, kept in a file so a save outlasts the game
+QUICK_SAVE_KEY = arcade.key.F5
+QUICK_LOAD_KEY = arcade.key.F9
+QUICK_SAVE_FILE = "quicksave.npz"
+
+# Where a guest's player starts, and starts again after dying
+PARTNER_START = (64, 128)
+
 # For walking animation
 UPDATES_PER_FRAME = 7
 LEFT_FACING = 1
 RIGHT_FACING = 0
 
 
+def load_assets():
+    """
+    Queue every texture, sound and map on the preloader, then building the
+    first level.
+    """
+    for filename in textures.registry.files():
+        preloader.add(f"texture:{filename}", textures.registry.load_pair, filename)
+    for name in audio.EFFECTS:
+        preloader.add(f"sound:{name}", audio.sounds.preload, None, [name])
+    if os.path.exists(OPENING_SONG):
+        preloader.add("sound:opening", audio.sounds.load, "opening", OPENING_SONG, 1, audio.DROP)
+
+    level = 1
+    while level_loader.exists(level):
+        filename = level_loader.map_pattern.format(level)
+        preloader.add(f"map:{filename}", levels.load_level_data, filename)
+        level += 1
+    preloader.add("level:1", build_first_level)
+
+
+def build_first_level():
+    level_loader.prefetch(1)
+    level_loader.wait(1)
+
+
+def assets_ready():
+    """
+    Whether everything on the preloader has loaded, noting when it first
+    has.
+    """
+    if not preloader.ready():
+        return False
+    startup_timer.mark("assets_ready")
+    return True
+
+
 def load_texture_pair(filename):
-    return [
-        arcade.load_texture(filename),
-        arcade.load_texture(filename, flipped_horizontally=True),
-    ]
+    return textures.registry.load_pair(filename)
+
+
+def make_bullet():
+    """
+    Build a bullet sprite from the shared laser texture.
+    """
+    bullet = arcade.Sprite(scale=BULLET_SCALING)
+    bullet.texture = textures.registry.get(textures.BULLET_TEXTURE)
+    return bullet
+
+
+def make_level_loader(map_pattern=levels.MAP_PATTERN):
+    """
+    Return a levels.LevelLoader for the game's layers, loading the maps
+    map_pattern names.
+    """
+    return levels.LevelLoader(
+        MAP_LAYERS,
+        TILE_SCALING,
+        STATIC_LAYERS,
+        map_pattern,
+        solid_layers=SOLID_LAYERS,
+        entity_layers=ENTITY_LAYERS,
+    )
+
+
+def physics_check_settings():
+    """
+    The arguments physics.side_by_side() takes after the map, for this
+    game's maps: the wall layer, what makes the spiders, the tile scaling,
+    the spiders' speed and gravity.
+    """
+    return (
+        PLATFORMS_LAYER,
+        lambda data: levels.build_layer(data, SPIDERS_LAYER, TILE_SCALING),
+        TILE_SCALING,
+        SPIDER_SPEED,
+        GRAVITY,
+    )
+
+
+level_loader = make_level_loader()
+frame_profiler = profiler.FrameProfiler(PROFILED_PHASES)
+# Events of every level played, written in the background once started
+gameplay_telemetry = telemetry.Telemetry()
+# Reads the game's memory at every level transition once enabled
+memory_watchdog = memwatch.MemoryWatchdog()
+# Loads assets while the start screen is up, and times how long startup took
+preloader = startup.Preloader()
+startup_timer = startup.StartupTimer()
+# Where to save the session of the game being played, if anywhere
+session_file = None
+# Whether games reload their maps when they change on disk
+dev_mode = False
+# Sends the world to a guest playing along, when hosting one
+net_host = None
 
 
 class PlayerCharacter(arcade.Sprite):
@@ -68,19 +238,19 @@ class PlayerCharacter(arcade.Sprite):
         self.climbing = False
         self.is_on_ladder = False
         self.scale = PLAYER_SCALING
-        self.texture = arcade.load_texture("assets/player_idle.png")
-
-        # Adjust the collision box.
-        self.points = self.get_adjusted_hit_box()
 
         # Load textures
-        main_path = "assets/player"
+        main_path = textures.PLAYER_TEXTURE_PATH
         # Load textures for idle standing
         self.idle_texture_pair = load_texture_pair(f"{main_path}_idle.png")
+        self.texture = self.idle_texture_pair[RIGHT_FACING]
+
+        # Adjust the collision box.
+        self.points = self.get_adjusted_hit_box()
 
         # Load textures for walking
         self.walk_textures = []
-        for i in range(5):
+        for i in range(textures.PLAYER_WALK_FRAMES):
             texture = load_texture_pair(f"{main_path}_walk_{i}.png")
             self.walk_textures.append(texture)
 
@@ -106,14 +276,126 @@ class PlayerCharacter(arcade.Sprite):
         ]
 
 
+class ScoreText:
+    """
+    The score in the corner of the screen. Its image is only made again
+    when the score changes.
+    """
+
+    def __init__(self, x, y, color=arcade.color.WHITE, font_size=14):
+        self.x = x
+        self.y = y
+        self.color = color
+        self.font_size = font_size
+        self.score = None
+        self.sprite_list = None
+
+    def draw(self, score):
+        if score != self.score:
+            self.score = score
+            output = f"Score: {score}"
+            image = arcade.get_text_image(output, self.color, self.font_size)
+            sprite = arcade.Sprite()
+            sprite.texture = arcade.Texture(output, image)
+            sprite.center_x = self.x + image.width / 2
+            sprite.center_y = self.y + image.height / 2
+            # A new list each time, so old scores don't pile up in its atlas
+            self.sprite_list = arcade.SpriteList()
+            self.sprite_list.append(sprite)
+        self.sprite_list.draw()
+
+
+class Positions:
+    """
+    Where the player, spiders and bullets were before a simulation step, so
+    a frame can be drawn part of the way from there to where they are now.
+    """
+
+    def __init__(self, game):
+        self.player = game.player_sprite
+        self.player_x = self.player.center_x
+        self.player_y = self.player.center_y
+
+        self.swarm = game.spider_swarm
+        self.spider_x = self.swarm.x.copy()
+        self.spider_y = self.swarm.y.copy()
+
+        pool = game.bullet_pool
+        self.bullet_x = pool.x.copy()
+        self.bullet_y = pool.y.copy()
+        self.bullet_live = pool.live.copy()
+        self.fired_at = pool.fired_at.copy()
+
+    def between(self, game, alpha):
+        """
+        Return (sprite, x, y) for each sprite that has moved since, with
+        (x, y) alpha of the way along.
+        """
+        placed = []
+        player = game.player_sprite
+        if player is self.player and (
+            player.center_x != self.player_x or player.center_y != self.player_y
+        ):
+            placed.append(
+                (
+                    player,
+                    timestep.blend(self.player_x, player.center_x, alpha),
+                    timestep.blend(self.player_y, player.center_y, alpha),
+                )
+            )
+
+        # Bullets fired since are drawn where they are
+        pool = game.bullet_pool
+        flying = np.flatnonzero(self.bullet_live & pool.live & (pool.fired_at == self.fired_at))
+        x = timestep.blend(self.bullet_x[flying], pool.x[flying], alpha)
+        y = timestep.blend(self.bullet_y[flying], pool.y[flying], alpha)
+        for slot, x, y in zip(flying.tolist(), x.tolist(), y.tolist()):
+            placed.append((pool.sprites[slot], x, y))
+        return placed
+
+    def spiders_between(self, game, alpha):
+        """
+        Return x and y arrays of where every spider is drawn, alpha of the
+        way along. Spiders are drawn where they are for a frame when some
+        have died since, and the arrays no longer line up.
+        """
+        swarm = game.spider_swarm
+        if swarm is not self.swarm or len(swarm.x) != len(self.spider_x):
+            return swarm.x, swarm.y
+        x = timestep.blend(self.spider_x, swarm.x, alpha)
+        y = timestep.blend(self.spider_y, swarm.y, alpha)
+        return x, y
+
+
 class SpiderIsland(arcade.View):
     """
     Main game class
     """
 
-    def __init__(self):
+    def __init__(self, seed=None):
         super().__init__()
 
+        # Everything random in a game comes from this generator, so a game
+        # can be played again from its seed
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+        # Simulation steps run so far, and the session being recorded or
+        # replayed. Recorded input is numbered by step.
+        self.frame = 0
+        self.timestep = timestep.FixedTimestep()
+        # Where things were before the last step, to draw between steps
+        self.previous_positions = None
+        self.session = None
+        self.session_file = None
+        self.replay = None
+        # The state of the game as the level started, to restart it from,
+        # and what has happened since, for telemetry
+        self.level_start = None
+        self.level_stats = None
+
         # Track our state
         self.jump_needs_reset = False
         self.up_pressed = False
@@ -127,31 +409,84 @@ class SpiderIsland(arcade.View):
         self.player_list = None
         self.wall_list = None
         self.bullet_list = None
-        self.spider_list = None
+        self.bullet_pool = None
+
+        # Collision shapes of the static layers. The solid layers collide as
+        # their tiles merged into rectangles; the walls' own tiles are also
+        # kept, for spiders to climb.
+        self.wall_shapes = None
+        self.wall_rects = None
+        self.coin_shapes = None
+        self.ladder_shapes = None
+        self.water_shapes = None
         self.ladder_list = None
         self.water_list = None
 
+        # The sprites of the static layers, drawn a chunk at a time
+        self.static_chunks = None
+
+        # Follows the player; the world is the map, or the window if the
+        # map is smaller
+        self.camera = None
+        self.world_width = None
+        self.world_height = None
+
         self.player_sprite = None
         self.engine = None
-        self.spider_engines = None
+        self.spider_engine = None
+        self.spider_swarm = None
+        # Tile grids of the level's layers
+        self.grids = None
+
+        # The guest's player when hosting, moved by the keys and clicks the
+        # guest sends
+        self.partner = None
+        self.partner_engine = None
+        self.partner_clicks = None
+        self.partner_jump_needs_reset = False
+        # Goes up whenever the world is rebuilt or put back, for a guest
+        # not to blend across
+        self.epoch = 0
+
+        # Watches the level's map in dev mode, to reload what changes
+        self.map_watcher = hotreload.MapWatcher(level_loader) if dev_mode else None
 
         # Set up score and level
         self.score = 0
-        self.score_text = None
+        self.score_text = ScoreText(10, 20)
+        self.profiler_overlay = profiler.ProfilerOverlay(
+            frame_profiler, 10, SCREEN_HEIGHT - 10
+        )
 
         self.level = 1
 
-        # Sounds
-        self.bullet_sound = arcade.load_sound("sounds/laser.wav")
-        self.coin_sound = arcade.load_sound("sounds/coin.wav")
-        self.level_sound = arcade.load_sound("sounds/level.wav")
-        self.jump_sound = arcade.load_sound("sounds/jump.wav")
+        # Sounds are decoded once and shared by every game
+        self.load_sounds()
+
+    def load_sounds(self):
+        audio.sounds.preload()
+
+    def play_sound(self, name, volume=1.0):
+        audio.sounds.play(name, volume)
 
     def setup(self, level, score=None):
         # Gove placeholder variables values
         self.score = score or 0
+
+        # Start out of the water, whatever happened in the last game
+        global PLAYER_MOVEMENT_SPEED, BULLET_SPEED, PLAYER_JUMP_SPEED
+        PLAYER_MOVEMENT_SPEED = NORMAL_SPEED
+        BULLET_SPEED = NORMAL_BULLET_SPEED
+        PLAYER_JUMP_SPEED = NORMAL_JUMP_SPEED
         self.player_list = arcade.SpriteList()
-        self.bullet_list = arcade.SpriteList()
+
+        # Bullets are made once and recycled across levels
+        if self.bullet_pool is None:
+            self.bullet_pool = bullets.BulletPool(
+                arcade.SpriteList(), make_bullet, BULLET_POOL_SIZE
+            )
+        self.bullet_pool.clear()
+        self.bullet_list = self.bullet_pool.bullet_list
 
         self.player_sprite = PlayerCharacter()
         self.player_sprite.center_x = 64
@@ -165,82 +500,528 @@ class SpiderIsland(arcade.View):
             self.window.show_view(view)
             return
 
-        # Load and read our map file
-        map_name = f"maps/map_level_{level}.tmx"
-        # Name of the layer in the file that has our platforms/walls
-        platforms_layer_name = "Platforms"
-        # Name of the layer that has items for pick-up
-        coins_layer_name = "Coins"
-        # Name of the layer that contains enemies
-        spiders_layer_name = "Spiders"
-        # Name of the layer that contains ladders
-        ladders_layer_name = "Ladders"
-        water_layer_name = "Water"
-
-        # Read in the tiled map
-        my_map = arcade.tilemap.read_tmx(map_name)
-
-        # Assign objects to lists as per the map
-        self.wall_list = arcade.tilemap.process_layer(
-            map_object=my_map,
-            layer_name=platforms_layer_name,
-            scaling=TILE_SCALING,
-            use_spatial_hash=True,
+        # Load our map, prefetched in the background if we got here by
+        # finishing the previous level
+        loaded = level_loader.load(level)
+        layers = loaded.sprite_lists
+        self.wall_list = layers[PLATFORMS_LAYER]
+        self.coin_list = layers[COINS_LAYER]
+        self.ladder_list = layers[LADDERS_LAYER]
+        self.water_list = layers[WATER_LAYER]
+
+        self.static_chunks = loaded.static_chunks
+        self.grids = dict(loaded.grids)
+        self.size_world(loaded.data)
+
+        # Collision shapes of the static layers, looked up through their
+        # tile grids
+        self.wall_shapes = physics.Shapes(self.wall_list, self.grids[PLATFORMS_LAYER])
+        self.coin_shapes = physics.Shapes(self.coin_list, self.grids[COINS_LAYER])
+        self.wall_rects = loaded.solids[PLATFORMS_LAYER]
+        self.ladder_shapes = loaded.solids[LADDERS_LAYER]
+        self.water_shapes = loaded.solids[WATER_LAYER]
+
+        # Start on the next level while this one is being played
+        level_loader.prefetch(level + 1)
+        if self.map_watcher is not None:
+            self.map_watcher.watch(level, loaded.data)
+
+        # Set up physics engines
+        self.engine = physics.LadderPlatformerEngine(
+            self.player_sprite, self.wall_rects.sprite_list, GRAVITY, self.ladder_shapes
         )
 
-        self.coin_list = arcade.tilemap.process_layer(
-            my_map, coins_layer_name, TILE_SCALING, use_spatial_hash=True
+        # Spider AI and physics run on the whole swarm at once
+        self.spider_swarm = self.make_swarm(loaded.positions[SPIDERS_LAYER])
+        self.spider_engine = physics.BatchPlatformerEngine(
+            self.spider_swarm, self.wall_rects, GRAVITY
         )
-        self.spider_list = arcade.tilemap.process_layer(
-            my_map, spiders_layer_name, TILE_SCALING
+        if net_host is not None:
+            self.partner = PlayerCharacter()
+            self.player_list.append(self.partner)
+            self.partner_engine = physics.LadderPlatformerEngine(
+                self.partner, self.wall_rects.sprite_list, GRAVITY, self.ladder_shapes
+            )
+            self.respawn_partner()
+        self.epoch += 1
+        self.level_start = self.snapshot(start_score=self.score)
+        self.start_level_stats()
+
+    def size_world(self, data):
+        """
+        Fit the world and the camera to a map's levels.LevelData.
+        """
+        self.world_width = max(data.width * data.tile_width * TILE_SCALING, self.window.width)
+        self.world_height = max(
+            data.height * data.tile_height * TILE_SCALING, self.window.height
         )
-        self.ladder_list = arcade.tilemap.process_layer(
-            my_map, ladders_layer_name, TILE_SCALING, use_spatial_hash=True
+        self.camera = camera.Camera(
+            self.window.width, self.window.height, self.world_width, self.world_height
         )
-        self.ladder_list = arcade.tilemap.process_layer(
-            my_map, ladders_layer_name, TILE_SCALING, use_spatial_hash=True
+        self.camera.follow(self.player_sprite.center_x, self.player_sprite.center_y)
+
+    def make_swarm(self, positions):
+        """
+        Return a swarm.SpiderSwarm of spiders starting at positions, on the
+        level's walls and water.
+        """
+        spiders = swarm.SpiderSwarm(
+            positions,
+            TILE_SCALING,
+            self.wall_shapes,
+            self.water_shapes,
+            SPIDER_SPEED,
+            seed=self.rng.getrandbits(32),
+            flow_field=flowfield.FlowField(
+                self.grids[PLATFORMS_LAYER], self.grids[WATER_LAYER]
+            ),
         )
-        self.water_list = arcade.tilemap.process_layer(
-            my_map, water_layer_name, TILE_SCALING, use_spatial_hash=True
+        spiders.region = self.camera.region(ACTIVE_MARGIN)
+        spiders.near_region = self.camera.region(SPRITE_MARGIN)
+        return spiders
+
+    def apply_reload(self, reload):
+        """
+        Swap the layers of a hotreload.Reload into the game, along with the
+        shapes and engines built on them. The player stays where they are
+        and the score as it is; a layer that changed starts over, so its
+        rubies are all back, or its spiders where the map puts them.
+        """
+        changed = set(reload.changed)
+        built = reload.level
+        if reload.error is not None or not changed:
+            return
+        data = reload.data
+        walls = self.grids[PLATFORMS_LAYER]
+        if (walls.rows, walls.columns) != (data.height, data.width):
+            self.size_world(data)
+        lists = built.sprite_lists
+        self.grids.update(built.grids)
+        if PLATFORMS_LAYER in changed:
+            self.wall_list = lists[PLATFORMS_LAYER]
+            self.wall_shapes = physics.Shapes(self.wall_list, self.grids[PLATFORMS_LAYER])
+            self.wall_rects = built.solids[PLATFORMS_LAYER]
+        if COINS_LAYER in changed:
+            self.coin_list = lists[COINS_LAYER]
+            self.coin_shapes = physics.Shapes(self.coin_list, self.grids[COINS_LAYER])
+            self.level_start.coins = self.coin_shapes.present.copy()
+        if LADDERS_LAYER in changed:
+            self.ladder_list = lists[LADDERS_LAYER]
+            self.ladder_shapes = built.solids[LADDERS_LAYER]
+        if WATER_LAYER in changed:
+            self.water_list = lists[WATER_LAYER]
+            self.water_shapes = built.solids[WATER_LAYER]
+        if changed & set(STATIC_LAYERS):
+            self.static_chunks = level_loader.chunk(
+                {
+                    PLATFORMS_LAYER: self.wall_list,
+                    COINS_LAYER: self.coin_list,
+                    LADDERS_LAYER: self.ladder_list,
+                    WATER_LAYER: self.water_list,
+                }
+            )
+
+        if changed & {PLATFORMS_LAYER, LADDERS_LAYER}:
+            engine = self.engine
+            self.engine = physics.LadderPlatformerEngine(
+                self.player_sprite,
+                self.wall_rects.sprite_list,
+                engine.gravity_constant,
+                self.ladder_shapes,
+            )
+            self.engine.jumps_since_ground = engine.jumps_since_ground
+            if self.partner is not None:
+                self.partner_engine = physics.LadderPlatformerEngine(
+                    self.partner, self.wall_rects.sprite_list, GRAVITY, self.ladder_shapes
+                )
+        if SPIDERS_LAYER in changed:
+            self.spider_swarm = self.make_swarm(built.positions[SPIDERS_LAYER])
+            self.level_start.spiders = self.spider_swarm.state()
+            self.level_start.spider_rng_state = self.spider_swarm.rng.bit_generator.state
+        elif changed & {PLATFORMS_LAYER, WATER_LAYER}:
+            self.spider_swarm.walls = self.wall_shapes
+            self.spider_swarm.water = self.water_shapes
+            self.spider_swarm.flow_field = flowfield.FlowField(
+                self.grids[PLATFORMS_LAYER], self.grids[WATER_LAYER]
+            )
+        if changed & {PLATFORMS_LAYER, SPIDERS_LAYER}:
+            self.spider_engine = physics.BatchPlatformerEngine(
+                self.spider_swarm, self.wall_rects, GRAVITY
+            )
+        self.epoch += 1
+        self.previous_positions = None
+
+    def respawn_partner(self):
+        """
+        Put the guest's player back at the start.
+        """
+        self.partner.center_x, self.partner.center_y = PARTNER_START
+        self.partner.change_x = 0
+        self.partner.change_y = 0
+
+    def start_level_stats(self, restarted=False):
+        self.level_stats = telemetry.LevelStats(self.level, self.frame)
+        gameplay_telemetry.emit(
+            "level_start",
+            level=self.level,
+            frame=self.frame,
+            score=self.score,
+            spiders=len(self.spider_swarm),
+            rubies=len(self.coin_list),
+            restarted=restarted,
         )
+        reading = memory_watchdog.record(
+            "restart" if restarted else "setup",
+            self.level,
+            self.frame,
+            {
+                "player": self.player_list,
+                "bullets": self.bullet_list,
+                "walls": self.wall_list,
+                "coins": self.coin_list,
+                "ladders": self.ladder_list,
+                "water": self.water_list,
+                "spiders": self.spider_swarm.view.sprite_list,
+            },
+        )
+        if reading is not None:
+            gameplay_telemetry.emit("memory", **reading.summary())
 
-        # Set up physics engines
-        self.engine = arcade.PhysicsEnginePlatformer(
-            self.player_sprite, self.wall_list, GRAVITY, ladders=self.ladder_list
+    def snapshot(self, start_score=None):
+        """
+        Return a snapshot.Snapshot of the game as it is. start_score is the
+        score the level was started with, if not the level start's.
+        """
+        if start_score is None:
+            start_score = self.level_start.score
+        player = self.player_sprite
+        return snapshot.Snapshot(
+            self.level,
+            self.score,
+            start_score,
+            {
+                "center_x": player.center_x,
+                "center_y": player.center_y,
+                "change_x": player.change_x,
+                "change_y": player.change_y,
+                "face": player.character_face_direction,
+                "cur_texture": player.cur_texture,
+                "jumps_since_ground": self.engine.jumps_since_ground,
+                "gravity": self.engine.gravity_constant,
+                "speeds": [PLAYER_MOVEMENT_SPEED, BULLET_SPEED, PLAYER_JUMP_SPEED],
+            },
+            self.rng.getstate(),
+            self.spider_swarm.state(),
+            self.spider_swarm.rng.bit_generator.state,
+            self.bullet_pool.state(),
+            self.coin_shapes.present.copy(),
         )
-        self.spider_engines = []
-        for spider in self.spider_list:
-            engine = arcade.PhysicsEnginePlatformer(spider, self.wall_list, GRAVITY)
-            self.spider_engines.append(engine)
+
+    def restore(self, saved):
+        """
+        Put the game back as a snapshot found it. The level's sprite lists,
+        shapes and engines are reused when the snapshot is of this level;
+        otherwise that level is set up first.
+
+        A session can't be played back across a restore, so one being
+        recorded stops here, and is saved as it was.
+        """
+        global PLAYER_MOVEMENT_SPEED, BULLET_SPEED, PLAYER_JUMP_SPEED
+        if saved.level != self.level or self.coin_shapes is None:
+            self.level = saved.level
+            self.setup(saved.level, saved.start_score)
+        if len(saved.coins) != len(self.coin_shapes.sprites):
+            raise ValueError(f"Snapshot does not match the map of level {saved.level}")
+        if set(saved.spiders) != set(self.spider_swarm.state()) or set(saved.bullets) != set(
+            self.bullet_pool.state()
+        ):
+            raise ValueError("Snapshot is missing spider or bullet arrays")
+        # A death from here on starts the level again with the score it was
+        # started with in the saved game, not in this one
+        self.level_start.score = self.level_start.start_score = saved.start_score
+        if self.session is not None:
+            self.save_session()
+            self.session = None
+
+        self.score = saved.score
+        self.rng.setstate(saved.rng_state)
+
+        player = self.player_sprite
+        state = saved.player
+        player.center_x = state["center_x"]
+        player.center_y = state["center_y"]
+        player.change_x = state["change_x"]
+        player.change_y = state["change_y"]
+        player.character_face_direction = state["face"]
+        player.cur_texture = state["cur_texture"]
+        player.texture = player.idle_texture_pair[player.character_face_direction]
+        self.engine.jumps_since_ground = state["jumps_since_ground"]
+        self.engine.gravity_constant = state["gravity"]
+        PLAYER_MOVEMENT_SPEED, BULLET_SPEED, PLAYER_JUMP_SPEED = state["speeds"]
+
+        self.spider_swarm.set_state(saved.spiders)
+        self.spider_swarm.rng.bit_generator.state = saved.spider_rng_state
+        self.bullet_pool.set_state(saved.bullets)
+        self.static_chunks.extend(self.coin_shapes.restore(saved.coins))
+
+        # Start drawing afresh from here
+        self.camera.follow(player.center_x, player.center_y)
+        self.spider_swarm.region = self.camera.region(ACTIVE_MARGIN)
+        self.spider_swarm.near_region = self.camera.region(SPRITE_MARGIN)
+        self.timestep = timestep.FixedTimestep()
+        self.previous_positions = None
+        if self.partner is not None:
+            self.respawn_partner()
+        self.epoch += 1
+
+        # No key is held as far as the game knows; one let go while another
+        # view was showing never told this one
+        self.jump_needs_reset = False
+        self.up_pressed = False
+        self.down_pressed = False
+        self.left_pressed = False
+        self.right_pressed = False
+
+    def restart(self):
+        """
+        Start the level again, as it was when it started.
+        """
+        self.restore(self.level_start)
+        self.start_level_stats(restarted=True)
+
+    def quick_save(self, filename=QUICK_SAVE_FILE):
+        self.snapshot().save(filename)
+
+    def quick_load(self, filename=QUICK_SAVE_FILE):
+        """
+        Restore the game saved by quick_save(), if there is one. A save
+        that can't be loaded, being from an older version or of a map that
+        has changed since, is reported and the game goes on as it was.
+        """
+        if not os.path.exists(filename):
+            return
+        try:
+            saved = snapshot.Snapshot.load(filename)
+        except ValueError as e:
+            print(f"Can't quick load: {e}")
+            return
+        # Checking the save against its map may set that level up first
+        current = self.snapshot() if saved.level != self.level else None
+        try:
+            self.restore(saved)
+        except ValueError as e:
+            print(f"Can't quick load: {e}")
+            if current is not None:
+                self.restore(current)
+
+    def live_bounds(self):
+        """
+        The (left, right, bottom, top) of the part of the world being
+        simulated: around the camera, and inside the world.
+        """
+        left, right, bottom, top = self.camera.region(ACTIVE_MARGIN)
+        return (
+            max(left, 0),
+            min(right, self.world_width),
+            max(bottom, 0),
+            min(top, self.world_height),
+        )
+
+    def out_of_world(self, sprite):
+        """
+        Whether a sprite has left the world. There is no ceiling, since
+        whatever goes up comes back down.
+        """
+        return sprite.top < 0 or sprite.right < 0 or sprite.left > self.world_width
 
     def on_draw(self):
+        frame_profiler.start()
         arcade.start_render()
-
-        # Render sprites
-        self.water_list.draw()
-        self.wall_list.draw()
-        self.coin_list.draw()
-        self.ladder_list.draw()
-        self.spider_list.draw()
-        self.bullet_list.draw()
+        first_game_frame = startup_timer.mark("first_game_frame")
+
+        # Draw everything that moves part of the way between the last two
+        # steps, and put it back afterwards, so the simulation never sees it
+        placed = []
+        spider_x, spider_y = self.spider_swarm.x, self.spider_swarm.y
+        if self.previous_positions is not None:
+            alpha = self.timestep.alpha
+            placed = self.previous_positions.between(self, alpha)
+            spider_x, spider_y = self.previous_positions.spiders_between(self, alpha)
+        exact = [(sprite, sprite.center_x, sprite.center_y) for sprite, _, _ in placed]
+        for sprite, x, y in placed:
+            sprite.position = x, y
+        camera_corner = self.camera.left, self.camera.bottom
+        self.camera.follow(self.player_sprite.center_x, self.player_sprite.center_y)
+
+        # Render sprites. Water, walls, ladders and rubies are drawn from
+        # the chunks in view, and spiders given sprites only once near it.
+        # Bullets come and go too often to share a list with the rest.
+        self.camera.use()
+        self.static_chunks.draw(*self.camera.view)
+        self.spider_swarm.draw_at(self.camera.region(SPRITE_MARGIN), spider_x, spider_y)
         self.player_list.draw()
+        self.bullet_list.draw()
 
-        # Draw score text
-        output = f"Score: {self.score}"
-        arcade.draw_text(output, 10, 20, arcade.color.WHITE, 14)
+        for sprite, x, y in exact:
+            sprite.position = x, y
+        self.camera.left, self.camera.bottom = camera_corner
+
+        # Draw score text where it is on the screen
+        arcade.set_viewport(0, self.window.width, 0, self.window.height)
+        self.score_text.draw(self.score)
+        frame_profiler.lap("draw")
+
+        if frame_profiler.enabled:
+            self.profiler_overlay.draw()
+
+        if first_game_frame:
+            print("\n".join(startup_timer.report()))
+
+    def record_session(self, filename):
+        """
+        Start recording this game's session, to be saved to a file when the
+        game ends. Call before the first frame.
+        """
+        self.session = replay.Session(self.seed, self.level)
+        self.session_file = filename
+
+    def save_session(self):
+        if self.session is not None:
+            self.session.save(self.session_file)
+
+    def state_checksum(self):
+        """
+        Return a CRC-32 of everything that decides how the game goes on.
+        """
+        player = self.player_sprite
+        checksum = zlib.crc32(
+            struct.pack(
+                "<4d2i",
+                player.center_x,
+                player.center_y,
+                player.change_x,
+                player.change_y,
+                self.level,
+                self.score,
+            )
+        )
+        spiders = self.spider_swarm
+        pool = self.bullet_pool
+        for values in (
+            spiders.x,
+            spiders.y,
+            spiders.change_x,
+            spiders.change_y,
+            pool.x[pool.live],
+            pool.y[pool.live],
+            self.coin_shapes.present,
+        ):
+            checksum = zlib.crc32(values.tobytes(), checksum)
+        return checksum
+
+    def world_state(self):
+        """
+        Return a netsync.WorldState of what a guest draws of the game.
+        """
+        players = [self.player_sprite]
+        if self.partner is not None:
+            players.append(self.partner)
+        spiders = self.spider_swarm
+        pool = self.bullet_pool
+        # Bullets are told apart by when they were fired, as slots are reused
+        live = np.flatnonzero(pool.live)
+        live = live[np.argsort(pool.fired_at[live])]
+        return netsync.WorldState(
+            self.frame,
+            self.level,
+            self.epoch,
+            self.score,
+            {
+                "players": netsync.entities(
+                    range(len(players)),
+                    [player.center_x for player in players],
+                    [player.center_y for player in players],
+                    [player.character_face_direction for player in players],
+                ),
+                "spiders": netsync.entities(spiders.ids, spiders.x, spiders.y, spiders.flipped),
+                "bullets": netsync.entities(pool.fired_at[live], pool.x[live], pool.y[live]),
+                "coins": netsync.entities(np.flatnonzero(self.coin_shapes.present)),
+            },
+        )
 
     def on_update(self, delta_time):
+        """
+        Run as many fixed steps as the time since the last frame makes up.
+        """
+        start = time.perf_counter()
+        if self.map_watcher is not None:
+            reload = self.map_watcher.poll()
+            if reload is not None:
+                self.apply_reload(reload)
+                message = self.map_watcher.report(reload, start)
+                if message:
+                    print(message)
+        frame_profiler.begin_frame(
+            level=self.level,
+            spiders=len(self.spider_swarm),
+            bullets=len(self.bullet_pool),
+            coins=len(self.coin_list),
+        )
+        steps = self.timestep.advance(delta_time)
+        for step in range(steps):
+            if step == steps - 1:
+                self.previous_positions = Positions(self)
+            self.step()
+            # The game is over or won, so there is nothing left to step
+            if self.window.current_view is not self:
+                break
+        self.level_stats.frame_times.add(time.perf_counter() - start)
+
+    def game_over(self, cause):
+        """
+        End the game, the player having died of cause.
+        """
+        gameplay_telemetry.emit(
+            "death",
+            cause=cause,
+            frame=self.frame,
+            score=self.score,
+            **self.level_stats.summary(self.frame + 1),
+        )
+        self.window.show_view(GameOverScreen(self))
+
+    def step(self):
+        """
+        Move the game on by one step of timestep.SIMULATION_RATE.
+        """
+        if self.replay is not None:
+            self.replay.apply_due(self, self.frame)
+        if self.partner is not None:
+            self.steer_partner(net_host.poll())
+
         # Update physics and animations
         self.player_list.update()
         self.player_list.update_animation()
         self.engine.update()
-        for engine in self.spider_engines:
-            engine.update()
+        if self.partner is not None:
+            self.partner_engine.update()
+        self.camera.follow(self.player_sprite.center_x, self.player_sprite.center_y)
+        frame_profiler.lap("player")
+
+        # Only spiders near the camera move, and only those in view think
+        # every frame. A game being recorded or checked gives the AI all the
+        # time it needs, so it plays out the same on any machine.
+        self.spider_swarm.region = self.camera.region(ACTIVE_MARGIN)
+        self.spider_swarm.near_region = self.camera.region(SPRITE_MARGIN)
+        checked = self.session is not None or (
+            self.replay is not None and self.replay.checksums is not None
+        )
+        self.spider_swarm.scheduler.budget_ms = None if checked else scheduler.BUDGET_MS
+        self.spider_engine.update()
+        frame_profiler.lap("spider_physics")
 
         # Check if we are in water
-        water_hit_list = arcade.check_for_collision_with_list(
-            self.player_sprite, self.water_list
-        )
+        water_hit_list = self.water_shapes.touching(self.player_sprite)
         global PLAYER_MOVEMENT_SPEED, BULLET_SPEED, PLAYER_JUMP_SPEED
 
         if len(water_hit_list) > 0:
@@ -253,114 +1034,152 @@ class SpiderIsland(arcade.View):
             BULLET_SPEED = NORMAL_BULLET_SPEED
             PLAYER_JUMP_SPEED = NORMAL_JUMP_SPEED
             self.engine.gravity_constant = GRAVITY
+        frame_profiler.lap("water")
 
-        # Check spider movement
-        for spider in self.spider_list:
-            follow_sprite(spider, self.player_sprite)
-
-            wall_hit_list = arcade.check_for_collision_with_list(spider, self.wall_list)
-
-            # Are we touching a wall?
-            if len(wall_hit_list) > 0:
-                for wall in wall_hit_list:
-                    # If so, climb the wall
-                    start_x = spider.center_x
-                    start_y = spider.center_y
-
-                    dest_x = wall.center_x
-                    dest_y = wall.top + 100
-
-                    x_diff = dest_x - start_x
-                    y_diff = dest_y - start_y
-                    angle = math.atan2(y_diff, x_diff)
-
-                    spider.change_x = math.cos(angle) * SPIDER_SPEED
-                    spider.change_y = math.sin(angle) * SPIDER_SPEED
-
-            # Remove the spider if it goes off the screen
-            if (
-                spider.bottom > self.window.width
-                or spider.top < 0
-                or spider.right < 0
-                or spider.left > self.window.width
-            ):
-                spider.remove_from_sprite_lists()
-            elif len(arcade.check_for_collision_with_list(spider, self.water_list)):
-                spider.remove_from_sprite_lists()
+        # Check spider movement. Spiders chase the player, climb walls they
+        # run into, and die in water or out of the world.
+        self.spider_swarm.update(
+            self.player_sprite.center_x, self.player_sprite.center_y, self.world_width
+        )
+        frame_profiler.lap("spider_ai")
 
         # Collect coins
-        coin_hit_list = arcade.check_for_collision_with_list(
-            self.player_sprite, self.coin_list
-        )
+        coin_hit_list = self.coin_shapes.touching(self.player_sprite)
 
         for coin in coin_hit_list:
             self.score += 1
             coin.remove_from_sprite_lists()
-            arcade.play_sound(self.coin_sound, volume=0.25)
+            self.play_sound("coin", volume=0.25)
+            self.level_stats.rubies_touched += 1
+            gameplay_telemetry.emit("ruby", level=self.level, frame=self.frame, by="touch")
+        if self.partner is not None:
+            self.check_partner()
+        frame_profiler.lap("coins")
 
         # Update bullet positions
-        self.bullet_list.update()
+        self.bullet_pool.update()
+
+        # Check bullet collisions for every bullet at once, against the
+        # spiders near enough to be moving
+        spiders = self.spider_swarm
+        active = spiders.active()
+        hits = self.bullet_pool.collide(
+            spiders.points(active),
+            self.wall_rects,
+            self.coin_shapes,
+            self.live_bounds(),
+        )
 
-        # Check bullet collisions
-        for bullet in self.bullet_list:
-            # Get bullet collisions
-            bullet_hit_list = arcade.check_for_collision_with_list(
-                bullet, self.spider_list
+        spiders.kill(active[hits.spiders])
+        self.score += len(hits.spiders)
+        if len(hits.spiders):
+            self.level_stats.spiders_shot += len(hits.spiders)
+            gameplay_telemetry.emit(
+                "spiders_shot", level=self.level, frame=self.frame, count=len(hits.spiders)
             )
-            wall_hit_list = arcade.check_for_collision_with_list(bullet, self.wall_list)
-            coin_hit_list = arcade.check_for_collision_with_list(bullet, self.coin_list)
-
-            if len(wall_hit_list) > 0:
-                bullet.remove_from_sprite_lists()
-
-            if len(bullet_hit_list) > 0:
-                bullet.remove_from_sprite_lists()
-
-            if len(coin_hit_list) > 0:
-                bullet.remove_from_sprite_lists()
-
-            for spider in bullet_hit_list:
-                spider.remove_from_sprite_lists()
-                self.score += 1
-
-            for coin in coin_hit_list:
-                coin.remove_from_sprite_lists()
-                self.score += 1
-                arcade.play_sound(self.coin_sound, volume=0.25)
-
-            # If bullet flies offscreen, remove it
-            if (
-                bullet.bottom > self.window.width
-                or bullet.top < 0
-                or bullet.right < 0
-                or bullet.left > self.window.width
-            ):
-                bullet.remove_from_sprite_lists()
-
-        # If player goes off the screen, remove it and show the game over screen
-        if (
-            self.player_sprite.bottom > self.window.width
-            or self.player_sprite.top < 0
-            or self.player_sprite.right < 0
-            or (self.player_sprite.left > self.window.width)
-        ):
-            view = GameOverScreen()
-            self.window.show_view(view)
 
-        # Did we touch a spider?
-        spider_hit_list = arcade.check_for_collision_with_list(
-            self.player_sprite, self.spider_list
-        )
+        for coin in [self.coin_shapes.sprites[i] for i in hits.coins.tolist()]:
+            coin.remove_from_sprite_lists()
+            self.score += 1
+            self.play_sound("coin", volume=0.25)
+            self.level_stats.rubies_shot += 1
+            gameplay_telemetry.emit("ruby", level=self.level, frame=self.frame, by="bullet")
+        frame_profiler.lap("bullets")
 
-        if len(spider_hit_list) > 0:
-            view = GameOverScreen()
-            self.window.show_view(view)
+        # If player falls out of the world, show the game over screen
+        if self.out_of_world(self.player_sprite):
+            self.game_over("fall")
+
+        # Did we touch a spider? Only ones near the player can have.
+        elif len(self.spider_swarm.touching(self.player_sprite)):
+            self.game_over("spider")
 
         # If we win
-        if len(self.spider_list) == 0 and len(self.coin_list) == 0:
-            arcade.play_sound(self.level_sound, volume=0.25)
+        if len(self.spider_swarm) == 0 and len(self.coin_list) == 0:
+            gameplay_telemetry.emit(
+                "level_clear",
+                frame=self.frame,
+                score=self.score,
+                **self.level_stats.summary(self.frame + 1),
+            )
+            self.play_sound("level", volume=0.25)
             self.level += 1
             self.setup(self.level, self.score)
+        frame_profiler.lap("rules")
+
+        if self.session is not None or self.replay is not None:
+            checksum = self.state_checksum()
+            if self.session is not None:
+                self.session.record_checksum(checksum)
+            if self.replay is not None and not self.replay.check(self.frame, checksum):
+                if self.replay.diverged_at == self.frame:
+                    print(f"Replay diverged at frame {self.frame}")
+        if net_host is not None and net_host.due(self.frame):
+            net_host.send(self.world_state())
+        self.frame += 1
+
+        # The game is over, so keep what was recorded
+        if self.session is not None and self.window.current_view is not self:
+            self.save_session()
+
+    def steer_partner(self, guest):
+        """
+        Move the guest's player as a netsync.GuestInput says, the way the
+        player's keys move the player, and fire where the guest clicked.
+        """
+        partner = self.partner
+        engine = self.partner_engine
+        if len(self.water_shapes.touching(partner)) > 0:
+            speed, jump_speed, bullet_speed = WATER_SPEED, WATER_JUMP_SPEED, WATER_BULLET_SPEED
+            engine.gravity_constant = GRAVITY / 5
+        else:
+            speed, jump_speed, bullet_speed = NORMAL_SPEED, NORMAL_JUMP_SPEED, NORMAL_BULLET_SPEED
+            engine.gravity_constant = GRAVITY
+
+        up = bool(guest.keys & netsync.UP)
+        down = bool(guest.keys & netsync.DOWN)
+        left = bool(guest.keys & netsync.LEFT)
+        right = bool(guest.keys & netsync.RIGHT)
+        if not up:
+            self.partner_jump_needs_reset = False
+        if up and not down:
+            if engine.is_on_ladder():
+                partner.change_y = speed
+            elif engine.can_jump() and not self.partner_jump_needs_reset:
+                partner.change_y = jump_speed
+                self.partner_jump_needs_reset = True
+                self.play_sound("jump")
+        elif down and not up:
+            if engine.is_on_ladder():
+                partner.change_y = -speed
+        if engine.is_on_ladder() and up == down:
+            partner.change_y = 0
+        if right and not left:
+            partner.change_x = speed
+        elif left and not right:
+            partner.change_x = -speed
+        else:
+            partner.change_x = 0
+
+        # Clicks from before the game started aren't for it
+        if self.partner_clicks is not None and guest.clicks != self.partner_clicks:
+            self.shoot(partner, guest.x, guest.y, bullet_speed)
+        self.partner_clicks = guest.clicks
+
+    def check_partner(self):
+        """
+        Let the guest's player take rubies, and send it back to the start
+        if it falls out of the world or a spider gets it. Only the host's
+        player dying ends the game.
+        """
+        for coin in self.coin_shapes.touching(self.partner):
+            self.score += 1
+            coin.remove_from_sprite_lists()
+            self.play_sound("coin", volume=0.25)
+            self.level_stats.rubies_touched += 1
+            gameplay_telemetry.emit("ruby", level=self.level, frame=self.frame, by="partner")
+        if self.out_of_world(self.partner) or len(self.spider_swarm.touching(self.partner)):
+            self.respawn_partner()
 
     def process_keychange(self):
         """
@@ -373,7 +1192,7 @@ class SpiderIsland(arcade.View):
             elif self.engine.can_jump() and not self.jump_needs_reset:
                 self.player_sprite.change_y = PLAYER_JUMP_SPEED
                 self.jump_needs_reset = True
-                arcade.play_sound(self.jump_sound)
+                self.play_sound("jump")
         elif self.down_pressed and not self.up_pressed:
             if self.engine.is_on_ladder():
                 self.player_sprite.change_y = -PLAYER_MOVEMENT_SPEED
@@ -395,6 +1214,19 @@ class SpiderIsland(arcade.View):
 
     def on_key_press(self, key, modifiers):
         """Called whenever a key is pressed. """
+        if key == PROFILER_KEY:
+            frame_profiler.enable(not frame_profiler.enabled)
+            return
+        if key == QUICK_SAVE_KEY:
+            self.quick_save()
+            return
+        if key == QUICK_LOAD_KEY:
+            # A replay plays the recorded game, whatever is saved
+            if self.replay is None:
+                self.quick_load()
+            return
+        if self.session is not None:
+            self.session.record(self.frame, "press", key)
 
         if key == arcade.key.UP or key == arcade.key.W:
             self.up_pressed = True
@@ -409,6 +1241,8 @@ class SpiderIsland(arcade.View):
 
     def on_key_release(self, key, modifiers):
         """Called when the user releases a key. """
+        if self.session is not None:
+            self.session.record(self.frame, "release", key)
 
         if key == arcade.key.UP or key == arcade.key.W:
             self.up_pressed = False
@@ -423,15 +1257,17 @@ class SpiderIsland(arcade.View):
         self.process_keychange()
 
     def on_mouse_press(self, x: float, y: float, button: int, modifiers: int):
-        bullet = arcade.Sprite("assets/laser.png", BULLET_SCALING)
-
-        start_x = self.player_sprite.center_x
-        start_y = self.player_sprite.center_y
-        bullet.center_x = start_x
-        bullet.center_y = start_y
+        if self.session is not None:
+            self.session.record(self.frame, "click", x, y)
+        x, y = self.camera.to_world(x, y)
+        self.shoot(self.player_sprite, x, y, BULLET_SPEED)
 
-        dest_x = x
-        dest_y = y
+    def shoot(self, shooter, dest_x, dest_y, speed):
+        """
+        Fire a bullet from a player towards a point in the world.
+        """
+        start_x = shooter.center_x
+        start_y = shooter.center_y
 
         # Bullet trajectory calculation
         x_diff = dest_x - start_x
@@ -439,54 +1275,175 @@ class SpiderIsland(arcade.View):
         angle = math.atan2(y_diff, x_diff)
 
         # Bullet velocity calculation
-        bullet.change_x = math.cos(angle) * BULLET_SPEED
-        bullet.change_y = math.sin(angle) * BULLET_SPEED
+        self.bullet_pool.fire(
+            start_x,
+            start_y,
+            math.cos(angle) * speed,
+            math.sin(angle) * speed,
+        )
+        self.play_sound("laser")
+        self.level_stats.shots += 1
+        gameplay_telemetry.emit("shot", level=self.level, frame=self.frame, angle=angle)
 
-        self.bullet_list.append(bullet)
-        arcade.play_sound(self.bullet_sound)
 
+# Keys a guest moves with, as netsync key bits
+GUEST_KEYS = {
+    arcade.key.UP: netsync.UP,
+    arcade.key.W: netsync.UP,
+    arcade.key.DOWN: netsync.DOWN,
+    arcade.key.S: netsync.DOWN,
+    arcade.key.LEFT: netsync.LEFT,
+    arcade.key.A: netsync.LEFT,
+    arcade.key.RIGHT: netsync.RIGHT,
+    arcade.key.D: netsync.RIGHT,
+}
 
-def follow_sprite(self, player_sprite):
-    """
-    This function will move the current sprite towards whatever
-    other sprite is specified as a parameter.
 
-    We use the 'min' function here to get the sprite to line up with
-    the target sprite, and not jump around if the sprite is not off
-    an exact multiple of SPRITE_SPEED.
+class GuestView(arcade.View):
+    """
+    Plays along with a game hosted on this machine: sends the host the
+    keys and clicks, through a netsync.Guest, and draws the world the host
+    sends back. The maps are loaded here too, so only what changes comes
+    over the socket.
     """
 
-    self.center_x += self.change_x
-    self.center_y += self.change_y
+    def __init__(self, guest):
+        super().__init__()
+        self.guest = guest
+        self.sample = None
+        # The world being drawn. It is kept when the host only restarts or
+        # loads a game, and built again, in the background, when the host
+        # moves to another level or its map changes on disk.
+        self.level = None
+        self.epoch = None
+        self.map_mtime = None
+        self.camera = None
+        self.static_chunks = None
+        self.coin_list = None
+        self.coin_sprites = []
+        self.coins_shown = np.zeros(0, dtype=bool)
 
-    # Random 1 in 100 chance that we'll change from our old direction and
-    # then re-aim toward the player
-    if random.randrange(100) == 0:
-        start_x = self.center_x
-        start_y = self.center_y
+        # The host's player, then ours
+        self.players = [PlayerCharacter(), PlayerCharacter()]
+        self.player_list = arcade.SpriteList()
+        self.spider_textures = textures.registry.load_pair(textures.SPIDER_TEXTURE)
+        self.spiders = spriteview.SpriteView(lambda: arcade.Sprite(scale=TILE_SCALING))
+        self.bullets = spriteview.SpriteView(make_bullet)
+        self.score_text = ScoreText(10, 20)
 
-        # Get the destination location for the bullet
-        dest_x = player_sprite.center_x
-        dest_y = player_sprite.center_y
+    def on_show(self):
+        arcade.set_background_color(arcade.csscolor.CORNFLOWER_BLUE)
 
-        # Do math to calculate how to get the bullet to the destination.
-        # Calculation the angle in radians between the start points
-        # and end points. This is the angle the bullet will travel.
-        x_diff = dest_x - start_x
-        y_diff = dest_y - start_y
-        angle = math.atan2(y_diff, x_diff)
+    def map_mtime_ns(self, level):
+        try:
+            return os.stat(level_loader.map_pattern.format(level)).st_mtime_ns
+        except OSError:
+            return None
+
+    def load_level(self, level):
+        self.map_mtime = self.map_mtime_ns(level)
+        loaded = level_loader.load(level)
+        level_loader.prefetch(level + 1)
+        self.static_chunks = loaded.static_chunks
+        self.coin_list = loaded.sprite_lists[COINS_LAYER]
+        self.coin_sprites = list(self.coin_list)
+        self.coins_shown = np.ones(len(self.coin_sprites), dtype=bool)
+        data = loaded.data
+        self.camera = camera.Camera(
+            self.window.width,
+            self.window.height,
+            max(data.width * data.tile_width * TILE_SCALING, self.window.width),
+            max(data.height * data.tile_height * TILE_SCALING, self.window.height),
+        )
+
+    def on_update(self, delta_time):
+        self.guest.poll()
+        sample = self.guest.sample(delta_time)
+        if sample is None:
+            return
+        if (sample.level, sample.epoch) != (self.level, self.epoch):
+            if sample.level != self.level or self.map_mtime_ns(sample.level) != self.map_mtime:
+                # Go on drawing the old world until the new one is built
+                level_loader.prefetch(sample.level)
+                if not level_loader.ready(sample.level):
+                    return
+                self.load_level(sample.level)
+                self.level = sample.level
+            self.epoch = sample.epoch
+        self.sample = sample
+
+        # Take away the rubies that have gone, and put back those a restart
+        # or load brought back
+        coins = sample.groups["coins"][0]
+        present = np.zeros(len(self.coin_sprites), dtype=bool)
+        present[coins[coins < len(present)]] = True
+        for coin in np.flatnonzero(self.coins_shown & ~present).tolist():
+            self.coin_sprites[coin].remove_from_sprite_lists()
+        back = np.flatnonzero(present & ~self.coins_shown)
+        back = [self.coin_sprites[coin] for coin in back.tolist()]
+        if back:
+            self.coin_list.extend(back)
+            self.static_chunks.extend(back)
+        self.coins_shown = present
+
+        ids, x, y, fields = sample.groups["players"]
+        shown = self.players[: len(ids)]
+        if len(self.player_list) != len(shown):
+            self.player_list = arcade.SpriteList()
+            self.player_list.extend(shown)
+        for player, x, y, face in zip(shown, x.tolist(), y.tolist(), fields[:, 0].tolist()):
+            player.change_x = x - player.center_x
+            player.change_y = y - player.center_y
+            player.position = x, y
+            player.character_face_direction = face
+            player.update_animation()
+        followed = shown[-1]
+        self.camera.follow(followed.center_x, followed.center_y)
 
-        if x_diff > 0:
-            self.texture = arcade.load_texture(
-                "assets/spider.png", flipped_horizontally=True
+    def on_draw(self):
+        arcade.start_render()
+        if self.sample is None:
+            arcade.draw_text(
+                f"Waiting for the host on port {self.guest.link.peer[1]}...",
+                SCREEN_WIDTH / 2,
+                SCREEN_HEIGHT / 2,
+                arcade.color.WHITE,
+                font_size=20,
+                anchor_x="center",
             )
-        else:
-            self.texture = arcade.load_texture("assets/spider.png")
+            return
+
+        self.camera.use()
+        self.static_chunks.draw(*self.camera.view)
+        left, right, bottom, top = self.camera.region(SPRITE_MARGIN)
+        _, x, y, fields = self.sample.groups["spiders"]
+        if len(self.spiders.slots) != len(x):
+            self.spiders.reset(len(x))
+        index = np.flatnonzero((x >= left) & (x <= right) & (y >= bottom) & (y <= top))
+        faces = [self.spider_textures[flipped] for flipped in fields[index, 0].tolist()]
+        self.spiders.show(index, x[index], y[index], faces)
+        self.spiders.sprite_list.draw()
+
+        _, x, y, _ = self.sample.groups["bullets"]
+        if len(self.bullets.slots) != len(x):
+            self.bullets.reset(len(x))
+        texture = textures.registry.get(textures.BULLET_TEXTURE)
+        self.bullets.show(np.arange(len(x)), x, y, [texture] * len(x))
+        self.bullets.sprite_list.draw()
+        self.player_list.draw()
 
-        # Taking into account the angle, calculate our change_x
-        # and change_y. Velocity is how fast the bullet travels.
-        self.change_x = math.cos(angle) * SPIDER_SPEED
-        # self.change_y = math.sin(angle) * SPIDER_SPEED
+        arcade.set_viewport(0, self.window.width, 0, self.window.height)
+        self.score_text.draw(self.sample.score)
+
+    def on_key_press(self, key, modifiers):
+        self.guest.keys |= GUEST_KEYS.get(key, 0)
+
+    def on_key_release(self, key, modifiers):
+        self.guest.keys &= ~GUEST_KEYS.get(key, 0)
+
+    def on_mouse_press(self, x: float, y: float, button: int, modifiers: int):
+        if self.camera is not None:
+            self.guest.click(*self.camera.to_world(x, y))
 
 
 def get_tip():
@@ -501,14 +1458,22 @@ def get_tip():
 
 # Various screens
 class StartScreen(arcade.View):
+    """
+    The title screen, shown while the game's assets load in the background.
+    """
+
     def __init__(self, window: arcade.Window = None):
         super().__init__(window)
         self.tip = get_tip()
-        self.song = arcade.load_sound("sounds/opening.wav")
 
     def on_show(self):
         arcade.set_background_color(arcade.csscolor.CORNFLOWER_BLUE)
-        self.song.play(volume=0.25)
+
+    def on_update(self, delta_time):
+        assets_ready()
+        # Loop the song once it has loaded
+        if "opening" in audio.sounds.effects and not audio.sounds.playing("opening"):
+            audio.sounds.play("opening", volume=0.25)
 
     def on_draw(self):
         arcade.start_render()
@@ -536,16 +1501,25 @@ class StartScreen(arcade.View):
             font_size=15,
             anchor_x="center",
         )
-        if self.song.is_complete():
-            self.song.play(volume=0.25)
+        startup_timer.mark("first_frame")
 
     def on_mouse_press(self, x: float, y: float, button: int, modifiers: int):
-        self.song.stop()
+        if "opening" in audio.sounds.effects:
+            audio.sounds.stop("opening")
         view = InstructionScreen()
         self.window.show_view(view)
 
 
 class GameOverScreen(arcade.View):
+    """
+    Shown when the player dies. Clicking starts the level again, in the
+    game it came from.
+    """
+
+    def __init__(self, game):
+        super().__init__()
+        self.game = game
+
     def on_show(self):
         arcade.set_background_color(arcade.csscolor.CORNFLOWER_BLUE)
 
@@ -569,9 +1543,8 @@ class GameOverScreen(arcade.View):
         )
 
     def on_mouse_press(self, x: float, y: float, button: int, modifiers: int):
-        game_view = SpiderIsland()
-        game_view.setup(game_view.level)
-        self.window.show_view(game_view)
+        self.game.restart()
+        self.window.show_view(self.game)
 
 
 class WinScreen(arcade.View):
@@ -606,12 +1579,15 @@ class WinScreen(arcade.View):
         )
 
     def on_mouse_press(self, x: float, y: float, button: int, modifiers: int):
-        game_view = SpiderIsland()
-        game_view.setup(game_view.level)
-        self.window.show_view(game_view)
+        self.window.show_view(new_game())
 
 
 class InstructionScreen(arcade.View):
+    def __init__(self, window: arcade.Window = None):
+        super().__init__(window)
+        # Clicked before the assets were loaded, so start once they are
+        self.starting = False
+
     def on_show(self):
         arcade.set_background_color(arcade.csscolor.CORNFLOWER_BLUE)
 
@@ -641,8 +1617,13 @@ class InstructionScreen(arcade.View):
             font_size=15,
             anchor_x="center",
         )
+        if self.starting:
+            loaded, total = preloader.progress()
+            prompt = f"Loading... {loaded}/{total}"
+        else:
+            prompt = "Click to start"
         arcade.draw_text(
-            "Click to start",
+            prompt,
             SCREEN_WIDTH / 2,
             SCREEN_HEIGHT / 2 - 125,
             arcade.color.WHITE,
@@ -650,18 +1631,127 @@ class InstructionScreen(arcade.View):
             anchor_x="center",
         )
 
+    def on_update(self, delta_time):
+        if assets_ready() and self.starting:
+            self.start_game()
+
     def on_mouse_press(self, x: float, y: float, button: int, modifiers: int):
-        game_view = SpiderIsland()
-        game_view.setup(game_view.level)
-        self.window.show_view(game_view)
+        startup_timer.mark("first_click")
+        self.starting = True
+        if assets_ready():
+            self.start_game()
+
+    def start_game(self):
+        # Raises here if anything failed to load
+        preloader.wait()
+        self.window.show_view(new_game())
+
+
+def new_game(level=1):
+    """
+    Return a game view set up on a level, recording its session if asked.
+    """
+    game_view = SpiderIsland()
+    game_view.level = level
+    game_view.setup(level)
+    if session_file is not None:
+        game_view.record_session(session_file)
+    return game_view
+
+
+def replay_game(session):
+    """
+    Return a game view that plays a recorded session back.
+    """
+    game_view = SpiderIsland(seed=session.seed)
+    game_view.replay = replay.Replay.of_session(session)
+    game_view.level = session.level
+    game_view.setup(session.level)
+    return game_view
 
 
 def main():
     """ Main method """
+    global session_file, dev_mode, net_host
+
+    parser = argparse.ArgumentParser(description=SCREEN_TITLE)
+    parser.add_argument(
+        "--profile", metavar="CSV", help="time every frame and write it to a CSV file"
+    )
+    parser.add_argument(
+        "--record", metavar="FILE", help="save the session of the last game played"
+    )
+    parser.add_argument("--replay", metavar="FILE", help="play a recorded session")
+    parser.add_argument(
+        "--telemetry", metavar="DIR", help="write gameplay events to files in a directory"
+    )
+    parser.add_argument(
+        "--dev",
+        action="store_true",
+        help="start straight in a level, and reload its map whenever it changes",
+    )
+    parser.add_argument("--level", type=int, default=1, help="level to start on with --dev")
+    parser.add_argument(
+        "--host",
+        type=int,
+        nargs="?",
+        const=netsync.DEFAULT_PORT,
+        metavar="PORT",
+        help="host the game for a guest on this machine to play along",
+    )
+    parser.add_argument(
+        "--join",
+        type=int,
+        nargs="?",
+        const=netsync.DEFAULT_PORT,
+        metavar="PORT",
+        help="play along with a game hosted on this machine",
+    )
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="read memory use at every level transition, and report it on exit",
+    )
+    args = parser.parse_args()
+
+    if args.profile:
+        frame_profiler.open_csv(args.profile)
+        frame_profiler.enable()
+    if args.telemetry:
+        gameplay_telemetry.start(args.telemetry)
+    if args.memory:
+        memory_watchdog.enable()
+    session_file = args.record
+    dev_mode = args.dev
+    if args.host is not None:
+        net_host = netsync.Host(args.host)
+
+    # Loading starts first, so it goes on while the window opens
+    load_assets()
     window = arcade.Window(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE)
-    start_view = StartScreen()
-    window.show_view(start_view)
-    arcade.run()
+    if args.replay:
+        preloader.wait()
+        window.show_view(replay_game(replay.Session.load(args.replay)))
+    elif args.join is not None:
+        preloader.wait()
+        window.show_view(GuestView(netsync.Guest(port=args.join)))
+    elif dev_mode:
+        preloader.wait()
+        window.show_view(new_game(args.level))
+    else:
+        start_view = StartScreen()
+        window.show_view(start_view)
+    try:
+        arcade.run()
+    finally:
+        frame_profiler.close_csv()
+        gameplay_telemetry.close()
+        if net_host is not None:
+            net_host.close()
+        if isinstance(window.current_view, SpiderIsland):
+            window.current_view.save_session()
+        for reading in memory_watchdog.readings:
+            print("\n".join(reading.describe()))
 
 
 if __name__ == "__main__":
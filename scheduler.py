@@ -0,0 +1,106 @@
+"""
+AI scheduler
+
+Spreads the spider AI over frames. A spider near the view thinks (looks
+up the flow field, re-aims, steers up walls and checks for water) every
+frame, and one further off only every few frames, by how far off it is;
+in between it keeps going the way it was. Far spiders that are due think
+a chunk at a time, longest waiting first, while the frame's AI budget
+lasts. Past that, the rest wait for the next frame instead of holding
+this one up, so a frame's AI time stays about the same however many
+spiders there are.
+
+Near spiders always think, whatever the budget, so play on screen doesn't
+depend on how fast the machine is. With no budget, every spider that is
+due thinks, and a game is played the same way every time.
+"""
+import time
+
+import numpy as np
+
+# (distance in pixels past the near region, frames between thoughts),
+# nearest first
+LOD_TIERS = ((0, 1), (128, 2), (320, 4))
+# Milliseconds of AI a frame may spend on far spiders
+BUDGET_MS = 2.0
+# Far spiders that think at once
+CHUNK_SIZE = 256
+
+
+class AIScheduler:
+    def __init__(self, tiers=LOD_TIERS, budget_ms=BUDGET_MS, chunk_size=CHUNK_SIZE):
+        self.distances = np.array([distance for distance, _ in tiers], dtype=float)
+        self.intervals = np.array([interval for _, interval in tiers])
+        self.budget_ms = budget_ms
+        self.chunk_size = chunk_size
+        self.reset()
+
+    def reset(self):
+        """
+        Zero the counters.
+        """
+        self.frames = 0
+        self.thoughts = 0
+        # Thoughts put off to a later frame, and frames that put any off
+        self.deferred = 0
+        self.over_budget = 0
+        # Most frames a spider went without thinking, and most milliseconds
+        # of AI in a frame
+        self.worst_latency = 0
+        self.last_ms = 0.0
+        self.worst_ms = 0.0
+
+    def interval(self, distance):
+        """
+        Frames between thoughts for spiders at each distance.
+        """
+        tier = np.searchsorted(self.distances, distance, side="right") - 1
+        return self.intervals[np.maximum(tier, 0)]
+
+    def batches(self, distance, waited):
+        """
+        Yield index arrays, into distance and waited, of the spiders to
+        think this frame: every near spider at once, then the far ones that
+        are due a chunk at a time, while the budget lasts. waited is how
+        many frames each spider has gone without thinking.
+        """
+        start = time.perf_counter()
+        self.frames += 1
+        interval = self.interval(distance)
+        due = waited >= interval
+
+        near = np.flatnonzero(due & (interval <= 1))
+        if len(near):
+            yield near
+            self._thought(waited[near])
+
+        far = np.flatnonzero(due & (interval > 1))
+        far = far[np.argsort(-waited[far], kind="stable")]
+        for first in range(0, len(far), self.chunk_size):
+            if (
+                self.budget_ms is not None
+                and (time.perf_counter() - start) * 1000 >= self.budget_ms
+            ):
+                self.deferred += len(far) - first
+                self.over_budget += 1
+                break
+            batch = far[first : first + self.chunk_size]
+            yield batch
+            self._thought(waited[batch])
+
+        self.last_ms = (time.perf_counter() - start) * 1000
+        self.worst_ms = max(self.worst_ms, self.last_ms)
+
+    def _thought(self, waited):
+        self.thoughts += len(waited)
+        self.worst_latency = max(self.worst_latency, int(waited.max()))
+
+    def report(self):
+        return {
+            "frames": self.frames,
+            "thoughts": self.thoughts,
+            "deferred": self.deferred,
+            "over_budget": self.over_budget,
+            "worst_latency_frames": self.worst_latency,
+            "worst_ms": self.worst_ms,
+        }
@@ -0,0 +1,134 @@
+"""
+Game snapshots
+
+A snapshot is everything that decides how a game goes on from a moment:
+the level and score, the player, every spider, bullet in flight and ruby
+left, and the state of the random number generators. Spiders, bullets and
+rubies are held as copies of their arrays, so taking one is a handful of
+array copies however big the map is.
+
+Restoring a snapshot puts a game back in place, into the sprite lists,
+shapes and engines it already has, so restarting a level takes a few
+milliseconds instead of loading the map again. The game snapshots every
+level as it starts, to restart from when the player dies, and keeps one
+more for quick save and load, saved as a small compressed file.
+"""
+import json
+import os
+import tempfile
+import zipfile
+import zlib
+
+import numpy as np
+
+_VERSION = 4
+
+
+class Snapshot:
+    def __init__(
+        self,
+        level,
+        score,
+        start_score,
+        player,
+        rng_state,
+        spiders,
+        spider_rng_state,
+        bullets,
+        coins,
+    ):
+        """
+        start_score is the score the level was started with, to restart
+        it with. player is a dict of the player's numbers; spiders and bullets are
+        dicts of arrays, and coins an array of which rubies are left.
+        rng_state is the game's random.Random state, and spider_rng_state
+        the swarm's NumPy bit generator state.
+        """
+        self.level = level
+        self.score = score
+        self.start_score = start_score
+        self.player = player
+        self.rng_state = rng_state
+        self.spiders = spiders
+        self.spider_rng_state = spider_rng_state
+        self.bullets = bullets
+        self.coins = coins
+
+    def save(self, filename):
+        version, internal, gauss = self.rng_state
+        meta = {
+            "version": _VERSION,
+            "level": self.level,
+            "score": self.score,
+            "start_score": self.start_score,
+            "player": self.player,
+            "rng_state": [version, list(internal), gauss],
+            "spider_rng_state": self.spider_rng_state,
+        }
+        arrays = {"coins": self.coins}
+        for name, values in self.spiders.items():
+            arrays[f"spiders.{name}"] = values
+        for name, values in self.bullets.items():
+            arrays[f"bullets.{name}"] = values
+        arrays["meta"] = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+
+        # Write to the side and swap in, so dying part way through leaves
+        # the last save as it was. Given a file rather than its name, NumPy
+        # doesn't add .npz to it.
+        filename = os.fspath(filename)
+        f = tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(os.path.abspath(filename)),
+            prefix=f"{os.path.basename(filename)}.",
+            suffix=".tmp",
+            delete=False,
+        )
+        try:
+            with f:
+                np.savez_compressed(f, **arrays)
+            os.replace(f.name, filename)
+        except BaseException:
+            os.remove(f.name)
+            raise
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Read a snapshot written by save(). Raises ValueError for a file that
+        isn't one, is from another version, or was cut short or damaged.
+        """
+        with open(filename, "rb") as f:
+            try:
+                archive = np.load(f)
+                arrays = {name: archive[name] for name in archive.files}
+            except (OSError, ValueError, EOFError, zipfile.BadZipFile, zlib.error):
+                arrays = {}
+
+        meta = arrays.pop("meta", None)
+        if meta is not None:
+            meta = json.loads(meta.tobytes().decode())
+        if meta is None or meta.get("version") != _VERSION:
+            raise ValueError(f"'{filename}' is not a saved game")
+
+        spiders = {}
+        bullets = {}
+        for name, values in arrays.items():
+            group, _, field = name.partition(".")
+            if group == "spiders":
+                spiders[field] = values
+            elif group == "bullets":
+                bullets[field] = values
+        try:
+            version, internal, gauss = meta["rng_state"]
+            return cls(
+                meta["level"],
+                meta["score"],
+                meta["start_score"],
+                meta["player"],
+                (version, tuple(internal), gauss),
+                spiders,
+                meta["spider_rng_state"],
+                bullets,
+                arrays["coins"],
+            )
+        except KeyError as e:
+            raise ValueError(f"'{filename}' is missing {e}") from e
@@ -0,0 +1,85 @@
+"""
+Sprite view
+
+Things the game has thousands of, like spiders, are kept as rows of
+arrays (a physics.Bodies), not as sprites: an arcade.Sprite costs well
+over a kilobyte, and a spider's row a few dozen bytes. A SpriteView gives
+sprites to only the bodies that are on screen when a frame is drawn,
+taking them from a pool of sprites that grows to the most ever on screen
+at once. Sprites of bodies that leave the screen go back to the pool for
+the next body that comes into it.
+
+Nothing in the game logic reads the sprites, so a run that never draws
+makes none.
+"""
+import arcade
+import numpy as np
+
+NO_SPRITE = -1
+
+
+class SpriteView:
+    def __init__(self, make_sprite, count=0):
+        """
+        make_sprite() returns a new sprite for the pool. count is how many
+        bodies there are to show.
+        """
+        self.make_sprite = make_sprite
+        self.sprite_list = arcade.SpriteList()
+        # Every sprite made, by slot, and the slots not showing a body
+        self.sprites = []
+        self.free = []
+        # The slot of each body's sprite, or NO_SPRITE
+        self.slots = np.full(count, NO_SPRITE, dtype=np.int32)
+
+    def __len__(self):
+        """
+        How many bodies have a sprite.
+        """
+        return len(self.sprite_list)
+
+    def _release(self, bodies):
+        for body in bodies.tolist():
+            slot = int(self.slots[body])
+            self.sprites[slot].remove_from_sprite_lists()
+            self.free.append(slot)
+        self.slots[bodies] = NO_SPRITE
+
+    def compact(self, keep):
+        """
+        Keep the bodies where keep is set, as the bodies themselves just did,
+        and take back the sprites of the rest.
+        """
+        self._release(np.flatnonzero(~keep & (self.slots != NO_SPRITE)))
+        self.slots = self.slots[keep]
+
+    def reset(self, count):
+        """
+        Take back every sprite, for a new set of count bodies.
+        """
+        self._release(np.flatnonzero(self.slots != NO_SPRITE))
+        self.slots = np.full(count, NO_SPRITE, dtype=np.int32)
+
+    def show(self, index, x, y, textures):
+        """
+        Show the bodies in index, and only those, at positions x and y with
+        their textures. Bodies no longer shown lose their sprites.
+        """
+        shown = np.zeros(len(self.slots), dtype=bool)
+        shown[index] = True
+        self._release(np.flatnonzero(~shown & (self.slots != NO_SPRITE)))
+
+        slots = self.slots[index].tolist()
+        bodies = zip(slots, x.tolist(), y.tolist(), textures)
+        for i, (slot, x, y, texture) in enumerate(bodies):
+            if slot == NO_SPRITE:
+                if self.free:
+                    slot = self.free.pop()
+                else:
+                    slot = len(self.sprites)
+                    self.sprites.append(self.make_sprite())
+                self.slots[index[i]] = slot
+                self.sprite_list.append(self.sprites[slot])
+            sprite = self.sprites[slot]
+            sprite.texture = texture
+            sprite.position = x, y
@@ -0,0 +1,115 @@
+"""
+Startup
+
+Assets are loaded on a background thread while the window opens and the
+start screen draws, one task per asset so each one's readiness can be
+checked on its own. A timer notes when startup milestones happen,
+counted from when the process started.
+"""
+import concurrent.futures
+import os
+import time
+
+
+def _process_age():
+    """
+    Return the seconds since the process started, where the system says,
+    or 0 to count from when this module was imported instead.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the command name, which may itself hold spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0.0
+    return max(uptime - started, 0.0)
+
+
+PROCESS_START = time.perf_counter() - _process_age()
+
+
+class StartupTimer:
+    """
+    Remembers the first time each named milestone is reached.
+    """
+
+    def __init__(self, start=PROCESS_START):
+        self.start = start
+        self.marks = {}
+
+    def mark(self, name):
+        """
+        Note a milestone, unless it has been reached already. Returns True
+        the first time.
+        """
+        if name in self.marks:
+            return False
+        self.marks[name] = time.perf_counter()
+        return True
+
+    def since(self, name, start=None):
+        """
+        Return the seconds from a milestone (or the process start) to
+        another, or None if either hasn't happened.
+        """
+        end = self.marks.get(name)
+        begin = self.start if start is None else self.marks.get(start)
+        if end is None or begin is None:
+            return None
+        return end - begin
+
+    def report(self):
+        """
+        Return the startup times as lines of text.
+        """
+        lines = []
+        for name, start, label in (
+            ("first_frame", None, "process start to first frame"),
+            ("assets_ready", None, "process start to assets loaded"),
+            ("first_game_frame", "first_click", "first click to first game frame"),
+        ):
+            seconds = self.since(name, start)
+            if seconds is not None:
+                lines.append(f"{label}: {seconds * 1000:.0f} ms")
+        return lines
+
+
+class Preloader:
+    """
+    Runs asset loads one after another on a worker thread, in the order
+    they were added, and keeps track of which are done.
+    """
+
+    def __init__(self):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        # asset name -> future of its load
+        self.tasks = {}
+
+    def add(self, name, load, *args):
+        self.tasks[name] = self._executor.submit(load, *args)
+
+    def ready(self, name=None):
+        """
+        Whether one asset, or every asset, has finished loading.
+        """
+        if name is not None:
+            return self.tasks[name].done()
+        return all(task.done() for task in self.tasks.values())
+
+    def progress(self):
+        """
+        Return (loaded, total) counts of assets.
+        """
+        done = sum(task.done() for task in self.tasks.values())
+        return done, len(self.tasks)
+
+    def wait(self):
+        """
+        Block until every asset is loaded. A load that failed raises its
+        error here.
+        """
+        for task in self.tasks.values():
+            task.result()
@@ -0,0 +1,269 @@
+"""
+Spider swarm
+
+The spider AI for a whole level at once. Positions, velocities and facing
+are held as NumPy arrays so that re-aiming, wall climbing, falling out
+of the world and drowning are each one array operation over every spider,
+instead of a Python loop with a collision query per spider. Spiders find
+their way to the player along one flow field shared by the whole swarm.
+
+The arrays are the spiders' real state, and all of it: there is no
+sprite per spider. The batched physics engine moves them too, and
+draw_at() hands sprites to just the spiders on screen through a
+spriteview.SpriteView.
+
+Only the spiders inside the swarm's region (around the camera) are
+updated; the rest are frozen until the player comes near them again.
+Spiders in the region but away from the view think less often, as a
+scheduler.AIScheduler has them.
+"""
+import random
+
+import arcade
+import numpy as np
+
+import flowfield
+import physics
+import scheduler
+import spriteview
+import textures
+
+# Same odds as random.randrange(100) == 0
+REAIM_CHANCE = 0.01
+# How far above the top of a wall a climbing spider aims
+CLIMB_HEIGHT = 100
+
+
+def overlapping(mins, maxs, shapes):
+    """
+    Return (i, j) index arrays of boxes i whose bounds overlap the bounds
+    of shape j. Boxes that only touch do not overlap.
+    """
+    i, j = shapes.candidates(mins, maxs)
+    overlap = (
+        (mins[i, 0] < shapes.max[j, 0])
+        & (maxs[i, 0] > shapes.min[j, 0])
+        & (mins[i, 1] < shapes.max[j, 1])
+        & (maxs[i, 1] > shapes.min[j, 1])
+    )
+    return i[overlap], j[overlap]
+
+
+class SpiderSwarm(physics.Bodies):
+    def __init__(
+        self, positions, scale, walls, water, speed, seed=None, flow_field=None
+    ):
+        """
+        positions is an (n, 2) array of where the spiders start, and scale
+        the scale their sprites are drawn at.
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        self.textures = textures.registry.load_pair(textures.SPIDER_TEXTURE)
+        hit_box = physics.scaled_hit_box(self.textures[0].hit_box_points, scale)
+        super().__init__(positions[:, 0], positions[:, 1], hit_box)
+        self.speed = speed
+        self.flipped = np.zeros(len(self), dtype=bool)
+        # Spiders only take to the flow field once they have noticed the
+        # player, on a REAIM_CHANCE roll, as they only turned to face the
+        # player on one before there was a field
+        self.awake = np.zeros(len(self), dtype=bool)
+        # Which spider of the map each is, kept as others die, to tell
+        # spiders apart from one state to the next
+        self.ids = np.arange(len(self), dtype=np.uint32)
+
+        # Spiders within the near region think every frame, and the rest
+        # less often the further off they are. waited is how many frames
+        # each has moved without thinking, started apart so far spiders
+        # don't all come due at once.
+        self.near_region = None
+        self.scheduler = scheduler.AIScheduler()
+        self.waited = np.arange(len(self)) % self.scheduler.intervals.max()
+        self.view = spriteview.SpriteView(
+            lambda: arcade.Sprite(scale=scale), count=len(self)
+        )
+
+        # physics.Shapes of the wall and water layers
+        self.walls = walls
+        self.water = water
+
+        # A flowfield.FlowField over the map to follow to the target, or
+        # None to only ever head straight for it
+        self.flow_field = flow_field
+
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.rng = np.random.default_rng(seed)
+
+    def compact(self, keep):
+        super().compact(keep)
+        self.flipped = self.flipped[keep]
+        self.awake = self.awake[keep]
+        self.ids = self.ids[keep]
+        self.waited = self.waited[keep]
+        self.view.compact(keep)
+
+    def kill(self, index):
+        """
+        Take the spiders in index out of the swarm.
+        """
+        keep = np.ones(len(self), dtype=bool)
+        keep[index] = False
+        self.compact(keep)
+
+    def state(self):
+        """
+        Return copies of the arrays that are the spiders' state, for
+        set_state().
+        """
+        return {
+            "x": self.x.copy(),
+            "y": self.y.copy(),
+            "change_x": self.change_x.copy(),
+            "change_y": self.change_y.copy(),
+            "flipped": self.flipped.copy(),
+            "awake": self.awake.copy(),
+            "ids": self.ids.copy(),
+            "waited": self.waited.copy(),
+        }
+
+    def set_state(self, state):
+        """
+        Put the spiders back as state() found them.
+        """
+        self.x = state["x"].copy()
+        self.y = state["y"].copy()
+        self.change_x = state["change_x"].copy()
+        self.change_y = state["change_y"].copy()
+        self.flipped = state["flipped"].copy()
+        self.awake = state["awake"].copy()
+        self.ids = state["ids"].copy()
+        self.waited = state["waited"].copy()
+        self.view.reset(len(self))
+
+    def _face(self, index, right):
+        """
+        Turn spiders to face right where right is set and left elsewhere.
+        """
+        self.flipped[index] = right
+
+    def draw_at(self, region, x, y):
+        """
+        Give sprites to the spiders whose positions x and y (every spider's,
+        as drawn) are inside a (left, right, bottom, top) region, and draw
+        them.
+        """
+        left, right, bottom, top = region
+        index = np.flatnonzero((x >= left) & (x <= right) & (y >= bottom) & (y <= top))
+        pair = self.textures
+        faces = [pair[flipped] for flipped in self.flipped[index].tolist()]
+        self.view.show(index, x[index], y[index], faces)
+        self.view.sprite_list.draw()
+
+    def distance_from_near(self, index):
+        """
+        How far the spiders in index are outside the near region, along
+        whichever axis is furthest; 0 inside it, or for every spider if
+        there is none.
+        """
+        if self.near_region is None:
+            return np.zeros(len(index))
+        left, right, bottom, top = self.near_region
+        x = self.x[index]
+        y = self.y[index]
+        outside_x = np.maximum(np.maximum(left - x, x - right), 0)
+        outside_y = np.maximum(np.maximum(bottom - y, y - top), 0)
+        return np.maximum(outside_x, outside_y)
+
+    def update(self, target_x, target_y, world_width):
+        """
+        Run one frame of spider AI against the target (the player). Returns
+        how many spiders died this frame, who are no longer in the swarm.
+        """
+        if not len(self):
+            return 0
+        active = self.active()
+        if not len(active):
+            return 0
+
+        # Everyone keeps walking; only those the scheduler picks think
+        self.x[active] += self.change_x[active]
+        self.y[active] += self.change_y[active]
+        self.waited[active] += 1
+        if self.flow_field is not None:
+            self.flow_field.update(target_x, target_y)
+
+        dead = []
+        waited = self.waited[active]
+        for batch in self.scheduler.batches(self.distance_from_near(active), waited):
+            thinking = active[batch]
+            self.waited[thinking] = 0
+            dead.append(thinking[self._think(thinking, target_x, target_y, world_width)])
+
+        dead = np.concatenate(dead) if dead else np.zeros(0, dtype=int)
+        if not len(dead):
+            return 0
+        self.kill(dead)
+        return len(dead)
+
+    def _think(self, active, target_x, target_y, world_width):
+        """
+        Pick a way for each of the spiders in active to go, and return a
+        mask of those that died.
+        """
+        # Pick a way: along the flow field where there is one, straight at
+        # the target once in its cell, and otherwise toward it now and then
+        roll = self.rng.random(len(active)) < REAIM_CHANCE
+        if self.flow_field is not None:
+            # Spiders are in the cell their feet are in, so one part way up
+            # a wall is still climbing it
+            feet = self.y[active] + self.hit_box_min[1] + 1
+            move_x, move_y, distance = self.flow_field.moves(self.x[active], feet)
+        else:
+            move_x = np.zeros(len(active), dtype=np.int8)
+            move_y = np.zeros(len(active), dtype=np.int8)
+            distance = np.full(len(active), flowfield.UNREACHABLE)
+        # To spiders that haven't noticed the target yet, there is no field
+        awake = self.awake[active] | roll
+        self.awake[active] = awake
+        distance = np.where(awake, distance, flowfield.UNREACHABLE)
+
+        # A step down the field is a drop, so keep going the same way and
+        # let gravity take over at the edge
+        walking = (distance > 0) & (move_x != 0)
+        walkers = active[walking]
+        if len(walkers):
+            self.change_x[walkers] = move_x[walking] * self.speed
+            self._face(walkers, move_x[walking] > 0)
+
+        reaim = active[(roll & (distance == flowfield.UNREACHABLE)) | (distance == 0)]
+        if len(reaim):
+            x_diff = target_x - self.x[reaim]
+            y_diff = target_y - self.y[reaim]
+            angle = np.arctan2(y_diff, x_diff)
+            self.change_x[reaim] = np.cos(angle) * self.speed
+            self._face(reaim, x_diff > 0)
+
+        # Climb any wall we walked into, toward a point above the last one,
+        # unless the field says to go some other way
+        left, right, bottom, top = self.bounds(active)
+        mins = np.stack((left, bottom), axis=1)
+        maxs = np.stack((right, top), axis=1)
+        spider, wall = overlapping(mins, maxs, self.walls)
+        if len(spider):
+            last_wall = np.full(len(active), -1)
+            np.maximum.at(last_wall, spider, wall)
+            may_climb = (distance == flowfield.UNREACHABLE) | (move_y == 1)
+            climbing = (last_wall >= 0) & may_climb
+            walls = last_wall[climbing]
+            climbers = active[climbing]
+            dest_x = (self.walls.min[walls, 0] + self.walls.max[walls, 0]) / 2
+            dest_y = self.walls.max[walls, 1] + CLIMB_HEIGHT
+            angle = np.arctan2(dest_y - self.y[climbers], dest_x - self.x[climbers])
+            self.change_x[climbers] = np.cos(angle) * self.speed
+            self.change_y[climbers] = np.sin(angle) * self.speed
+
+        # Spiders die out of the world and in water
+        dead = (top < 0) | (right < 0) | (left > world_width)
+        drowned, _ = overlapping(mins, maxs, self.water)
+        dead[drowned] = True
+        return dead
@@ -0,0 +1,14 @@
+"""
+The game's modules sit at the top of the repository and load maps and
+assets from paths relative to it, and no test opens a window.
+"""
+import os
+import sys
+
+import pyglet
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+pyglet.options["shadow_window"] = False
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
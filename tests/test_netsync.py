@@ -0,0 +1,229 @@
+"""
+The two-player state sync: what the host sends, and what the guest draws
+of it.
+"""
+import random
+import time
+
+import arcade
+import numpy as np
+import pytest
+
+import headless
+import netsync
+import run_game
+
+
+def world(tick, spiders, level=1, epoch=0, score=0, coins=(0, 1, 2)):
+    """
+    A WorldState with the player at the origin and spiders given as
+    {id: (x, y)}.
+    """
+    ids = sorted(spiders)
+    x = [spiders[i][0] for i in ids]
+    y = [spiders[i][1] for i in ids]
+    return netsync.WorldState(
+        tick,
+        level,
+        epoch,
+        score,
+        {
+            "players": netsync.entities([0], [0.0], [0.0], [1]),
+            "spiders": netsync.entities(ids, x, y, [i % 2 for i in ids]),
+            "bullets": netsync.entities([], [], []),
+            "coins": netsync.entities(coins),
+        },
+    )
+
+
+def swarm(count, seed, moved=1.0):
+    rng = random.Random(seed)
+    return {i: (rng.uniform(0, 4000) * moved, rng.uniform(0, 2000)) for i in range(count)}
+
+
+def test_whole_state_round_trip():
+    state = world(10, swarm(50, 1), level=3, score=7)
+    decoded = netsync.decode(netsync.encode(state), {})
+    assert decoded.same_as(state)
+
+
+def test_delta_round_trip_is_smaller():
+    base = world(10, swarm(200, 1))
+    spiders = swarm(200, 1)
+    for i in range(0, 200, 3):
+        x, y = spiders[i]
+        spiders[i] = (x + 1.5, y - 0.25)
+    for i in range(0, 200, 7):
+        del spiders[i]
+    spiders[1000] = (5.0, 6.0)
+    state = world(12, spiders, coins=(0, 2))
+
+    message = netsync.encode(state, base)
+    decoded = netsync.decode(message, {base.tick: base})
+    assert decoded.same_as(state)
+    assert len(message) < len(netsync.encode(state)) / 2
+
+
+def test_delta_without_its_base_is_unusable():
+    base = world(10, swarm(5, 1))
+    state = world(12, swarm(5, 2))
+    assert netsync.decode(netsync.encode(state, base), {}) is None
+
+
+@pytest.mark.parametrize("epoch", [0, 65535, 65536, 70000, 2 ** 32 - 1])
+def test_epoch_is_sent_whole(epoch):
+    state = world(10, swarm(3, 1), epoch=epoch)
+    assert netsync.decode(netsync.encode(state), {}).epoch == epoch
+
+
+def test_fragments_reassemble_in_any_order():
+    message = bytes(random.Random(1).getrandbits(8) for _ in range(5000))
+    datagrams = netsync.fragments(netsync.STATE, 4, message, size=1000)
+    assert len(datagrams) == 5
+    random.Random(2).shuffle(datagrams)
+
+    reassembler = netsync.Reassembler()
+    results = [reassembler.add(datagram) for datagram in datagrams]
+    assert results[:-1] == [None] * 4
+    assert results[-1] == (netsync.STATE, 4, message)
+
+
+def test_incomplete_message_is_dropped_for_a_newer_one():
+    reassembler = netsync.Reassembler()
+    old = netsync.fragments(netsync.STATE, 4, b"a" * 3000, size=1000)
+    new = netsync.fragments(netsync.STATE, 6, b"b" * 3000, size=1000)
+    for datagram in old[:2] + new:
+        result = reassembler.add(datagram)
+    assert result == (netsync.STATE, 6, b"b" * 3000)
+    assert reassembler.dropped == 1
+    assert not reassembler.partial
+
+
+@pytest.fixture
+def link():
+    host = netsync.Host(port=0)
+    guest = netsync.Guest(port=host.link.address[1])
+    # The host learns where the guest is from its first input
+    guest.poll()
+    _wait(host.poll, lambda: host.link.peer is not None)
+    yield host, guest
+    guest.close()
+    host.close()
+
+
+def _wait(poll, done, timeout=2.0):
+    end = time.monotonic() + timeout
+    while True:
+        poll()
+        if done() or time.monotonic() > end:
+            return
+
+
+def _deliver(host, guest, state):
+    host.send(state)
+    _wait(guest.poll, lambda: guest.latest is not None and guest.latest.tick == state.tick)
+    assert guest.latest.same_as(state)
+    # The guest acknowledges it as it polls
+    _wait(host.poll, lambda: host.acked is not None and host.acked.tick == state.tick)
+
+
+def test_host_sends_changes_from_the_acked_state(link):
+    host, guest = link
+    _deliver(host, guest, world(2, swarm(100, 1)))
+    assert host.full_states == 1
+    _deliver(host, guest, world(4, swarm(100, 1, moved=1.01)))
+    assert (host.states, host.full_states) == (2, 1)
+
+
+def test_dropped_state_is_skipped_over(link, monkeypatch):
+    host, guest = link
+    _deliver(host, guest, world(2, swarm(100, 1)))
+
+    # State 4 never arrives, so the guest still has only state 2 acked
+    sent = host.link.send
+    monkeypatch.setattr(host.link, "send", lambda kind, tick, message: len(message))
+    host.send(world(4, swarm(100, 1, moved=1.01)))
+    monkeypatch.setattr(host.link, "send", sent)
+    guest.poll()
+    assert guest.latest.tick == 2
+
+    # State 6 goes as changes from state 2, which the guest has
+    _deliver(host, guest, world(6, swarm(100, 1, moved=1.02)))
+    assert (host.states, host.full_states) == (3, 1)
+    assert guest.unusable == 0
+
+
+def test_new_epoch_is_sent_whole(link):
+    host, guest = link
+    _deliver(host, guest, world(2, swarm(100, 1), epoch=70000))
+    # A restart puts the world back, so nothing before it is a base
+    _deliver(host, guest, world(4, swarm(100, 1), epoch=70001))
+    assert host.full_states == 2
+    sample = guest.sample(1 / 60)
+    assert sample.epoch == 70001
+
+
+class SampledGuest:
+    """
+    Stands in for a netsync.Guest, handing the view the host's state as it
+    is now.
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self.keys = 0
+
+    def poll(self):
+        pass
+
+    def sample(self, delta_time):
+        state = self.host.world_state()
+        return netsync.blend(state, state, 1.0)
+
+
+def test_guest_keeps_its_level_until_the_host_changes_level(monkeypatch):
+    window = headless.HeadlessWindow()
+    arcade.set_window(window)
+    host = headless.HeadlessSpiderIsland(seed=1)
+    window.show_view(host)
+    host.level = 1
+    host.setup(1)
+
+    built = []
+    build = run_game.level_loader.build
+    monkeypatch.setattr(
+        run_game.level_loader, "build", lambda level, *args: built.append(level) or build(level)
+    )
+    view = run_game.GuestView(SampledGuest(host))
+    # The first level is built in the background too
+    view.on_update(1 / 60)
+    run_game.level_loader.wait(1)
+    view.on_update(1 / 60)
+    assert view.level == 1
+    chunks = view.static_chunks
+
+    # A ruby taken, then put back by a restart, in the world already built
+    host.coin_shapes.sprites[0].remove_from_sprite_lists()
+    host.coin_shapes.refresh()
+    view.on_update(1 / 60)
+    assert not view.coins_shown[0]
+    host.restart()
+    view.on_update(1 / 60)
+    assert view.epoch == host.epoch
+    assert view.static_chunks is chunks
+    assert view.coins_shown.all()
+    assert view.coin_sprites[0] in view.coin_list
+    assert built == [1]
+
+    # The host and guest share one loader here, so the host takes the
+    # level 2 built in the background, and the guest draws level 1 until
+    # its own is built
+    host.level = 2
+    host.setup(2)
+    view.on_update(1 / 60)
+    assert view.level == 1
+    run_game.level_loader.wait(2)
+    view.on_update(1 / 60)
+    assert view.level == 2
+    assert view.static_chunks is not chunks
+    assert built.count(1) == 1 and built.count(2) == 1
@@ -0,0 +1,29 @@
+"""
+The batched platformer engine against arcade's, on every shipped map.
+"""
+import glob
+
+import pytest
+
+import levels
+import physics
+import run_game
+import textures
+
+MAPS = sorted(glob.glob(levels.MAP_PATTERN.format("*")))
+
+
+@pytest.fixture(scope="module", autouse=True)
+def preloaded_textures():
+    textures.registry.preload()
+
+
+def test_every_level_is_checked():
+    assert MAPS
+
+
+@pytest.mark.parametrize("filename", MAPS)
+def test_batched_engine_matches_arcade(filename):
+    result = physics.side_by_side(filename, *run_game.physics_check_settings())
+    assert result["spiders"]
+    assert result["difference"] < 1e-6
@@ -0,0 +1,68 @@
+"""
+A recorded game plays back the same, whatever the frame rate.
+"""
+import pytest
+
+import headless
+import replay
+
+SCRIPT = [
+    "0 click 800 200",
+    "5 click 100 400",
+    "10 click 900 100",
+    "15 click 500 600",
+    "20 click 700 200",
+    "25 click 300 150",
+    "30 press RIGHT",
+    "60 click 800 200",
+    "65 click 900 400",
+    "120 release RIGHT",
+    "150 press LEFT",
+    "180 press UP",
+    "190 release UP",
+]
+
+
+@pytest.fixture(scope="module")
+def recording(tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp("replay") / "run.rec")
+    result = headless.simulate(
+        2, headless.parse_script(SCRIPT), max_frames=300, seed=4, record=filename
+    )
+    return result, replay.Session.load(filename)
+
+
+def test_recording_has_every_frame(recording):
+    result, session = recording
+    assert result.score > 0
+    assert (session.level, session.seed) == (2, 4)
+    assert len(session.checksums) == session.frames == result.frames
+
+
+@pytest.mark.parametrize("render_fps", [20, 60, 144])
+def test_replay_ends_the_same(recording, render_fps):
+    result, session = recording
+    replayed = headless.simulate(
+        session.level,
+        session.events,
+        session.frames,
+        session.seed,
+        single_level=False,
+        checksums=session.checksums,
+        render_fps=render_fps,
+    )
+    assert replayed.outcome == result.outcome
+    assert (replayed.frames, replayed.score) == (result.frames, result.score)
+
+
+def test_replay_with_another_seed_diverges(recording):
+    _, session = recording
+    replayed = headless.simulate(
+        session.level,
+        session.events,
+        session.frames,
+        session.seed + 1,
+        single_level=False,
+        checksums=session.checksums,
+    )
+    assert replayed.outcome == "diverged"
@@ -0,0 +1,97 @@
+"""
+Quick saves that can't be loaded are reported as ValueError, whatever is
+wrong with them.
+"""
+import random
+
+import numpy as np
+import pytest
+
+import arcade
+import headless
+import snapshot
+
+
+def saved_game(filename):
+    snapshot.Snapshot(
+        1,
+        5,
+        2,
+        {"center_x": 64.0, "center_y": 128.0},
+        random.Random(1).getstate(),
+        {"x": np.zeros(3), "y": np.zeros(3)},
+        np.random.default_rng(1).bit_generator.state,
+        {"x": np.zeros(2)},
+        np.ones(4, dtype=bool),
+    ).save(filename)
+
+
+def test_round_trip(tmp_path):
+    filename = tmp_path / "quicksave.npz"
+    saved_game(filename)
+    loaded = snapshot.Snapshot.load(filename)
+    assert (loaded.level, loaded.score, loaded.start_score) == (1, 5, 2)
+    assert loaded.rng_state == random.Random(1).getstate()
+    assert set(loaded.spiders) == {"x", "y"}
+    assert loaded.coins.tolist() == [True] * 4
+
+
+def test_truncated_save(tmp_path):
+    filename = tmp_path / "quicksave.npz"
+    saved_game(filename)
+    data = filename.read_bytes()
+    filename.write_bytes(data[: len(data) // 2])
+    with pytest.raises(ValueError):
+        snapshot.Snapshot.load(filename)
+
+
+def test_save_missing_an_array(tmp_path):
+    filename = tmp_path / "quicksave.npz"
+    saved_game(filename)
+    with np.load(filename) as archive:
+        arrays = {name: archive[name] for name in archive.files if name != "coins"}
+    with open(filename, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    with pytest.raises(ValueError):
+        snapshot.Snapshot.load(filename)
+
+
+def test_not_a_save(tmp_path):
+    filename = tmp_path / "quicksave.npz"
+    filename.write_bytes(b"not a save")
+    with pytest.raises(ValueError):
+        snapshot.Snapshot.load(filename)
+
+
+def test_failed_save_keeps_the_last_one(tmp_path, monkeypatch):
+    filename = tmp_path / "quicksave.npz"
+    saved_game(filename)
+    before = filename.read_bytes()
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(np, "savez_compressed", fail)
+    with pytest.raises(OSError):
+        saved_game(filename)
+    assert filename.read_bytes() == before
+    assert [path.name for path in tmp_path.iterdir()] == ["quicksave.npz"]
+
+
+def test_restart_after_loading_another_level(tmp_path):
+    filename = tmp_path / "quicksave.npz"
+    window = headless.HeadlessWindow()
+    arcade.set_window(window)
+    game = headless.HeadlessSpiderIsland(seed=1)
+    window.show_view(game)
+    game.level = 3
+    game.setup(3, 7)
+    game.score = 9
+    game.quick_save(filename)
+
+    game.level = 1
+    game.setup(1)
+    game.quick_load(filename)
+    assert (game.level, game.score) == (3, 9)
+    game.restart()
+    assert (game.level, game.score) == (3, 7)
@@ -0,0 +1,81 @@
+"""
+Texture registry
+
+Every texture the game swaps in at runtime is loaded here once, at startup,
+so sprites can be built and re-skinned without going back to disk.
+"""
+import arcade
+
+PLAYER_TEXTURE_PATH = "assets/player"
+SPIDER_TEXTURE = "assets/spider.png"
+BULLET_TEXTURE = "assets/laser.png"
+PLAYER_WALK_FRAMES = 5
+
+# Images used by the map tiles
+TILE_TEXTURES = [
+    "assets/box.png",
+    "assets/grass.png",
+    "assets/ladder.png",
+    "assets/ruby.png",
+    "assets/spider.png",
+    "assets/water.png",
+]
+
+
+class TextureRegistry:
+    """
+    Holds [unflipped, flipped] texture pairs by file name and counts how
+    often a lookup had to load from disk.
+    """
+
+    def __init__(self):
+        self._pairs = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load_pair(self, filename):
+        pair = self._pairs.get(filename)
+        if pair is None:
+            self.misses += 1
+            pair = [
+                arcade.load_texture(filename),
+                arcade.load_texture(filename, flipped_horizontally=True),
+            ]
+            self._pairs[filename] = pair
+        else:
+            self.hits += 1
+        return pair
+
+    def get(self, filename, flipped=False):
+        return self.load_pair(filename)[1 if flipped else 0]
+
+    def files(self):
+        """
+        Return the file of every texture the game needs while running.
+        """
+        return [
+            f"{PLAYER_TEXTURE_PATH}_idle.png",
+            *(f"{PLAYER_TEXTURE_PATH}_walk_{i}.png" for i in range(PLAYER_WALK_FRAMES)),
+            SPIDER_TEXTURE,
+            BULLET_TEXTURE,
+            *TILE_TEXTURES,
+        ]
+
+    def preload(self):
+        """
+        Load every texture the game needs while running, then reset the
+        counters so that any later miss shows up.
+        """
+        for filename in self.files():
+            self.load_pair(filename)
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._pairs)
+
+
+registry = TextureRegistry()
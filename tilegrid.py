@@ -0,0 +1,238 @@
+"""
+Tile occupancy grid
+
+Every map is a regular grid, so the tiles of a static layer can be found
+by turning a position into a row and column instead of going through a
+spatial hash. A TileGrid is an array of tile indices, one per cell, built
+straight from a layer's tile data; the indices match the order of the
+sprites levels.build_layer makes for the same layer. A MergedGrid covers
+the tiles of a solid layer with a few big rectangles instead, for
+collisions.
+
+Rows count up from the bottom of the map, like arcade's y axis.
+"""
+import math
+
+import numpy as np
+
+EMPTY = -1
+
+
+class TileGrid:
+    def __init__(self, data, layer_name, scaling):
+        self.columns = data.width
+        self.rows = data.height
+        self.cell_width = data.tile_width * scaling
+        self.cell_height = data.tile_height * scaling
+        self.cells = np.full((self.rows, self.columns), EMPTY, dtype=np.int32)
+
+        # (row, column) of every tile, by tile index
+        locations = []
+        for row_from_top, column, _, _ in data.placed_tiles(layer_name):
+            row = self.rows - 1 - row_from_top
+            self.cells[row, column] = len(locations)
+            locations.append((row, column))
+        self.locations = np.array(locations, dtype=np.int32).reshape(-1, 2)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def remove(self, tiles):
+        """
+        Empty the cells of tiles that are gone, such as collected rubies.
+        """
+        for row, column in self.locations[np.asarray(tiles, dtype=int)]:
+            self.cells[row, column] = EMPTY
+
+    def restore(self, tiles):
+        """
+        Fill the cells of tiles that were removed again.
+        """
+        tiles = np.asarray(tiles, dtype=int)
+        for tile, (row, column) in zip(tiles.tolist(), self.locations[tiles]):
+            self.cells[row, column] = tile
+
+    def cell_at(self, x, y):
+        """
+        Return the (row, column) containing a point.
+        """
+        return int(y // self.cell_height), int(x // self.cell_width)
+
+    def _cell_range(self, left, right, bottom, top):
+        # A box ending exactly on a cell edge still touches the next cell
+        first_column = np.ceil(np.asarray(left) / self.cell_width).astype(int) - 1
+        last_column = np.floor(np.asarray(right) / self.cell_width).astype(int)
+        first_row = np.ceil(np.asarray(bottom) / self.cell_height).astype(int) - 1
+        last_row = np.floor(np.asarray(top) / self.cell_height).astype(int)
+        return (
+            np.maximum(first_column, 0),
+            np.minimum(last_column, self.columns - 1),
+            np.maximum(first_row, 0),
+            np.minimum(last_row, self.rows - 1),
+        )
+
+    def in_rect(self, left, right, bottom, top):
+        """
+        Return the indices of the tiles whose cells overlap or touch a
+        rectangle.
+        """
+        first_column, last_column, first_row, last_row = self._cell_range(
+            left, right, bottom, top
+        )
+        if first_column > last_column or first_row > last_row:
+            return np.zeros(0, dtype=np.int32)
+        block = self.cells[first_row : last_row + 1, first_column : last_column + 1]
+        return np.sort(block[block != EMPTY])
+
+    def pairs(self, mins, maxs):
+        """
+        Broadphase for many boxes at once. mins and maxs are (n, 2) arrays
+        of box corners; returns (i, j) index arrays of box i touching the
+        cell of tile j.
+        """
+        empty = np.zeros(0, dtype=int)
+        if not len(mins) or not len(self):
+            return empty, empty
+        first_column, last_column, first_row, last_row = self._cell_range(
+            mins[:, 0], maxs[:, 0], mins[:, 1], maxs[:, 1]
+        )
+        span_columns = int((last_column - first_column).max(initial=-1)) + 1
+        span_rows = int((last_row - first_row).max(initial=-1)) + 1
+        if span_columns <= 0 or span_rows <= 0:
+            return empty, empty
+
+        step_column, step_row = np.meshgrid(np.arange(span_columns), np.arange(span_rows))
+        columns = first_column[:, None] + step_column.ravel()[None, :]
+        rows = first_row[:, None] + step_row.ravel()[None, :]
+        valid = (columns <= last_column[:, None]) & (rows <= last_row[:, None])
+
+        tiles = np.where(
+            valid,
+            self.cells[
+                np.clip(rows, 0, self.rows - 1), np.clip(columns, 0, self.columns - 1)
+            ],
+            EMPTY,
+        )
+        i, slot = np.nonzero(tiles != EMPTY)
+        return i, tiles[i, slot].astype(int)
+
+    def along_line(self, start_x, start_y, end_x, end_y):
+        """
+        Return the indices of the tiles whose cells a line segment passes
+        through, in order from the start.
+        """
+        row, column = self.cell_at(start_x, start_y)
+        end_row, end_column = self.cell_at(end_x, end_y)
+        dx = end_x - start_x
+        dy = end_y - start_y
+        step_column = 1 if dx > 0 else -1
+        step_row = 1 if dy > 0 else -1
+
+        # Distance along the line, as a fraction, to the next cell edge on
+        # each axis and between cell edges
+        if dx:
+            next_x = (column + (step_column > 0)) * self.cell_width
+            t_max_x = (next_x - start_x) / dx
+            t_delta_x = self.cell_width / abs(dx)
+        else:
+            t_max_x = t_delta_x = math.inf
+        if dy:
+            next_y = (row + (step_row > 0)) * self.cell_height
+            t_max_y = (next_y - start_y) / dy
+            t_delta_y = self.cell_height / abs(dy)
+        else:
+            t_max_y = t_delta_y = math.inf
+
+        tiles = []
+        steps = abs(end_row - row) + abs(end_column - column)
+        for _ in range(steps + 1):
+            if 0 <= row < self.rows and 0 <= column < self.columns:
+                tile = self.cells[row, column]
+                if tile != EMPTY:
+                    tiles.append(int(tile))
+            if t_max_x < t_max_y:
+                t_max_x += t_delta_x
+                column += step_column
+            else:
+                t_max_y += t_delta_y
+                row += step_row
+        return tiles
+
+
+def merge_cells(filled):
+    """
+    Cover the set cells of a 2D boolean array with rectangles that don't
+    overlap, greedily: from the bottom left, each rectangle runs as far
+    along its row as it can, then grows up while the whole run above is
+    set too. Returns an (n, 4) array of (row, column, rows, columns).
+    """
+    filled = np.array(filled, dtype=bool)
+    rows, columns = filled.shape
+    rects = []
+    for row, column in np.argwhere(filled).tolist():
+        if not filled[row, column]:
+            continue
+        end_column = column + 1
+        while end_column < columns and filled[row, end_column]:
+            end_column += 1
+        end_row = row + 1
+        while end_row < rows and filled[end_row, column:end_column].all():
+            end_row += 1
+        filled[row:end_row, column:end_column] = False
+        rects.append((row, column, end_row - row, end_column - column))
+    return np.array(rects, dtype=np.int32).reshape(-1, 4)
+
+
+class MergedGrid(TileGrid):
+    """
+    The tiles of another grid covered by as few rectangles as merge_cells
+    finds, each cell holding the index of the rectangle over it. Tiles not
+    set in whole (such as tiles whose hit box doesn't fill their cell)
+    are never merged, and keep one cell each; tiles gives the tile of
+    each of those rectangles, and EMPTY for merged ones.
+
+    Like the grid it comes from, it is static: nothing can be removed.
+    """
+
+    def __init__(self, grid, whole=None):
+        self.columns = grid.columns
+        self.rows = grid.rows
+        self.cell_width = grid.cell_width
+        self.cell_height = grid.cell_height
+
+        if whole is None:
+            whole = np.ones(len(grid), dtype=bool)
+        mergeable = np.zeros(grid.cells.shape, dtype=bool)
+        rows, columns = grid.locations[whole].T
+        mergeable[rows, columns] = True
+        merged = merge_cells(mergeable)
+
+        single = np.flatnonzero(~whole)
+        singles = np.ones((len(single), 4), dtype=np.int32)
+        singles[:, :2] = grid.locations[single]
+        self.rects = np.concatenate((merged, singles))
+        self.tiles = np.concatenate(
+            (np.full(len(merged), EMPTY, dtype=np.int32), single.astype(np.int32))
+        )
+
+        self.cells = np.full(grid.cells.shape, EMPTY, dtype=np.int32)
+        for i, (row, column, rows, columns) in enumerate(self.rects.tolist()):
+            self.cells[row : row + rows, column : column + columns] = i
+        self.locations = self.rects[:, :2]
+
+    def remove(self, tiles):
+        raise TypeError("Merged grids are static")
+
+    def restore(self, tiles):
+        raise TypeError("Merged grids are static")
+
+    def in_rect(self, left, right, bottom, top):
+        return np.unique(super().in_rect(left, right, bottom, top))
+
+    def pairs(self, mins, maxs):
+        # A box over several cells of one rectangle finds it once per cell
+        i, j = super().pairs(mins, maxs)
+        if len(i) < 2:
+            return i, j
+        key = np.unique(i * len(self) + j)
+        return key // len(self), key % len(self)
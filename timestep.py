@@ -0,0 +1,50 @@
+"""
+Fixed timestep
+
+The simulation always moves in steps of the same length, however often
+frames are drawn. Time between frames goes into an accumulator, and each
+frame runs as many whole steps as it holds: several when drawing falls
+behind, none when it runs ahead. What is left over says how far between
+the last two steps the frame is drawn.
+"""
+
+# Steps per second. Every speed in the game is in pixels per step.
+SIMULATION_RATE = 60
+# Most steps run for one frame. If frames come slower than this allows the
+# game slows down, rather than spending ever longer catching up.
+MAX_STEPS_PER_FRAME = 5
+
+
+class FixedTimestep:
+    def __init__(self, rate=SIMULATION_RATE, max_steps=MAX_STEPS_PER_FRAME):
+        self.step = 1 / rate
+        self.max_steps = max_steps
+        # Seconds not yet simulated
+        self.accumulator = 0.0
+
+    def advance(self, delta_time):
+        """
+        Add the time since the last frame, and return how many steps to run
+        for this one.
+        """
+        self.accumulator += delta_time
+        steps = min(int(self.accumulator / self.step), self.max_steps)
+        self.accumulator -= steps * self.step
+        if steps == self.max_steps:
+            # Too far behind to catch up, so let the time go
+            self.accumulator = min(self.accumulator, self.step)
+        return steps
+
+    @property
+    def alpha(self):
+        """
+        How far from the previous step to the last one to draw, from 0 to 1.
+        """
+        return min(self.accumulator / self.step, 1.0)
+
+
+def blend(previous, current, alpha):
+    """
+    Return the point alpha of the way from previous to current.
+    """
+    return previous + (current - previous) * alpha